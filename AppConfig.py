@@ -0,0 +1,53 @@
+import os
+import yaml
+
+_configs = {} # 配置文件绝对路径 -> (mtime, config)
+_pools = {}   # redis 连接参数 -> ConnectionPool
+
+def load_config(config_file="config.yml"):
+    """
+    读取 YAML 配置，进程内按文件路径缓存，文件修改（mtime 变化）后才重新解析
+    返回的 dict 由所有调用方共享，不要修改
+    """
+    path = os.path.abspath(config_file)
+    mtime = os.path.getmtime(path)
+    cached = _configs.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as file:
+            cached = _configs[path] = (mtime, yaml.safe_load(file) or {})
+    return cached[1]
+
+def redis_client(config_file="config.yml"):
+    """
+    返回使用共享 ConnectionPool 的 redis.Redis
+    同一组连接参数在进程内只建立一个连接池，各组件拿到的客户端复用池中的 TCP 连接；
+    redis-py 的连接池在 fork 出的子进程中会自动重建，进程池 worker 可以直接调用
+    """
+    import redis
+    params = load_config(config_file).get("redis", {})
+    key = tuple(sorted(params.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = redis.ConnectionPool(**params)
+    return redis.Redis(connection_pool=pool)
+
+def get_many(client, keys):
+    """
+    一次往返读取多个 key，返回与 keys 顺序一致的列表，不存在的 key 为 None
+    """
+    keys = list(keys)
+    if not keys: return []
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.get(key)
+    return pipe.execute()
+
+def set_many(client, mapping):
+    """
+    一次往返写入多个 key: value
+    """
+    if not mapping: return []
+    pipe = client.pipeline(transaction=False)
+    for key, value in mapping.items():
+        pipe.set(key, value)
+    return pipe.execute()
@@ -5,73 +5,136 @@ if 'ipykernel' in sys.modules:
     nest_asyncio.apply()
     
 from TradeApp import TradeApp
-from ib_insync import *
 import pandas as pd
 import numpy as np
 import yaml
-import redis
 import pytz
-import matplotlib.pyplot as plt
 import os
 import zipfile
-from datetime import datetime, timedelta
+import time
+import copy
+import asyncio
+from collections import deque
+from datetime import timedelta
 
 # 解决get_historical_data中pd.read_json需要用
 from io import StringIO
-from utils import get_market_close_time
+from utils import get_market_close_time, get_market_open_time, to_ns
 
 from PositionManagerPlus import PositionManager
-from PlotPlus import PlotPlus
+from TickStore import TickStore
+from TickAggregator import time_bars
+from TickReplay import TickReplay
+from TradeReview import render_trade_charts, write_index
+from BacktestMetrics import MetricsAccumulator
+from AppConfig import load_config, redis_client, get_many
+from Checkpoint import CheckpointWriter, load_checkpoint
+
+class RequestPacer:
+    """
+    IB 历史数据请求限速
+    - 同时在途的请求不超过 max_concurrency
+    - 任意 window 秒内发出的请求不超过 max_requests（IB 规定同一合约 2 秒内不能有 6 个及以上的请求）
+    - 任意 long_window 秒内发出的请求不超过 long_max_requests（IB 规定 10 分钟内不能超过 60 个历史数据请求），
+      多日 tick 下载请求数很多，超过后会等待到最早的请求移出窗口
+    
+    e.g.
+    async with pacer:
+        ticks = await ib.reqHistoricalTicksAsync(...)
+    """
+    def __init__(self, max_concurrency=4, max_requests=5, window=2.0, long_max_requests=60, long_window=600.0):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # [(窗口秒数, 窗口内最多请求数, 窗口内请求的发出时间)]
+        self.limits = [(window, max_requests, deque()), (long_window, long_max_requests, deque())]
+        
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        while True:
+            now = time.monotonic()
+            wait = 0
+            for window, max_requests, sent in self.limits:
+                while sent and now - sent[0] >= window:
+                    sent.popleft()
+                if len(sent) >= max_requests:
+                    wait = max(wait, window - (now - sent[0]))
+            if wait <= 0: break
+            await asyncio.sleep(wait)
+        for _, _, sent in self.limits:
+            sent.append(now)
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+CHECKPOINT_EXCLUDE = {"_redis", "_base_attrs", "_request_pacer"} # 不随检查点保存的属性：连接等运行时对象
 
 class BacktestApp(TradeApp):  # 继承自 TradeApp 以便复用已有代码
     def __init__(self, config_file="config.yml", autoConnect=False, **kwargs):
         super().__init__(config_file=config_file, autoConnect=autoConnect, **kwargs)
         debug = kwargs.get('debug', False)  # 默认值 False
-        self.redis_client = self.get_redis(config_file)
+        self.config_file = config_file
+        self.params = kwargs.get('params', {}) # 策略参数，参数分析时由子类读取，也是 BacktestCache key 的一部分
         
         self.pm = PositionManager(None, self.__class__.__name__, debug=debug, config_file=config_file)
         self.last_price = {}
         self.initial_capital = self.pm.net_liquidation
         self.onBarUpdateEvent = [self.update_position_manager_net_liquidation, self.on_bar_update]
         self.afterMarketCloseEvent = [self._after_market_close]
+        if self.profiler:
+            self.afterMarketCloseEvent.append(self.profiler.report)
         self.daily_net_liquidation = []
+        self.bar_cache = None # 进程内 bar 缓存 {redis_key: DataFrame}，由 preload_bars 创建，多窗口/多参数回测共用
+        # 回测指标增量统计，运行中随时可通过 self.metrics.summary() 读取
+        self.metrics = MetricsAccumulator(self.initial_capital)
+        self.pm.logEvent.append(self.metrics.on_trade)
+        # 需要随检查点保存的策略状态（self 上的属性名）；None 表示自动保存子类（策略）在 BacktestApp 之外添加的全部属性，
+        # e.g. StrategyHost 的 instances / accounts、子类 __init__ 中创建的策略对象和参数
+        self.checkpoint_attrs = None
         
-        with open(config_file, "r", encoding="utf-8") as file:
-            self.offline_tick_root = yaml.safe_load(file)["offline_ticks_path"]
+        config = load_config(config_file)
+        self.offline_tick_root = config["offline_ticks_path"]
+        self.tick_store = TickStore(config.get("tick_store_path", "tick_store"))
             
         # debug params
         # minute debug
         self.minute_daily = None
         self.minute_idx = 0
+        self._base_attrs = set(vars(self)) | CHECKPOINT_EXCLUDE
         
+    @property
+    def redis_client(self):
+        # 首次读写 redis 时才创建连接，bar 全部命中 bar_cache 的回测进程不导入 redis
+        return self.get_redis(self.config_file)
+
     def get_redis(self, config_file):
         if not hasattr(self, '_redis'):
-            # 加载配置
-            with open(config_file, "r") as file:
-                config = yaml.safe_load(file)
-
-            redis_config = config.get("redis", {})
-            self._redis = redis.Redis(**redis_config)
+            self._redis = redis_client(config_file)
         return self._redis
 
     def get_historical_data(self, contract, date, durationStr='1 D', barSizeSetting='1 min'):
         date = get_market_close_time(date)
-        redis_key = f"{contract.symbol}_{date}_{durationStr}_{barSizeSetting}"
+        redis_key = self.historical_data_key(contract, date, durationStr, barSizeSetting)
+        if self.bar_cache is not None and redis_key in self.bar_cache:
+            return self.bar_cache[redis_key].copy()
+        
+        bars_df = self._load_historical_data(contract, date, redis_key, durationStr, barSizeSetting)
+        if self.bar_cache is not None and len(bars_df) > 0:
+            self.bar_cache[redis_key] = bars_df
+            return bars_df.copy()
+        return bars_df
+    
+    @staticmethod
+    def historical_data_key(contract, date, durationStr='1 D', barSizeSetting='1 min'):
+        """
+        bar 在 redis / bar_cache 中的 key
+        """
+        return f"{contract.symbol}_{get_market_close_time(date)}_{durationStr}_{barSizeSetting}"
+
+    def _load_historical_data(self, contract, date, redis_key, durationStr, barSizeSetting):
         cached_data = self.redis_client.get(redis_key)
         
         if cached_data is not None:
-            cached_data_str = cached_data.decode('utf-8')
-            bars_df = pd.read_json(StringIO(cached_data_str))
-            
-            # 如果 barSizeSetting 是 '1 day'，修改 date 格式为 datetime.date
-            if barSizeSetting.endswith('1 day'):
-                bars_df['date'] = pd.to_datetime(bars_df['date']).dt.date
-            # 如果是分钟线数据，进行时区转换
-            elif barSizeSetting.endswith('min'):
-                eastern = pytz.timezone('US/Eastern')
-                bars_df['date'] = pd.to_datetime(bars_df['date']).dt.tz_localize('UTC').dt.tz_convert(eastern)
-                
-            return bars_df
+            return self.parse_cached_bars(cached_data, barSizeSetting)
 
         # 如果缓存中没有数据，则请求 IBKR 数据
         bars = self.ib.reqHistoricalData(
@@ -91,6 +154,21 @@ class BacktestApp(TradeApp):  # 继承自 TradeApp 以便复用已有代码
             self.redis_client.set(redis_key, bars_df.to_json(orient='records'))
         return bars_df
 
+    @staticmethod
+    def parse_cached_bars(cached_data, barSizeSetting):
+        cached_data_str = cached_data.decode('utf-8')
+        bars_df = pd.read_json(StringIO(cached_data_str))
+        
+        # 如果 barSizeSetting 是 '1 day'，修改 date 格式为 datetime.date
+        if barSizeSetting.endswith('1 day'):
+            bars_df['date'] = pd.to_datetime(bars_df['date']).dt.date
+        # 如果是分钟线数据，进行时区转换
+        elif barSizeSetting.endswith('min'):
+            eastern = pytz.timezone('US/Eastern')
+            bars_df['date'] = pd.to_datetime(bars_df['date']).dt.tz_localize('UTC').dt.tz_convert(eastern)
+            
+        return bars_df
+
     def read_offline_tick(self, contract, date):
         """
         根据合约和日期，从离线数据缓存中只解压指定合约的 tick CSV 文件，并通过 pandas 读取。
@@ -138,95 +216,329 @@ class BacktestApp(TradeApp):  # 继承自 TradeApp 以便复用已有代码
                         (df['time'].dt.time <= pd.to_datetime('16:00').time())]
         return df
     
-    def get_historical_ticks(self, contract, date):
-        """
-        连续获取指定交易日内所有 tick 数据。
-        采用向后分页的策略：从交易结束时间开始，
-        每次调用 reqHistoricalTicks(endDateTime=current_end) 获取最多 1000 条数据，
-        并更新 current_end 为该批数据中的最早 tick 时间，
-        循环直至覆盖到交易开始时间。
-        """
-        eastern = pytz.timezone('US/Eastern')
-        # 定义交易开始和结束时间（美东时间）
-        trading_start = eastern.localize(datetime.strptime(f"{date} 09:30:00", "%Y-%m-%d %H:%M:%S"))
-        # trading_end = eastern.localize(datetime.strptime(f"{date} 16:00:00", "%Y-%m-%d %H:%M:%S"))
+    def get_request_pacer(self, max_concurrency=4):
+        """
+        整个 app 共用一个 RequestPacer，10 分钟的请求窗口跨多次调用、多个交易日累计，
+        每次下载新建 pacer 会让窗口从零开始，多日下载仍会超过 IB 的限制；max_concurrency 以第一次创建时为准
+        """
+        if not hasattr(self, '_request_pacer'):
+            self._request_pacer = RequestPacer(max_concurrency=max_concurrency)
+        return self._request_pacer
+    
+    def get_historical_ticks(self, contract, date, slice_minutes=30, max_concurrency=4):
+        """
+        获取指定交易日内所有 tick 数据，结果落盘到 TickStore，已下载完整的交易日直接从本地读取。
+        
+        下载策略：
+        将交易时段切成 slice_minutes 分钟的时间切片，切片之间并发请求（受 RequestPacer 限速），
+        切片内部从切片起点向后分页，每次 reqHistoricalTicks 最多 1000 条。
+        每个切片完成后立即写入 TickStore，断线后重新调用只会请求未完成的切片。
+        
+        返回：
+        DataFrame，列为 time(美东时间) / price / size，按时间升序
+        """
+        symbol = contract.symbol
+        if self.tick_store.has_day(symbol, date):
+            return self.tick_store.read(symbol, date)
+        
+        trading_start = get_market_open_time(date)
         trading_end = get_market_close_time(date)
-
-        all_ticks = []
-        # 从交易结束时间开始分页
-        current_end = trading_end
-
-        while current_end > trading_start:
-            # 调用 reqHistoricalTicks：只传 endDateTime（startDateTime 留空）
-            ticks = self.ib.reqHistoricalTicks(
-                contract,
-                "",  # startDateTime 为空
-                current_end,
-                1000,
-                whatToShow='TRADES',
-                useRth=True,
-                ignoreSize=False
-            )
-
-            # 将返回的 tick 数据转换为 DataFrame
-            partial_df = pd.DataFrame([{
-                'time': t.time.astimezone(eastern),
-                'price': t.price,
-                'size': t.size
-            } for t in ticks])
-            print(partial_df.iloc[0]["time"])
-            if partial_df.empty:
-                break
-
-            all_ticks.append(partial_df)
+        
+        # 切片以 UTC 纳秒作为 TickStore 中的标识
+        slices = []
+        slice_start = trading_start
+        while slice_start < trading_end:
+            slice_end = min(slice_start + timedelta(minutes=slice_minutes), trading_end)
+            slices.append((slice_start, slice_end))
+            slice_start = slice_end
+        
+        completed = self.tick_store.completed_slices(symbol, date)
+        pending = [(start, end) for start, end in slices if (to_ns(start), to_ns(end)) not in completed]
+        
+        if pending:
+            pacer = self.get_request_pacer(max_concurrency)
+            tasks = [self._download_tick_slice(contract, date, start, end, pacer) for start, end in pending]
+            results = self.ib.run(asyncio.gather(*tasks, return_exceptions=True))
+            # 已完成的切片都已落盘，只要有一个切片失败就不合并，下次调用时续传
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                raise errors[0]
+                
+        self.tick_store.finalize(symbol, date)
+        return self.tick_store.read(symbol, date)
+    
+    async def _download_tick_slice(self, contract, date, start, end, pacer):
+        """
+        下载单个时间切片 [start, end) 的 tick 并写入 TickStore
+        
+        向后分页时以上一页最后一个 tick 的时间作为下一页的 startDateTime，
+        IB 会再次返回该秒内的全部 tick，因此需要跳过该秒内已经收下的 tick 数量。
+        """
+        start_ns, end_ns = to_ns(start), to_ns(end)
+        times, prices, sizes = [], [], []
+        current = start
+        seen_at_current = 0 # 时间等于 current 且已收下的 tick 数
+        
+        while True:
+            async with pacer:
+                ticks = await self.ib.reqHistoricalTicksAsync(
+                    contract,
+                    current,
+                    "",  # endDateTime 为空，从 startDateTime 向后取
+                    1000,
+                    whatToShow='TRADES',
+                    useRth=True,
+                    ignoreSize=False
+                )
+            if not ticks: break
             
-            # 本批数据通常按降序排列，获取最早的 tick 时间
-            oldest_tick_time = partial_df['time'].min()
-
-            # 如果已经获取到的最早时间早于或等于交易开始，则退出循环
-            if oldest_tick_time <= trading_start:
-                break
-
-            # 更新 current_end 为最早 tick 的时间（下一次请求将获取更早的数据）
-            current_end = oldest_tick_time
-
-        if all_ticks:
-            # 合并所有分页数据，并按时间升序排序
-            ticks_df = pd.concat(all_ticks).reset_index(drop=True)
-            ticks_df.sort_values(by='time', inplace=True)
-            # 保留交易日内的数据
-            ticks_df = ticks_df[ticks_df['time'] >= trading_start]
-            return ticks_df
-        else:
-            return pd.DataFrame()
+            page_times = np.array([int(t.time.timestamp()) * 1_000_000_000 for t in ticks], dtype=np.int64)
+            page_prices = np.array([t.price for t in ticks], dtype=np.float64)
+            page_sizes = np.array([t.size for t in ticks], dtype=np.float64)
+            
+            # 去掉分页边界上重复返回的 tick
+            skip = min(seen_at_current, int((page_times == to_ns(current)).sum()))
+            in_slice = page_times[skip:] < end_ns
+            times.append(page_times[skip:][in_slice])
+            prices.append(page_prices[skip:][in_slice])
+            sizes.append(page_sizes[skip:][in_slice])
+            
+            last_ns = page_times[-1]
+            if last_ns >= end_ns or len(ticks) < 1000: break
+            
+            if skip == len(ticks):
+                # 整页都是已收下的同一秒 tick，从下一秒继续
+                current = current + timedelta(seconds=1)
+                seen_at_current = 0
+            else:
+                # IB 会返回 last_ns 这一秒内的全部 tick，下一页需要全部跳过
+                current = pd.Timestamp(last_ns, tz='UTC').to_pydatetime()
+                seen_at_current = int((page_times == last_ns).sum())
+        
+        tick_time = np.concatenate(times) if times else np.array([], dtype=np.int64)
+        price = np.concatenate(prices) if prices else np.array([], dtype=np.float64)
+        size = np.concatenate(sizes) if sizes else np.array([], dtype=np.float64)
+        self.tick_store.write_slice(contract.symbol, date, start_ns, end_ns, tick_time, price, size)
+    
+    def get_tick_bars(self, contract, date, bar_size='1 min'):
+        """
+        由 TickStore 中的 tick 聚合出任意周期的 bar，格式与 get_historical_data 的分钟线一致
+        
+        参数：
+        bar_size: IB 风格周期，例如 '5 secs' / '1 min' / '3 mins'
+        """
+        ticks = self.get_historical_ticks(contract, date)
+        return time_bars(ticks, bar_size, anchor=get_market_open_time(date))
+    
+    def minutes_backtest(self, end_date, durationStr='100 D', pre_process_bar_callback=None, barSizeSetting='1 min', from_ticks=False,
+                         checkpoint_dir=None, resume_from=None, checkpoint_keep=None, cache=None):
+        """
+        参数：
+        barSizeSetting: 回测所用 bar 的周期
+        from_ticks: 为 True 时由 TickStore 中的 tick 聚合 bar（支持秒级周期），否则使用 IB 的历史 bar
+        checkpoint_dir: 每个交易日收盘后（afterMarketCloseEvent）把状态写入该目录，写入在后台线程进行
+        resume_from: 检查点文件或目录（取最新的一个），恢复状态后跳过检查点之前已完成的交易日
+        checkpoint_keep: 只保留最近的若干个检查点
+        cache: BacktestCache，代码、参数、数据都没有变化时直接恢复之前的回测结果（从检查点恢复时不使用）
+        """
+        cache_key = None
+        if cache is not None and resume_from is None:
+            cache_key = cache.key(self, end_date, durationStr, pre_process_bar_callback, barSizeSetting, from_ticks)
+            state = cache.get(cache_key, refs=self.checkpoint_refs())
+            if state is not None:
+                self.restore_state(state)
+                return
+        
+        daily = self.get_backtest_calendar(end_date, durationStr)
+        completed = None
+        if resume_from is not None:
+            state = load_checkpoint(resume_from, refs=self.checkpoint_refs())
+            self.restore_state(state)
+            completed = state["date"]
+        
+        writer = CheckpointWriter(checkpoint_dir, keep=checkpoint_keep, refs=self.checkpoint_refs()) if checkpoint_dir else None
+        checkpoint = lambda date: writer.submit(date, self.snapshot_state(date))
+        if writer:
+            self.afterMarketCloseEvent.append(checkpoint)
+        try:
+            for index, row in daily.iterrows():
+                if completed is not None and get_market_close_time(row["date"]) <= completed: continue
+                self.backtest_day(row["date"], pre_process_bar_callback, barSizeSetting, from_ticks)
+        finally:
+            if writer:
+                self.afterMarketCloseEvent.remove(checkpoint)
+                writer.close()
+        if cache_key is not None:
+            cache.put(cache_key, self.snapshot_state(), refs=self.checkpoint_refs())
+    
+    def strategy_attrs(self):
+        """
+        随检查点保存的策略状态属性名，checkpoint_attrs 为 None 时取子类在 BacktestApp.__init__ 之外添加的属性
+        """
+        if self.checkpoint_attrs is not None:
+            return list(self.checkpoint_attrs)
+        return [name for name in vars(self) if name not in self._base_attrs]
+    
+    def checkpoint_refs(self):
+        """
+        策略对象常引用 app / pm / ib，这些对象在检查点中只记名字，恢复时指回当前进程中的对象，不会复制出第二个 PositionManager
+        """
+        refs = {"app": self, "pm": self.pm, "ib": self.ib, "metrics": self.metrics}
+        return {name: obj for name, obj in refs.items() if obj is not None}
+    
+    def snapshot_state(self, date=None):
+        """
+        回测状态的快照，在主线程调用，只做必要的拷贝，序列化交给 CheckpointWriter 的后台线程
+        - trade_log / daily_net_liquidation 只追加不修改，引用已写入的部分
+        - positions、下单中的 trades、策略状态等会原地修改的对象一起深拷贝（保持相互引用），
+          其中对 app / pm / ib 的引用保持为引用（见 checkpoint_refs）
+        """
+        pm = self.pm
+        memo = {id(obj): obj for obj in self.checkpoint_refs().values()}
+        mutable = copy.deepcopy({
+            "positions": pm.positions,
+            "trades": pm.trades,
+            "attrs": {name: getattr(self, name) for name in self.strategy_attrs()},
+        }, memo)
+        return {
+            "date": date,
+            "positions": mutable["positions"],
+            "trade_log": pm.trade_log.snapshot(),
+            "trades": mutable["trades"],
+            "net_liquidation": pm.net_liquidation,
+            "available_funds": pm.available_funds,
+            "daily_net_liquidation": list(self.daily_net_liquidation),
+            "last_price": dict(self.last_price),
+            "metrics": dict(vars(self.metrics)),
+            "attrs": mutable["attrs"],
+        }
     
-    def minutes_backtest(self, end_date, durationStr='100 D', pre_process_bar_callback=None):
+    def restore_state(self, state):
+        """
+        由 snapshot_state 的结果（或 load_checkpoint 读出的检查点）恢复回测状态
+        """
+        pm = self.pm
+        pm.positions = state["positions"]
+        pm.trade_log = state["trade_log"]
+        pm.trades = state["trades"]
+        pm.track_orders()
+        pm.net_liquidation = state["net_liquidation"]
+        pm.available_funds = state["available_funds"]
+        self.daily_net_liquidation = state["daily_net_liquidation"]
+        self.last_price = state["last_price"]
+        # metrics.on_trade 已挂在 pm.logEvent 上，原地更新而不替换对象
+        vars(self.metrics).update(state["metrics"])
+        for name, value in state["attrs"].items():
+            setattr(self, name, value)
+    
+    def preload_bars(self, end_date, durationStr='100 D', barSizeSetting='1 min'):
+        """
+        一次性把回测区间内所有合约的日线和分钟线读入 self.bar_cache 并返回
+        返回的 dict 可以赋给其他 app 的 bar_cache（或作为进程池 initializer 的参数），重叠窗口不重复读取 redis
+        """
+        if self.bar_cache is None:
+            self.bar_cache = {}
+        daily = self.get_backtest_calendar(end_date, durationStr)
+        requests = [(contract, row["date"]) for _, row in daily.iterrows() for contract in self.contracts]
+        # redis 中已有的分钟线用 pipeline 一次读回，其余再逐个走 get_historical_data（请求 IB 并写回 redis）
+        keys = [self.historical_data_key(contract, date, barSizeSetting=barSizeSetting) for contract, date in requests]
+        missing = [(request, key) for request, key in zip(requests, keys) if key not in self.bar_cache]
+        for ((contract, date), key), cached_data in zip(missing, get_many(self.redis_client, [key for _, key in missing])):
+            if cached_data is not None:
+                self.bar_cache[key] = self.parse_cached_bars(cached_data, barSizeSetting)
+        for contract, date in requests:
+            self.get_historical_data(contract, date, barSizeSetting=barSizeSetting)
+        return self.bar_cache
+    
+    def get_backtest_calendar(self, end_date, durationStr='100 D'):
+        """
+        回测区间内的交易日（日线），同时记录到 self.minute_daily
+        """
         daily = self.get_historical_data(self.contracts[0], end_date, durationStr, '1 day')
         self.minute_daily = daily.copy()
+        return daily
+    
+    def backtest_day(self, date, pre_process_bar_callback=None, barSizeSetting='1 min', from_ticks=False):
+        """
+        回测单个交易日，策略和 PositionManager 的状态延续之前的交易日
+        可以按日期分段调用，中途暂停后继续
+        """
+        today = get_market_close_time(date)
         minutes = {}
-        for index, row in daily.iterrows():
+        for contract in self.contracts:
+            if from_ticks:
+                minutes[contract.symbol] = self.get_tick_bars(contract, today, barSizeSetting)
+            else:
+                minutes[contract.symbol] = self.get_historical_data(contract, today, barSizeSetting=barSizeSetting)
+            if pre_process_bar_callback:
+                minutes[contract.symbol] = pre_process_bar_callback(minutes[contract.symbol])
+                
+        idx = 1
+        while idx < len(minutes[contract.symbol]):
             for contract in self.contracts:
+                bars = minutes[contract.symbol][:idx]
+                self.dispatch_bar_update(contract, bars, True)
+            idx += 1
+                
+        for callback in self.afterMarketCloseEvent:
+            callback(today)
+                
+    def ticks_backtest(self, end_date, durationStr='100 D', barSizeSetting='1 min', update_interval='5 secs'):
+        """
+        tick 回放回测
+        
+        由 TickStore 中的 tick 驱动 onBarUpdateEvent，节奏与实盘 keepUpToDate 一致：
+        每 update_interval 推送一次 bars（已完成 bar + 进行中 bar），新 bar 的第一次推送 has_new_bar 为 True。
+        多个合约的更新按时间先后交错推送。
+        
+        回放期间 PositionManager 处于 replay 模式：限价单挂单，由之后到达的第一笔满足条件的 tick 成交；
+        市价单按推送时进行中 bar 的 close（即最新一笔 tick）成交。
+        """
+        daily = self.get_historical_data(self.contracts[0], end_date, durationStr, '1 day')
+        self.minute_daily = daily.copy()
+        self.pm.replay = True
+        try:
+            for index, row in daily.iterrows():
                 today = get_market_close_time(row["date"])
-                minutes[contract.symbol] = self.get_historical_data(contract, today) # 默认barSize 1 min
-                if pre_process_bar_callback:
-                    minutes[contract.symbol] = pre_process_bar_callback(minutes[contract.symbol])
-                    
-            idx = 1
-            while idx < len(minutes[contract.symbol]):
-                for contract in self.contracts:
-                    bars = minutes[contract.symbol][:idx]
-                    for callback in self.onBarUpdateEvent:
-                        callback(contract, bars, True)
-                idx += 1
-                    
-            for callback in self.afterMarketCloseEvent:
-                callback(today)
+                replays = [
+                    TickReplay(self.get_historical_ticks(contract, today), barSizeSetting, update_interval, anchor=get_market_open_time(today))
+                    for contract in self.contracts
+                ]
+                
+                # 所有合约的更新按时间排序，时间相同的按合约顺序
+                update_time = np.concatenate([replay.segment_time_ns for replay in replays])
+                update_contract = np.concatenate([np.full(len(replay), i) for i, replay in enumerate(replays)])
+                update_k = np.concatenate([np.arange(len(replay)) for replay in replays])
+                order = np.lexsort((update_contract, update_time))
+                
+                for i, k in zip(update_contract[order], update_k[order]):
+                    contract, replay = self.contracts[i], replays[i]
+                    # 先用这段新到的 tick 撮合之前的挂单，再推送给策略
+                    if self.pm.pending_orders:
+                        self.pm.match_pending_orders(contract, *replay.segment_ticks(k))
+                    bars, has_new_bar = replay.bars(k)
+                    self.dispatch_bar_update(contract, bars, has_new_bar)
                 
+                # 挂单只在当日有效
+                self.pm.cancel_pending_orders()
+                for callback in self.afterMarketCloseEvent:
+                    callback(today)
+        finally:
+            self.pm.replay = False
+    
+    def dispatch_bar_update(self, contract, bars, has_new_bar):
+        if self.profiler:
+            self.profiler.dispatch(self.onBarUpdateEvent, contract, bars, has_new_bar)
+            return
+        for callback in self.onBarUpdateEvent:
+            callback(contract, bars, has_new_bar)
+    
     def _after_market_close(self, date):
         self.daily_net_liquidation.append({
             "date": date,
             "net_liquidation": self.pm.net_liquidation
         })
+        self.metrics.on_day_close(date, self.pm.net_liquidation)
         
     def update_position_manager_net_liquidation(self, contract, bars, has_new_bar):
         if len(self.pm.positions) == 0 or not self.pm.debug: return # 测试情况下且position不为空才更新
@@ -301,78 +613,19 @@ class BacktestApp(TradeApp):  # 继承自 TradeApp 以便复用已有代码
         计算交易日志的区间累计收益、最大回撤、波动率、夏普比率和每日超额收益。
 
         参数:
-            risk_free_rate (float): 无风险利率，默认为0。
+            risk_free_rate (float): 无风险利率，默认为0.035。
 
         返回:
             dict: {'cumulative_pnl': float, 'max_drawdown': float, 'sharpe_ratio': float, 'volatility': float, 'daily_return': float, 'commission': float}
         """
-        # 如果没有每日净资产数据，返回零
-        if not self.daily_net_liquidation:
-            return {
-                "cumulative_pnl": 0,
-                "max_drawdown": 0,
-                "volatility": 0,
-                "sharpe_ratio": 0,
-                "daily_return": 0,
-                "commission": 0
-            }
-
-        # 将 daily_net_liquidation 转换为 DataFrame
-        df = pd.DataFrame(self.daily_net_liquidation)
-        df["date"] = pd.to_datetime(df["date"]).dt.date
-
-        # 计算每日收益率
-        df["daily_return"] = df["net_liquidation"].pct_change()
-
-        # 计算累计收益（这里直接使用最后的 net_liquidation 减去初始资本）
-        cumulative_pnl = df["net_liquidation"].iloc[-1] - self.initial_capital
-
-        # 计算最大回撤
-        df["rolling_max"] = df["net_liquidation"].cummax()
-        df["drawdown"] = (df["rolling_max"] - df["net_liquidation"]) / df["rolling_max"]
-        max_drawdown = df["drawdown"].max()  # 最大回撤
-
-        # 计算波动率（每日收益率的标准差）
-        daily_volatility = df["daily_return"].std() * np.sqrt(252)  # 年化波动率
-
-        # 计算平均每日超额收益
-        avg_daily_return = df["daily_return"].mean()
-
-        # 计算年化夏普比率
-        if daily_volatility == 0:
-            sharpe_ratio = None  # 如果波动率为0，夏普比率无法计算
-        else:
-            annualized_return = avg_daily_return * 252  # 假设252个交易日
-            sharpe_ratio = (annualized_return - risk_free_rate) / daily_volatility
-            
-        # 统计胜率和盈亏比，只统计平仓记录
-        trade_log = pd.DataFrame(self.pm.trade_log)
-        closed_trades = trade_log[trade_log['open_or_close'] == '平仓']
-        win_count = (closed_trades['pnl'] > 0).sum()
-        loss_count = (closed_trades['pnl'] < 0).sum()
-        profit_sum = closed_trades.loc[closed_trades['pnl'] > 0, 'pnl'].sum()
-        loss_sum = closed_trades.loc[closed_trades['pnl'] < 0, 'pnl'].abs().sum()
-        total_trades = win_count + loss_count
-        win_rate = win_count / total_trades if total_trades > 0 else 0
-        avg_profit = profit_sum / win_count if win_count > 0 else 0
-        avg_loss = loss_sum / loss_count if loss_count > 0 else 0
-        profit_loss_ratio = avg_profit / avg_loss if avg_loss > 0 else 0
-        
-        return {
-            "cumulative_pnl": cumulative_pnl,  # 最终累计收益
-            "max_drawdown": max_drawdown if pd.notna(max_drawdown) else 0,  # 最大回撤
-            "sharpe_ratio": sharpe_ratio,  # 夏普比率
-            "volatility": daily_volatility,  # 波动率
-            "daily_return": avg_daily_return, # 平均每日超额收益
-            "commission": pd.DataFrame(self.pm.trade_log)["commission"].sum(), # 手续费
-            "win_rate": win_rate,  # 胜率
-            "profit_loss_ratio": profit_loss_ratio,  # 盈亏比
-        }
+        # 指标在 _after_market_close 和 PositionManager.log 中增量累计，这里直接读取
+        return self.metrics.summary(risk_free_rate)
         
     def plot_pnl(self):
         """
         绘制累计盈亏曲线，基于初始资金进行计算。
         """
+        import matplotlib.pyplot as plt
         # 初始化 DataFrame
         df = pd.DataFrame(self.daily_net_liquidation)
 
@@ -391,8 +644,8 @@ class BacktestApp(TradeApp):  # 继承自 TradeApp 以便复用已有代码
     def plot_chan_daily_trade(self, skip_not_trade=True):
         while self.minute_idx < len(self.minute_daily):
             date = self.minute_daily.iloc[self.minute_idx]['date']
-            trade_log = pd.DataFrame(self.pm.trade_log)
-            trade_log['datetime_str'] = pd.to_datetime(trade_log['date']).dt.strftime('%Y/%m/%d %H:%M')
+            trade_log = self.pm.trade_log.to_frame()
+            trade_log['datetime_str'] = trade_log['date'].dt.strftime('%Y/%m/%d %H:%M')
             has_trade = not trade_log[trade_log['date'].dt.date == date].empty
             self.minute_idx += 1
             if has_trade and skip_not_trade:
@@ -415,7 +668,7 @@ class BacktestApp(TradeApp):  # 继承自 TradeApp 以便复用已有代码
                     autype=AUTYPE.QFQ,
                 )
                 
-                grouped = trade_log.groupby(['datetime_str', 'direction'], as_index=False).agg({ 'amount': 'sum' })
+                grouped = trade_log.groupby(['datetime_str', 'direction'], as_index=False, observed=True).agg({ 'amount': 'sum' })
                 direction_map = {'BUY': 'up', 'SELL': 'down'}
                 grouped['mapped_direction'] = grouped['direction'].map(direction_map)
                 direction_color_map = {'BUY': 'green', 'SELL': 'red'}
@@ -429,10 +682,45 @@ class BacktestApp(TradeApp):  # 继承自 TradeApp 以便复用已有代码
                 plot_driver.figure.show()
                 break
 
+    def render_daily_trades(self, output_dir="trade_review", fmt="png", max_workers=None):
+        """
+        批量渲染所有有交易的 (交易日, 合约) 图表并生成 index.html
+        交易记录只分组一次，行情在主进程读取（依赖 Redis/IB），出图在进程池中以 Agg 后端完成
+        
+        参数：
+        fmt: png 或 svg
+        
+        返回：
+        index.html 的路径
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        trade_log = self.pm.trade_log.to_frame()
+        if trade_log.empty:
+            return write_index(output_dir, [])
+        
+        trade_log['day'] = trade_log['date'].dt.date
+        contracts = {contract.symbol: contract for contract in self.contracts}
+        tasks, rows = [], []
+        for (day, symbol), trades in trade_log.groupby(['day', 'symbol'], sort=True, observed=True):
+            file = f"{day.strftime('%Y%m%d')}_{symbol}.{fmt}"
+            pnl = trades['pnl'].fillna(0).sum()
+            commission = trades['commission'].sum()
+            tasks.append({
+                "bars": self.get_historical_data(contracts[symbol], day),
+                "trades": trades.drop(columns=['day']),
+                "path": os.path.join(output_dir, file),
+                "title": f"{day} {symbol} pnl: {pnl:.2f} commission: {commission:.2f}",
+            })
+            rows.append({"date": day, "symbol": symbol, "pnl": pnl, "commission": commission, "file": file})
+        
+        render_trade_charts(tasks, max_workers=max_workers)
+        return write_index(output_dir, rows)
+    
     def plot_daily_trade(self):
+        from PlotPlus import PlotPlus
         while True:
             date = self.minute_daily.iloc[self.minute_idx]['date']
-            trade_log = pd.DataFrame(self.pm.trade_log)
+            trade_log = self.pm.trade_log.to_frame()
             has_trade = not trade_log[trade_log['date'].dt.date == date].empty
             self.minute_idx += 1
             if has_trade:
@@ -0,0 +1,222 @@
+import os
+import ast
+import sys
+import json
+import types
+import inspect
+import textwrap
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from AppConfig import load_config
+from Checkpoint import dump_checkpoint, load_checkpoint
+from utils import get_market_close_time
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_SUFFIX = ".result"
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return str(value)
+    if hasattr(value, "config"): # CommonTradeConfig
+        return value.config
+    # repr 可能带内存地址，每次运行都不同，缓存永远不会命中
+    raise TypeError(f"无法生成缓存 key：不支持的类型 {type(value).__name__}")
+
+def stable_json(value):
+    """
+    参数 / 配置的规范化 JSON：key 排序，numpy 标量转成 Python 标量，np.arange 生成的参数与手写的数值一致
+    """
+    return json.dumps(value, sort_keys=True, default=_json_default, ensure_ascii=False)
+
+def object_source(obj):
+    """
+    类 / 函数的源码，Jupyter 中定义的对象同样可以取到；取不到时退回到限定名
+    """
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', repr(obj))}"
+
+def repo_module_path(name):
+    """
+    本仓库中的模块返回源文件路径，否则返回 None
+    """
+    path = os.path.join(REPO_ROOT, f"{name.split('.')[0]}.py")
+    return path if os.path.isfile(path) else None
+
+def imported_modules(tree):
+    """
+    语法树中 import / from ... import 的顶层模块名
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    return names
+
+def referenced_modules(obj):
+    """
+    obj 所在模块不是本仓库的文件（如 Jupyter 中定义）时，由 obj 源码中的 import 和用到的全局名字找到它依赖的本仓库模块
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(obj)))
+    except (OSError, TypeError, SyntaxError):
+        return set()
+    module = sys.modules.get(getattr(obj, "__module__", None))
+    namespace = vars(module) if module is not None else {}
+    targets = imported_modules(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in namespace:
+            value = namespace[node.id]
+            targets.add(value.__name__ if isinstance(value, types.ModuleType) else getattr(value, "__module__", None))
+    return {target.split('.')[0] for target in targets if target and repo_module_path(target)}
+
+class BacktestCache:
+    """
+    回测结果的内容寻址缓存
+
+    key 为以下内容的 sha256，任何一项变化都会得到新的 key，旧结果自然失效：
+    - 策略代码：app 类继承链上 BacktestApp 之前各个类的源码，以及这些类所在模块传递 import 的本仓库模块的源文件
+      （策略逻辑通常在 StructureReserve 等模块中，修改后同样失效；只 import 进来、策略用不到的模块如 PlotPlus 不计入）
+      也可以通过 modules 显式指定计入的模块
+    - 参数：app.params（CommonTradeConfig 等）、配置文件内容、pre_process_bar_callback 的源码
+    - 合约列表、回测区间（end_date / durationStr / barSizeSetting）
+    - bar 指纹：回测用到的日线和每个 (合约, 交易日) 分钟线的内容哈希
+    - 起始状态：回测开始前已有的净资产、交易记录条数，分段回测时不会与从头回测混用
+
+    缓存的内容是回测结束时的 BacktestApp.snapshot_state()（trade_log、daily_net_liquidation、指标等），
+    命中时直接 restore_state，statistic() / daily_net_liquidation / pm.trade_log 与重新回测一致。
+
+    e.g.
+    cache = BacktestCache("backtest_cache")
+    ba.minutes_backtest("20250221", "200 D", pre_process_bar_callback=pre_process_bar_callback, cache=cache)
+    """
+    def __init__(self, directory="backtest_cache", modules=None):
+        """
+        Args:
+            modules: 计入 key 的本仓库模块名，如 ["StructureReserve", "utils"]；None 表示从策略类自动推断
+        """
+        self.directory = directory
+        self.modules = modules
+        self.hits = 0
+        self.misses = 0
+        self.file_digests = {}  # 源文件路径 -> (mtime, sha256)
+        self.bar_digests = {}   # bar_cache key -> (DataFrame, sha256)，同一个 DataFrame 只计算一次
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}{CACHE_SUFFIX}")
+
+    # ---------------------------------------------------------------- 指纹
+
+    def file_digest(self, path):
+        mtime = os.path.getmtime(path)
+        cached = self.file_digests.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as f:
+                cached = self.file_digests[path] = (mtime, hashlib.sha256(f.read()).hexdigest())
+        return cached[1]
+
+    def dependencies(self, objects):
+        """
+        objects 所在的本仓库模块，以及它们传递 import 的本仓库模块，按 import 语句静态解析，与运行时已加载哪些模块无关
+        """
+        pending = set()
+        for obj in objects:
+            name = getattr(obj, "__module__", None)
+            if name and repo_module_path(name):
+                pending.add(name.split('.')[0])
+            else:
+                pending |= referenced_modules(obj)
+        modules = set()
+        while pending:
+            name = pending.pop()
+            if name in modules: continue
+            modules.add(name)
+            with open(repo_module_path(name), encoding="utf-8") as f:
+                pending |= {imported for imported in imported_modules(ast.parse(f.read())) if repo_module_path(imported)}
+        return modules
+
+    def code_fingerprint(self, app, pre_process_bar_callback=None):
+        from BacktestApp import BacktestApp
+        objects = []
+        for cls in type(app).__mro__:
+            if cls is BacktestApp: break
+            objects.append(cls)
+        if pre_process_bar_callback is not None:
+            objects.append(pre_process_bar_callback)
+        parts = [object_source(obj) for obj in objects]
+        if self.modules is not None:
+            modules = {name for name in self.modules if repo_module_path(name)}
+            missing = set(self.modules) - modules
+            if missing:
+                raise ValueError(f"不是本仓库的模块：{sorted(missing)}")
+        else:
+            modules = self.dependencies(objects)
+        parts.extend(f"{name}:{self.file_digest(repo_module_path(name))}" for name in sorted(modules))
+        return parts
+
+    def frame_digest(self, key, df):
+        cached = self.bar_digests.get(key)
+        if cached is None or cached[0] is not df:
+            digest = hashlib.sha256()
+            digest.update(stable_json([list(df.columns), [str(dtype) for dtype in df.dtypes]]).encode())
+            digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+            cached = self.bar_digests[key] = (df, digest.hexdigest())
+        return cached[1]
+
+    def bar_fingerprint(self, app, end_date, durationStr, barSizeSetting, from_ticks):
+        """
+        回测用到的 bar 的内容哈希；bar 通过 preload_bars 读入 app.bar_cache，随后的回测直接复用
+        from_ticks 时分钟线由 TickStore 现场聚合，只计入交易日历
+        """
+        if not from_ticks:
+            app.preload_bars(end_date, durationStr, barSizeSetting)
+        daily = app.get_backtest_calendar(end_date, durationStr)
+        keys = [app.historical_data_key(app.contracts[0], end_date, durationStr, '1 day')]
+        if not from_ticks:
+            keys += [app.historical_data_key(contract, get_market_close_time(date), barSizeSetting=barSizeSetting)
+                     for date in daily["date"] for contract in app.contracts]
+        return [f"{key}:{self.frame_digest(key, app.bar_cache[key])}" for key in keys if app.bar_cache and key in app.bar_cache]
+
+    def key(self, app, end_date, durationStr='100 D', pre_process_bar_callback=None, barSizeSetting='1 min', from_ticks=False):
+        payload = {
+            "code": self.code_fingerprint(app, pre_process_bar_callback),
+            "params": getattr(app, "params", None),
+            "config": load_config(app.config_file),
+            "symbols": [contract.symbol for contract in app.contracts],
+            "range": [str(end_date), durationStr, barSizeSetting, from_ticks],
+            "bars": self.bar_fingerprint(app, end_date, durationStr, barSizeSetting, from_ticks),
+            "start": [app.pm.net_liquidation, app.pm.available_funds, len(app.pm.trade_log), len(app.daily_net_liquidation)],
+        }
+        return hashlib.sha256(stable_json(payload).encode()).hexdigest()
+
+    # ---------------------------------------------------------------- 读写
+
+    def get(self, key, refs=None):
+        """
+        refs: 见 BacktestApp.checkpoint_refs
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return load_checkpoint(path, refs)
+
+    def put(self, key, state, refs=None):
+        return dump_checkpoint(self.path(key), state, refs=refs)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                os.remove(os.path.join(self.directory, name))
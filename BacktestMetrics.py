@@ -0,0 +1,104 @@
+import math
+
+TRADING_DAYS = 252
+
+class MetricsAccumulator:
+    """
+    回测指标的增量统计，运行过程中随时可读取，不需要在回测结束后重建 DataFrame
+
+    - on_trade: 挂在 PositionManager.logEvent 上，每条交易记录调用一次
+    - on_day_close: 每个交易日收盘后以当日净资产调用一次
+
+    日收益率的均值/方差使用 Welford 算法在线更新，
+    最大回撤、胜负次数及盈亏合计、手续费合计都是 O(1) 累加。
+    summary() 的输出与 BacktestApp.statistic 一致。
+    """
+    def __init__(self, initial_capital):
+        self.initial_capital = initial_capital
+        self.reset()
+
+    def reset(self):
+        # 净资产
+        self.last_net_liquidation = None
+        self.peak = None
+        self.max_drawdown = 0
+        # 日收益率（Welford）
+        self.return_count = 0
+        self.return_mean = 0.0
+        self.return_m2 = 0.0
+        # 交易
+        self.commission = 0.0
+        self.win_count = 0
+        self.loss_count = 0
+        self.profit_sum = 0.0
+        self.loss_sum = 0.0
+
+    def on_trade(self, record):
+        """
+        record 为 PositionManager.log 写入 trade_log 的一条记录
+        """
+        self.commission += record["commission"]
+        # 胜率和盈亏比只统计平仓记录
+        if record["open_or_close"] != "平仓" or record["pnl"] is None: return
+        pnl = record["pnl"]
+        if pnl > 0:
+            self.win_count += 1
+            self.profit_sum += pnl
+        elif pnl < 0:
+            self.loss_count += 1
+            self.loss_sum += -pnl
+
+    def on_day_close(self, date, net_liquidation):
+        if self.last_net_liquidation is not None:
+            daily_return = net_liquidation / self.last_net_liquidation - 1
+            self.return_count += 1
+            delta = daily_return - self.return_mean
+            self.return_mean += delta / self.return_count
+            self.return_m2 += delta * (daily_return - self.return_mean)
+        self.last_net_liquidation = net_liquidation
+
+        self.peak = net_liquidation if self.peak is None else max(self.peak, net_liquidation)
+        drawdown = (self.peak - net_liquidation) / self.peak
+        self.max_drawdown = max(self.max_drawdown, drawdown)
+
+    @property
+    def avg_daily_return(self):
+        return self.return_mean if self.return_count > 0 else math.nan
+
+    @property
+    def volatility(self):
+        """
+        年化波动率（日收益率样本标准差 * sqrt(252)）
+        """
+        if self.return_count < 2: return math.nan
+        return math.sqrt(self.return_m2 / (self.return_count - 1)) * math.sqrt(TRADING_DAYS)
+
+    def sharpe_ratio(self, risk_free_rate=0.035):
+        volatility = self.volatility
+        if volatility == 0: return None # 如果波动率为0，夏普比率无法计算
+        return (self.avg_daily_return * TRADING_DAYS - risk_free_rate) / volatility
+
+    def summary(self, risk_free_rate=0.035):
+        if self.last_net_liquidation is None:
+            return {
+                "cumulative_pnl": 0,
+                "max_drawdown": 0,
+                "volatility": 0,
+                "sharpe_ratio": 0,
+                "daily_return": 0,
+                "commission": 0
+            }
+
+        total_trades = self.win_count + self.loss_count
+        avg_profit = self.profit_sum / self.win_count if self.win_count > 0 else 0
+        avg_loss = self.loss_sum / self.loss_count if self.loss_count > 0 else 0
+        return {
+            "cumulative_pnl": self.last_net_liquidation - self.initial_capital,  # 最终累计收益
+            "max_drawdown": self.max_drawdown,  # 最大回撤
+            "sharpe_ratio": self.sharpe_ratio(risk_free_rate),  # 夏普比率
+            "volatility": self.volatility,  # 波动率
+            "daily_return": self.avg_daily_return, # 平均每日超额收益
+            "commission": self.commission, # 手续费
+            "win_rate": self.win_count / total_trades if total_trades > 0 else 0,  # 胜率
+            "profit_loss_ratio": avg_profit / avg_loss if avg_loss > 0 else 0,  # 盈亏比
+        }
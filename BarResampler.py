@@ -0,0 +1,168 @@
+import pandas as pd
+
+from utils import get_market_open_time
+from TickAggregator import BAR_COLUMNS, parse_bar_size
+
+def source_rows(bars, start):
+    """
+    从第 start 根开始依次返回 (date, open, high, low, close, volume, average, barCount)
+    bars 可以是 BarDataList / list of BarData，也可以是回测中逐根增长的 DataFrame
+    """
+    if isinstance(bars, pd.DataFrame):
+        part = bars.iloc[start:]
+        close = part['close'].to_numpy()
+        average = part['average'].to_numpy() if 'average' in part.columns else close
+        bar_count = part['barCount'].to_numpy() if 'barCount' in part.columns else [0] * len(part)
+        return zip(part['date'], part['open'].to_numpy(), part['high'].to_numpy(), part['low'].to_numpy(), close,
+                   part['volume'].to_numpy(), average, bar_count)
+    return ((bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume, bar.average, bar.barCount) for bar in bars[start:])
+
+class ResampledBars:
+    """
+    单个合约、单个周期的高周期 bar，随 1 分钟 bar 增量更新
+
+    - bar 以当日开盘 09:30 为起点按周期对齐，与 TickAggregator.time_bars 一致
+    - 每次更新只从最后一根高周期 bar 的第一根分钟线开始重新聚合：
+      进行中的分钟线被修正（has_new_bar=False）时，最后一根高周期 bar 随之修正；
+      新分钟线落入下一个周期时追加新 bar
+    """
+    def __init__(self, bar_size):
+        self.bar_size = bar_size
+        self.interval = parse_bar_size(bar_size)
+        self.anchors = {} # 交易日 -> 当日开盘时间（UTC 纳秒）
+        self.reset()
+
+    def reset(self):
+        self.columns = {column: [] for column in BAR_COLUMNS}
+        self.turnover = []      # 每根 bar 的 average * volume 之和，用于计算 average
+        self.keys = []          # 每根 bar 的 (交易日, 周期序号)
+        self.current_start = 0  # 最后一根 bar 的第一根分钟线在源列表中的位置
+        self.source_len = 0
+        self.cached_frame = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bucket(self, date):
+        ts = pd.Timestamp(date)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize('US/Eastern')
+        day = ts.tz_convert('US/Eastern').date()
+        anchor = self.anchors.get(day)
+        if anchor is None:
+            anchor = self.anchors[day] = pd.Timestamp(get_market_open_time(day)).value
+        index = (ts.value - anchor) // self.interval
+        return (day, index), anchor + index * self.interval
+
+    def pop(self):
+        self.keys.pop()
+        self.turnover.pop()
+        for values in self.columns.values():
+            values.pop()
+
+    def update(self, bars):
+        """
+        Returns:
+            bool: 本次更新是否产生了新的高周期 bar
+        """
+        if len(bars) < self.source_len: # 重新订阅等情况下源列表变短，整体重建
+            self.reset()
+        previous = len(self)
+        if self.keys:
+            self.pop()
+
+        columns = self.columns
+        for i, (date, open_, high, low, close, volume, average, bar_count) in enumerate(source_rows(bars, self.current_start), self.current_start):
+            key, bar_time = self.bucket(date)
+            if self.keys and self.keys[-1] == key:
+                columns['high'][-1] = max(columns['high'][-1], high)
+                columns['low'][-1] = min(columns['low'][-1], low)
+                columns['close'][-1] = close
+                columns['volume'][-1] += volume
+                columns['barCount'][-1] += bar_count
+                self.turnover[-1] += average * volume
+                total = columns['volume'][-1]
+                columns['average'][-1] = self.turnover[-1] / total if total > 0 else close
+            else:
+                self.keys.append(key)
+                self.turnover.append(average * volume)
+                columns['date'].append(bar_time)
+                columns['open'].append(open_)
+                columns['high'].append(high)
+                columns['low'].append(low)
+                columns['close'].append(close)
+                columns['volume'].append(volume)
+                columns['average'].append(average)
+                columns['barCount'].append(bar_count)
+                self.current_start = i
+        self.source_len = len(bars)
+        self.cached_frame = None
+        return len(self) > previous
+
+    def frame(self):
+        """
+        当前的 bar，DataFrame 在下一次 update 之前缓存复用，使用方不应修改
+        """
+        if self.cached_frame is None:
+            df = pd.DataFrame(self.columns, columns=BAR_COLUMNS)
+            df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_convert('US/Eastern')
+            self.cached_frame = df
+        return self.cached_frame
+
+class BarResampler:
+    """
+    一条 1 分钟 bar 订阅派生任意周期的 bar
+
+    update(contract, bars, has_new_bar) 与 on_bar_update 签名一致，可以直接挂到 BarDataList.updateEvent
+    或 BacktestApp.onBarUpdateEvent 上；每个合约的每个周期各维护一个 ResampledBars，
+    然后调用订阅了该周期的回调 callback(contract, bars_df, has_new_bar)，has_new_bar 表示该周期是否出现了新 bar。
+
+    e.g.
+    resampler = BarResampler()
+    resampler.subscribe('5 mins', on_5min_bar)
+    resampler.subscribe('15 mins', on_15min_bar)
+    app.onBarUpdateEvent.append(resampler.update)    # 回测
+    bars.updateEvent += partial(resampler.update, contract)  # 实盘
+    """
+    def __init__(self, bar_sizes=()):
+        self.bar_sizes = []
+        self.subscribers = {} # bar_size -> [(callback, new_bar_only)]
+        self.series = {}      # (symbol, bar_size) -> ResampledBars
+        for bar_size in bar_sizes:
+            self.add_bar_size(bar_size)
+
+    def add_bar_size(self, bar_size):
+        parse_bar_size(bar_size) # 校验周期格式
+        if bar_size not in self.bar_sizes:
+            self.bar_sizes.append(bar_size)
+            self.subscribers[bar_size] = []
+
+    def subscribe(self, bar_size, callback, new_bar_only=True):
+        """
+        Args:
+            callback: callback(contract, bars, has_new_bar)，bars 为该周期的 DataFrame
+            new_bar_only: 只在该周期出现新 bar 时调用
+        """
+        self.add_bar_size(bar_size)
+        self.subscribers[bar_size].append((callback, new_bar_only))
+
+    def resampled(self, contract, bar_size):
+        key = (contract.symbol, bar_size)
+        if key not in self.series:
+            self.series[key] = ResampledBars(bar_size)
+        return self.series[key]
+
+    def update(self, contract, bars, has_new_bar=True):
+        """
+        Returns:
+            dict: bar_size -> (ResampledBars, has_new_bar)，DataFrame 只在调用 frame() 时生成
+        """
+        views = {}
+        for bar_size in self.bar_sizes:
+            series = self.resampled(contract, bar_size)
+            has_new = series.update(bars)
+            views[bar_size] = (series, has_new)
+            for callback, new_bar_only in self.subscribers[bar_size]:
+                if new_bar_only and not has_new: continue
+                callback(contract, series.frame().copy(), has_new)
+        return views
@@ -0,0 +1,132 @@
+import io
+import os
+import glob
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+CHECKPOINT_SUFFIX = ".ckpt"
+
+def checkpoint_path(directory, date):
+    return os.path.join(directory, f"{pd.Timestamp(date):%Y%m%d}{CHECKPOINT_SUFFIX}")
+
+def latest_checkpoint(directory):
+    """
+    目录中日期最新的检查点文件，没有则返回 None
+    """
+    paths = sorted(glob.glob(os.path.join(directory, f"*{CHECKPOINT_SUFFIX}")))
+    return paths[-1] if paths else None
+
+def dumps(state, refs=None):
+    """
+    dill 序列化；refs 中的对象（{名字: 对象}）只记名字，由 loads 时传入的同名对象代替
+    """
+    import dill
+    buffer = io.BytesIO()
+    pickler = dill.Pickler(buffer)
+    if refs:
+        names = {id(obj): name for name, obj in refs.items()}
+        pickler.persistent_id = lambda obj: names.get(id(obj))
+    pickler.dump(state)
+    return buffer.getvalue()
+
+def loads(data, refs=None):
+    import dill
+    unpickler = dill.Unpickler(io.BytesIO(data))
+    if refs:
+        unpickler.persistent_load = lambda name: refs[name]
+    return unpickler.load()
+
+def dump_checkpoint(path, state, level=1, refs=None):
+    """
+    dill 序列化 + zlib 压缩，先写临时文件再原子替换，写到一半中断不会损坏已有的检查点
+    """
+    data = zlib.compress(dumps(state, refs), level)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(data)
+
+def load_checkpoint(path, refs=None):
+    """
+    Args:
+        path: 检查点文件，或检查点目录（取日期最新的一个）
+        refs: 与写入时同名的对象，见 dumps
+    """
+    if os.path.isdir(path):
+        directory, path = path, latest_checkpoint(path)
+        if path is None:
+            raise FileNotFoundError(f"{directory} 中没有检查点")
+    with open(path, "rb") as f:
+        return loads(zlib.decompress(f.read()), refs)
+
+class CheckpointWriter:
+    """
+    回测检查点的后台写入
+
+    主线程只负责生成状态快照（BacktestApp.snapshot_state），序列化、压缩和写文件在单独的线程中依次完成，
+    不阻塞回测主循环；后台写入的异常在下一次 submit 或 close 时抛出。
+
+    e.g.
+    with CheckpointWriter("checkpoints/my_strategy") as writer:
+        writer.submit(date, app.snapshot_state())
+    """
+    def __init__(self, directory, keep=None, level=1, refs=None):
+        """
+        Args:
+            keep: 只保留最近 keep 个检查点，None 表示全部保留
+            level: zlib 压缩级别
+            refs: 只记名字、不序列化的对象，见 dumps
+        """
+        self.directory = directory
+        self.keep = keep
+        self.level = level
+        self.refs = refs
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self.pending = None
+        self.error = None
+        self.written = [] # [(路径, 字节数)]
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, date, state):
+        self.check()
+        self.pending = self.executor.submit(self.write, checkpoint_path(self.directory, date), state)
+        return self.pending
+
+    def write(self, path, state):
+        try:
+            size = dump_checkpoint(path, state, self.level, self.refs)
+            self.written.append((path, size))
+            if self.keep is not None:
+                for stale in sorted(glob.glob(os.path.join(self.directory, f"*{CHECKPOINT_SUFFIX}")))[:-self.keep]:
+                    os.remove(stale)
+        except Exception as e:
+            self.error = self.error or e
+            raise
+        return path
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def flush(self):
+        """
+        等待已提交的检查点全部写完
+        """
+        if self.pending is not None:
+            self.pending.exception()
+        self.check()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
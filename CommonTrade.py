@@ -14,7 +14,11 @@ class CommonTradeConfig:
         return self.config.get(key, default)
     
 class CommonTrade:
-    def __init__(self, contract, pm: PositionManager, config:dict = {}):
+    def __init__(self, contract, pm: PositionManager, config:dict = {}, strategy=None):
+        """
+        strategy: 下单、查找持仓时使用的策略名，默认为类名；同一个类以不同配置运行时需要各自的名字
+        """
+        self.strategy = strategy or self.__class__.__name__
         self.contract = contract
         self.pm = pm
         self.config = CommonTradeConfig(config)
@@ -33,7 +37,7 @@ class CommonTrade:
     def find_position(self):
         is_match = lambda item: (
             item["contract"] == self.contract and
-            item["strategy"] == self.__class__.__name__
+            item["strategy"] == self.strategy
         )
         return self.pm.find_position(is_match)
     
@@ -87,7 +91,7 @@ class CommonTrade:
         position = self.find_position()
         amount = direction * self.cal_open_amount_by_pct()
         if not position and self.time_allow_open() and self.chandelier_allow_open(direction):
-            self.pm.open_position(self.contract, self.__class__.__name__, amount, self.bars, reason=reason)
+            self.pm.open_position(self.contract, self.strategy, amount, self.bars, reason=reason)
 
     def close_position(self, reason=None):
         position = self.find_position()
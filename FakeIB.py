@@ -0,0 +1,307 @@
+import datetime
+import time
+from time import perf_counter_ns
+
+import numpy as np
+import pandas as pd
+from eventkit import Event
+from ib_insync import (
+    BarData, BarDataList, Trade, OrderStatus, Fill, Execution, CommissionReport, AccountValue, TradeLogEntry
+)
+
+from Profiler import LatencyHistogram
+
+class FakeIB:
+    """
+    离线的 IB 替身，用于在没有 TWS/Gateway 的情况下跑实盘路径（TradeApp / PositionManagerPlus 非 debug 模式）
+
+    - reqHistoricalData(keepUpToDate=True) 返回 BarDataList，run() 时按时间顺序逐根追加 bar 并触发 updateEvent(bars, True)
+      （每根 bar 以完整 OHLCV 推送一次，不模拟 5 秒一次的进行中更新）
+    - placeOrder 的订单在当前这一轮 bar 推送结束后成交：市价单按该合约最新收盘价，限价单在之后的 bar 触及限价时按限价成交
+    - 成交时依次触发 orderStatusEvent / execDetailsEvent / commissionReportEvent，并推送 NetLiquidation / AvailableFunds
+    - 记录每根 bar 推送开始到 placeOrder 的延迟（信号到下单）
+
+    e.g.
+    ib = FakeIB({"TSLA": df_tsla, "NVDA": df_nvda}, speed=100)
+    app = StructureTradeApp(ib=ib, port=None)
+    app.contracts = [Stock(symbol, 'SMART', 'USD') for symbol in ib.symbols]
+    app.subscribe_to_bars()
+    ib.latency_summary()
+
+    Args:
+        bars: {symbol: 分钟线 DataFrame}，列与 BacktestApp.get_historical_data 返回的一致，date 为带时区的时间
+        speed: 回放倍速，100 表示 100 倍实时速度；None 表示不等待，尽可能快
+        warmup: 订阅时 BarDataList 中预先放入的 bar 数量，回放从之后的 bar 开始
+    """
+    def __init__(self, bars, speed=None, warmup=0, net_liquidation=1_000_000, commission_per_share=0.005,
+                 min_commission=1.0, account="FAKE"):
+        self.speed = speed
+        self.warmup = warmup
+        self.commission_per_share = commission_per_share
+        self.min_commission = min_commission
+        self.account = account
+
+        self.frames = {}
+        for symbol, df in bars.items():
+            df = df.reset_index(drop=True)
+            df['date'] = pd.to_datetime(df['date'])
+            self.frames[symbol] = df
+        self.symbols = list(self.frames)
+
+        # 所有合约的 bar 时间合并为一条时间轴
+        times = np.unique(np.concatenate([df['date'].to_numpy(dtype='datetime64[ns]').view(np.int64) for df in self.frames.values()])) \
+            if self.frames else np.array([], dtype=np.int64)
+        self.timeline = times
+        self.steps = {
+            symbol: np.searchsorted(times, df['date'].to_numpy(dtype='datetime64[ns]').view(np.int64))
+            for symbol, df in self.frames.items()
+        }
+        self.step = warmup
+        self.last_price = {}
+        self.bar_objects = {}
+
+        self.connected = False
+        self.subscriptions = {} # symbol -> [BarDataList]
+        self.next_order_id = 1
+        self.open_orders = []
+        self.completed = []
+        self.cash = net_liquidation
+        self.positions = {} # symbol -> [数量, 平均成本]
+
+        self._dispatch_start = None
+        self.order_latency = LatencyHistogram()
+
+        self.updateEvent = Event('updateEvent')
+        self.accountSummaryEvent = Event('accountSummaryEvent')
+        self.orderStatusEvent = Event('orderStatusEvent')
+        self.execDetailsEvent = Event('execDetailsEvent')
+        self.commissionReportEvent = Event('commissionReportEvent')
+        self.disconnectedEvent = Event('disconnectedEvent')
+
+    # ------------------------------------------------------------ 连接
+
+    def connect(self, host=None, port=None, clientId=None, **kwargs):
+        self.connected = True
+        return self
+
+    def isConnected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+        self.disconnectedEvent.emit()
+
+    def sleep(self, secs=0.02):
+        return True
+
+    # ------------------------------------------------------------ 行情
+
+    def bar_list(self, symbol):
+        """
+        合约全部分钟线对应的 BarData，首次使用时生成
+        """
+        if symbol not in self.bar_objects:
+            self.bar_objects[symbol] = [
+                BarData(row.date.to_pydatetime(), row.open, row.high, row.low, row.close, row.volume, row.average, int(row.barCount))
+                for row in self.frames[symbol].itertuples()
+            ]
+        return self.bar_objects[symbol]
+
+    def current_time(self):
+        if len(self.timeline) == 0: return None
+        step = min(self.step, len(self.timeline)) - 1
+        return pd.Timestamp(self.timeline[max(step, 0)], tz='UTC')
+
+    def reqHistoricalData(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='1 min',
+                          whatToShow='TRADES', useRTH=True, formatDate=1, keepUpToDate=False, chartOptions=[], timeout=60):
+        df = self.frames[contract.symbol]
+        bars = BarDataList()
+        bars.contract, bars.endDateTime, bars.durationStr, bars.barSizeSetting = contract, endDateTime, durationStr, barSizeSetting
+        bars.whatToShow, bars.useRTH, bars.formatDate, bars.keepUpToDate = whatToShow, useRTH, formatDate, keepUpToDate
+
+        if keepUpToDate:
+            # 已回放到的 bar 放入列表，之后的 bar 由 run() 推送
+            position = int(np.searchsorted(self.steps[contract.symbol], self.step))
+            bars.extend(self.bar_list(contract.symbol)[:position])
+            self.subscriptions.setdefault(contract.symbol, []).append(bars)
+            return bars
+
+        end = pd.Timestamp(endDateTime) if endDateTime else self.current_time()
+        if isinstance(endDateTime, datetime.date) and not isinstance(endDateTime, datetime.datetime):
+            end = end + pd.Timedelta(hours=23, minutes=59, seconds=59) # 与 ib_insync 一致，date 按当日 23:59:59 请求
+        if end is not None and end.tzinfo is None:
+            end = end.tz_localize(df['date'].dt.tz)
+        days = int(durationStr.split()[0]) if durationStr.endswith('D') else 1
+        if barSizeSetting == '1 day':
+            # 与 IB 一致，endDateTime 为空时包含当日截至当前的部分日线
+            daily = df.groupby(df['date'].dt.date).agg(
+                open=('open', 'first'), high=('high', 'max'), low=('low', 'min'), close=('close', 'last'),
+                volume=('volume', 'sum'), barCount=('barCount', 'sum'), last=('date', 'last'))
+            daily['average'] = (df['average'] * df['volume']).groupby(df['date'].dt.date).sum() / daily['volume']
+            if end is not None:
+                daily = daily[daily['last'] <= end]
+            for day, row in daily.tail(days).iterrows():
+                bars.append(BarData(day, row.open, row.high, row.low, row.close, row.volume, row.average, int(row.barCount)))
+        else:
+            selected = df[df['date'] < end] if end is not None else df
+            selected = selected[selected['date'].dt.date.isin(sorted(set(selected['date'].dt.date))[-days:])]
+            bars.extend(self.bar_list(contract.symbol)[i] for i in selected.index)
+        return bars
+
+    def run(self, *awaitables):
+        """
+        按时间轴回放所有订阅，直到数据结束
+        """
+        if awaitables: return None
+        # 每一步需要推送的 (合约, 行号)，只包含已订阅的合约
+        schedule = {}
+        for symbol in self.subscriptions:
+            for position, step in enumerate(self.steps[symbol]):
+                if step >= self.step:
+                    schedule.setdefault(int(step), []).append((symbol, position))
+
+        # 回放时钟：相邻 bar 的间隔最多按 1 分钟计，跳过收盘后到次日开盘的空档
+        wall_start, replay_elapsed = time.monotonic(), 0.0
+        while self.step < len(self.timeline):
+            step = self.step
+            if self.speed:
+                if step > 0:
+                    replay_elapsed += min(self.timeline[step] - self.timeline[step - 1], 60_000_000_000) / 1e9
+                delay = replay_elapsed / self.speed - (time.monotonic() - wall_start)
+                if delay > 0: time.sleep(delay)
+
+            for symbol, position in schedule.get(step, []):
+                bar = self.bar_list(symbol)[position]
+                self.last_price[symbol] = bar.close
+                for bars in self.subscriptions[symbol]:
+                    bars.append(bar)
+                    self._dispatch_start = perf_counter_ns()
+                    bars.updateEvent.emit(bars, True)
+                    self._dispatch_start = None
+            self.updateEvent.emit()
+            self.step += 1
+            self.match_orders(self.current_time())
+        return None
+
+    # ------------------------------------------------------------ 账户与订单
+
+    def reqAccountSummary(self):
+        net_liquidation = self.cash + sum(amount * self.last_price.get(symbol, cost) for symbol, (amount, cost) in self.positions.items())
+        values = [
+            AccountValue(self.account, "NetLiquidation", str(net_liquidation), "USD", ""),
+            AccountValue(self.account, "AvailableFunds", str(self.cash), "USD", ""),
+        ]
+        for value in values:
+            self.accountSummaryEvent.emit(value)
+        return values
+
+    def reqAccountSummaryAsync(self):
+        # PositionManager 不 await 这个调用，这里直接同步推送
+        self.reqAccountSummary()
+
+    def placeOrder(self, contract, order):
+        if self._dispatch_start is not None:
+            self.order_latency.record(perf_counter_ns() - self._dispatch_start)
+        order.orderId = order.orderId or self.next_order_id
+        self.next_order_id = max(self.next_order_id, order.orderId) + 1
+        trade = Trade(contract, order, OrderStatus(orderId=order.orderId, status='Submitted', remaining=order.totalQuantity), [], [])
+        self.open_orders.append(trade)
+        self.orderStatusEvent.emit(trade)
+        return trade
+
+    def cancelOrder(self, order):
+        trade = next((trade for trade in self.open_orders if trade.order.orderId == order.orderId), None)
+        if trade is None: return None
+        self.open_orders.remove(trade)
+        trade.orderStatus.status = 'Cancelled'
+        self.completed.append(trade)
+        self.orderStatusEvent.emit(trade)
+        trade.cancelledEvent.emit(trade)
+        return trade
+
+    def openTrades(self):
+        return list(self.open_orders)
+
+    def trades(self):
+        return self.completed + self.open_orders
+
+    def reqCompletedOrders(self, apiOnly=False):
+        return list(self.completed)
+
+    def match_orders(self, fill_time=None):
+        """
+        每轮 bar 推送结束后撮合挂单
+        """
+        for trade in list(self.open_orders):
+            symbol = trade.contract.symbol
+            price = self.last_price.get(symbol)
+            if price is None: continue
+            if trade.order.orderType == 'LMT':
+                limit = trade.order.lmtPrice
+                if trade.order.action == 'BUY' and price > limit: continue
+                if trade.order.action == 'SELL' and price < limit: continue
+                price = limit
+            self.open_orders.remove(trade)
+            self.fill(trade, price, fill_time)
+
+    def fill(self, trade, price, fill_time=None):
+        order = trade.order
+        quantity = order.totalQuantity
+        sign = 1 if order.action == 'BUY' else -1
+        commission = max(self.min_commission, quantity * self.commission_per_share)
+        realized = self.update_position(trade.contract.symbol, sign * quantity, price)
+        fill_time = (fill_time or pd.Timestamp.now(tz='UTC')).tz_convert('UTC').to_pydatetime()
+
+        execution = Execution(
+            execId=f"{order.orderId:08x}.{len(trade.fills) + 1:02d}", time=fill_time, acctNumber=self.account, exchange='SMART',
+            side='BOT' if sign > 0 else 'SLD', shares=quantity, price=price, orderId=order.orderId, cumQty=quantity, avgPrice=price)
+        report = CommissionReport(execution.execId, commission, 'USD', realized - commission if realized else 0.0)
+        fill = Fill(trade.contract, execution, report, fill_time)
+        trade.fills.append(fill)
+        trade.orderStatus.status = 'Filled'
+        trade.orderStatus.filled = quantity
+        trade.orderStatus.remaining = 0
+        trade.orderStatus.avgFillPrice = price
+        trade.orderStatus.lastFillPrice = price
+        trade.log.append(TradeLogEntry(fill_time, 'Filled', ''))
+        self.cash -= sign * quantity * price + commission
+        self.completed.append(trade)
+
+        self.orderStatusEvent.emit(trade)
+        self.execDetailsEvent.emit(trade, fill)
+        self.commissionReportEvent.emit(trade, fill, report)
+        trade.filledEvent.emit(trade)
+        self.reqAccountSummary()
+
+    def update_position(self, symbol, amount, price):
+        """
+        更新持仓并返回本次成交的已实现盈亏（不含手续费）
+        """
+        held, cost = self.positions.get(symbol, [0, 0.0])
+        realized = 0.0
+        if held == 0 or held * amount > 0:
+            cost = (held * cost + amount * price) / (held + amount)
+            held += amount
+        else:
+            closed = min(abs(amount), abs(held)) * np.sign(held)
+            realized = (price - cost) * closed
+            held += amount
+            if held * closed < 0: cost = price # 反手，剩余部分以成交价开仓
+        if held == 0:
+            self.positions.pop(symbol, None)
+        else:
+            self.positions[symbol] = [held, cost]
+        return float(realized)
+
+    def latency_summary(self):
+        """
+        信号到下单延迟（毫秒）
+        """
+        histogram = self.order_latency
+        return {
+            "orders": histogram.count,
+            "mean_ms": histogram.mean / 1e6,
+            "p50_ms": histogram.percentile(50) / 1e6,
+            "p99_ms": histogram.percentile(99) / 1e6,
+            "max_ms": histogram.max / 1e6,
+        }
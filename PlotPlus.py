@@ -3,8 +3,46 @@ import matplotlib.pyplot as plt
 import mplfinance as mpf
 import numpy as np
 import matplotlib.ticker as mtick
+from matplotlib.artist import Artist
+from matplotlib.collections import PolyCollection
+from matplotlib.text import Text
 
 from utils import macd, vwap
+from VolumeProfile import VolumeProfile
+
+def rect_verts(x0, x1, y0, y1):
+    """
+    批量生成矩形顶点，参数可为标量或等长数组，返回形状 (n, 4, 2)
+    """
+    x0, x1, y0, y1 = np.broadcast_arrays(x0, x1, y0, y1)
+    return np.stack([
+        np.column_stack([x0, y0]),
+        np.column_stack([x0, y1]),
+        np.column_stack([x1, y1]),
+        np.column_stack([x1, y0]),
+    ], axis=1)
+
+class TextCollection(Artist):
+    """
+    多个文本标注合成一个 artist：所有标注共用一个 Text（字体、颜色、对齐方式相同），
+    绘制时依次设置位置和内容后绘制，axes 中只增加一个对象
+    """
+    def __init__(self, x, y, texts, **kwargs):
+        super().__init__()
+        self.offsets = np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+        self.texts = [str(text) for text in texts]
+        self.text = Text(**kwargs)
+
+    def draw(self, renderer):
+        if not self.get_visible(): return
+        text = self.text
+        text.set_figure(self.get_figure())
+        text.set_transform(self.get_transform())
+        for (x, y), content in zip(self.offsets, self.texts):
+            text.set_position((x, y))
+            text.set_text(content)
+            text.draw(renderer)
+        self.stale = False
 
 class PlotPlus:
     def __init__(self, df, ema_window=10):
@@ -13,10 +51,14 @@ class PlotPlus:
         
     def prepare_history(self, history):
         if len(history) == 0: return pd.DataFrame()
-        if isinstance(history, list) and len(history) != 0:
+        if isinstance(history, pd.DataFrame):
+            histories = history
+        elif hasattr(history, 'to_frame'): # PositionManagerPlus.TradeLog
+            histories = history.to_frame()
+        else:
             histories = pd.DataFrame(history)
         
-        histories = histories.groupby(['date', 'direction'], as_index=False).agg({
+        histories = histories.groupby(['date', 'direction'], as_index=False, observed=True).agg({
             'date': 'first',  # 假设 symbol 不变，取第一行的值
             'symbol': 'first',    # 同理，取第一个
             'strategy': 'first',  # 同理，取第一个
@@ -66,14 +108,28 @@ class PlotPlus:
                 figsize=(10, 6),
                 returnfig=True)       # 返回figure和axes对象
         
+        # 柱状图用单个 PolyCollection 绘制，分钟线跨多日时避免生成上万个 Rectangle
+        self.bar_collection(self.axes[2], self.df['MACD'], color='grey', width=0.7, alpha=0.5)
+        self.bar_collection(self.axes[4], self.df['volume'], color=np.where(self.df['close'] >= self.df['open'], 'r', 'g'))
+        # 图例固定位置，loc='best' 需要遍历所有数据点
+        self.axes[0].legend(loc='upper left')
+        
         self.generate_pct_change()
     
+    def bar_collection(self, ax, values, color, width=0.8, alpha=1.0):
+        """
+        以单个 PolyCollection 绘制柱状图，x 为行号
+        """
+        values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+        x = np.arange(len(values))
+        bars = PolyCollection(rect_verts(x - width / 2, x + width / 2, 0, values), facecolors=color, edgecolors='none', alpha=alpha)
+        ax.add_collection(bars)
+        ax.autoscale_view()
+        return bars
+    
     def generate_volume_panel(self):
-        # 根据涨跌设置颜色，涨(收盘价>=开盘价)为红色，跌为绿色
-        colors = np.where(self.df['close'] >= self.df['open'], 'r', 'g')
-
-        # 创建成交量的 addplot
-        volume_panel = mpf.make_addplot(self.df['volume'], panel=2, type='bar', color=colors, ylabel='Volume')
+        # 成交量柱在 plot_basic 中由 bar_collection 绘制（涨为红色，跌为绿色），此处只占位副图
+        volume_panel = mpf.make_addplot(self.df['volume'], panel=2, type='line', alpha=0, ylabel='Volume')
         return [volume_panel]
 
     def generate_ema_panel(self):
@@ -93,7 +149,7 @@ class PlotPlus:
         macd_panel = [
                     mpf.make_addplot(self.df['DIF'], panel=panel_id, color='b', alpha=0.5),
                     mpf.make_addplot(self.df['DEA'], panel=panel_id, color='r', alpha=0.5),
-                    mpf.make_addplot(self.df['MACD'], panel=panel_id, color='grey', type='bar', width=0.7, alpha=0.5)
+                    # MACD 柱在 plot_basic 中由 bar_collection 绘制
                 ]
         
         return macd_panel
@@ -125,9 +181,11 @@ class PlotPlus:
             return
         if not isinstance(df.index, pd.DatetimeIndex):
             df = df.set_index(pd.to_datetime(df['date']))
-        # 获取标记点的 x 轴位置（索引）
-        x_positions = [self.df.index.get_loc(idx) for idx in df.index]
-        y_positions = df[y_column]
+        # 获取标记点的 x 轴位置（索引），一次性查找，不在图中的点丢弃
+        x_positions = self.df.index.get_indexer(df.index)
+        in_chart = x_positions >= 0
+        x_positions = x_positions[in_chart]
+        y_positions = df[y_column].to_numpy()[in_chart]
         ax_main = self.axes[0]  # 主图的Axes对象
         # 在图上标记拐点
         ax_main.scatter(x_positions, y_positions, label=label, color=color, marker=marker, s=10)
@@ -149,51 +207,52 @@ class PlotPlus:
         ax_main = self.axes[0]  # 主图的Axes对象
         history_df = history_df.loc[self.df.iloc[0]["date"]:self.df.iloc[-1]["date"]]
         
-        # 提取买卖点的索引和价格
-        buy_signals = self.df[self.df['signal'] == 'BUY']
-        buy_signals_position = [self.df.index.get_loc(idx) for idx in buy_signals.index]
+        # 提取买卖点的位置和价格
+        signal = self.df['signal'].to_numpy()
+        close = self.df['close'].to_numpy()
+        amount = self.df['amount'].to_numpy()
+        
+        buy_signals_position = np.flatnonzero(signal == 'BUY')
         # 在主图上标注买卖点
-        if buy_signals_position:
+        if len(buy_signals_position):
             ax_main.scatter(buy_signals_position, history_df[history_df["amount"] > 0]['price'], label='Buy', color='green', marker='^', s=20)
-            
-            for idx, pos in zip(buy_signals.index, buy_signals_position):
-                quantity = buy_signals.loc[idx, 'amount']  # 假设数量列是 'quantity'
-                ax_main.text(pos, buy_signals.loc[idx, 'close'] + 0.1,  # 在价格上方添加文本，+0.1调整位置
-                            str(quantity),  # 作为文本标注数量
+            # 在价格上方标注数量
+            self.batch_text(buy_signals_position, close[buy_signals_position] + 0.1, amount[buy_signals_position],
                             color='green', fontsize=8, ha='center', va='bottom')
             
-        sell_signals = self.df[self.df['signal'] == 'SELL']
-        sell_signals_position = [self.df.index.get_loc(idx) for idx in sell_signals.index]
-        if sell_signals_position:
+        sell_signals_position = np.flatnonzero(signal == 'SELL')
+        if len(sell_signals_position):
             ax_main.scatter(sell_signals_position, history_df[history_df["amount"] < 0]['price'], label='Sell', color='red', marker='v', s=20)
-            
-            # 标注卖出数量
-            for idx, pos in zip(sell_signals.index, sell_signals_position):
-                quantity = sell_signals.loc[idx, 'amount']  # 假设数量列是 'quantity'
-                ax_main.text(pos, sell_signals.loc[idx, 'close'] - 0.1,  # 在价格下方添加文本，-0.1调整位置
-                            str(quantity),  # 作为文本标注数量
+            # 在价格下方标注数量
+            self.batch_text(sell_signals_position, close[sell_signals_position] - 0.1, amount[sell_signals_position],
                             color='red', fontsize=8, ha='center', va='top')
     
+    def batch_text(self, x_positions, y_positions, texts, **kwargs):
+        """
+        按数组批量添加文本标注，坐标事先一次性算好，所有标注合成一个 TextCollection 加入主图
+        """
+        ax_main = self.axes[0]
+        collection = TextCollection(x_positions, y_positions, texts, **kwargs)
+        collection.set_transform(ax_main.transData)
+        ax_main.add_artist(collection)
+        collection.set_clip_on(False) # 与 ax.text 一致，不按坐标轴区域裁剪
+        return collection
+    
     def mark_segment(self, column, value=True, color="gray"):
-        periods = []
-        start = None
-
-        for i in range(len(self.df)):
-            if self.df.iloc[i][column] == value:
-                if start is None:
-                    start = self.df.index[i]  # 记录震荡市场的起点
-            else:
-                if start is not None:
-                    periods.append((start, self.df.index[i-1]))  # 记录起止时间
-                    start = None
-
-        if start is not None:
-            periods.append((start, self.df.index[-1]))
-            
-        for start, end in periods:
-            start_idx = self.df.index.get_loc(start)
-            end_idx = self.df.index.get_loc(end)
-            self.axes[0].axvspan(start_idx, end_idx, color=color, alpha=0.3)  # 震荡区域填充背景色
+        """
+        将 column == value 的连续区间标为背景色
+        连续区间由差分一次性求出，所有区间合成一个 PolyCollection 绘制
+        """
+        is_match = (self.df[column] == value).to_numpy().astype(np.int8)
+        edges = np.diff(np.concatenate(([0], is_match, [0])))
+        start_idx = np.flatnonzero(edges == 1)
+        end_idx = np.flatnonzero(edges == -1) - 1
+        if len(start_idx) == 0: return
+        
+        # x 为数据坐标，y 为轴坐标，与 axvspan 一样覆盖整个纵向范围
+        spans = PolyCollection(rect_verts(start_idx, end_idx, 0, 1), facecolors=color, edgecolors=color, alpha=0.3,
+                               transform=self.axes[0].get_xaxis_transform())  # 震荡区域填充背景色
+        self.axes[0].add_collection(spans, autolim=False)
         
     def generate_pct_change(self):
         self.df['return'] = (self.df['close'] / self.df.iloc[0]['close'] - 1) * 100
@@ -210,46 +269,39 @@ class PlotPlus:
         # 让右侧 y 轴的范围与主 y 轴对齐
         ax_return.set_ylim(self.df['return'].min(), self.df['return'].max())
 
-    def plot_volume_profile(self, df_tick, bin_size=0.05):
+    def plot_volume_profile(self, df_tick=None, bin_size=0.05, profile=None):
         """
         在主图上绘制 Volume Profile。
 
         参数：
         - df_tick: 包含 tick 数据的 DataFrame，需包含列 ['price', 'volume']
         - bin_size: 价格分箱大小，用于 Volume Profile 的分箱
+        - profile: 已有的 VolumeProfile（例如策略实盘中增量维护的），传入时忽略 df_tick
         """
-        if df_tick.empty:
-            print("Tick 数据为空，无法生成 Volume Profile。")
-            return None
-        df_tick = df_tick.copy()
-        df_tick = df_tick[(df_tick['price'] <= self.df['high'].max()) & (df_tick['price'] >= self.df['low'].min())]
-
-        # 计算价格区间
-        price_min = np.floor(df_tick['price'].min() / bin_size) * bin_size
-        price_max = np.ceil(df_tick['price'].max() / bin_size) * bin_size
-        bins = np.arange(price_min, price_max + bin_size, bin_size)
-
-        # 将价格分配到区间
-        df_tick['price_bin'] = pd.cut(df_tick['price'], bins)
-
-        # 计算每个价格区间的总成交量
-        volume_profile = df_tick.groupby('price_bin')['volume'].sum().reset_index()
-        volume_profile['price_mid'] = volume_profile['price_bin'].apply(lambda x: x.mid)
+        if profile is None:
+            if df_tick is None or df_tick.empty:
+                print("Tick 数据为空，无法生成 Volume Profile。")
+                return None
+            in_range = (df_tick['price'] <= self.df['high'].max()) & (df_tick['price'] >= self.df['low'].min())
+            profile = VolumeProfile(bin_size=bin_size)
+            profile.update_ticks(df_tick.loc[in_range, 'price'], df_tick.loc[in_range, 'volume'])
+        
+        if profile.total_volume == 0: return profile
+        has_volume = profile.volume > 0
 
         # 归一化成交量，用于调整条形图的宽度
-        max_volume = volume_profile['volume'].max()
-        volume_profile['normalized_volume'] = volume_profile['volume'] / max_volume * 200  # 调整宽度比例
-
-        # 在主图上绘制水平条形图
-        for _, row in volume_profile.iterrows():
-            self.axes[0].barh(
-                row['price_mid'],  # 水平条形图的 y 值
-                row['normalized_volume'],  # 宽度
-                height=bin_size * 0.9,  # 条形图的高度
-                color='steelblue',
-                alpha=0.7,  # 透明度
-                align='center'
-            )
+        normalized_volume = profile.volume[has_volume] / profile.volume.max() * 200  # 调整宽度比例
+
+        # 在主图上一次性绘制所有水平条形
+        self.axes[0].barh(
+            profile.prices[has_volume],  # 水平条形图的 y 值
+            normalized_volume,  # 宽度
+            height=profile.bin_size * 0.9,  # 条形图的高度
+            color='steelblue',
+            alpha=0.7,  # 透明度
+            align='center'
+        )
+        return profile
         
     def show(self):
         plt.show()
\ No newline at end of file
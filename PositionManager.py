@@ -1,5 +1,6 @@
 from ib_insync import *
 from utils import volatility, is_within_30_minutes_of_close
+from AppConfig import redis_client
 import pandas as pd
 
 ACCOUNT_REQUEST_INTERVAL = 60
@@ -42,38 +43,17 @@ class PositionManager:
         if _trade: _trade["callback"](self, trade)
         
     def save(self):
-        import copy
         import dill
-        import yaml
-        import redis
-
-        # 加载配置
-        with open("config.yml", "r") as file:
-            config = yaml.safe_load(file)
-
-        redis_config = config.get("redis", {})
-        redis_client = redis.Redis(**redis_config)
-            
         data = {
             "positions": self.positions,
             "trade_log": self.trade_log,
             "trades": self.trades
         }
-        redis_client.set("position_manager_data", dill.dumps(data))
+        redis_client("config.yml").set("position_manager_data", dill.dumps(data))
         
     def restore(self):
         import dill
-        import yaml
-        import redis
-
-        # 加载配置
-        with open("config.yml", "r") as file:
-            config = yaml.safe_load(file)
-
-        redis_config = config.get("redis", {})
-        redis_client = redis.Redis(**redis_config)
-        
-        data = redis_client.get("position_manager_data")
+        data = redis_client("config.yml").get("position_manager_data")
         if data:
             data = dill.loads(data)
             self.positions  = data.get("positions", [])
@@ -86,15 +66,7 @@ class PositionManager:
                 if trade: trade["callback"](self, trade)
             
     def clear_redis(self):
-        import yaml
-        import redis
-
-        # 加载配置
-        with open("config.yml", "r") as file:
-            config = yaml.safe_load(file)
-        redis_config = config.get("redis", {})
-        redis_client = redis.Redis(**redis_config)
-        redis_client.delete("position_manager_data")
+        redis_client("config.yml").delete("position_manager_data")
         
     def find_position(self, symbol):
         return next((item for item in self.positions if item.get("symbol") == symbol), None)
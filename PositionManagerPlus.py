@@ -1,14 +1,117 @@
-from ib_insync import *
 
+import numpy as np
 import pandas as pd
-import dill
-import yaml
-import redis
 import time
+from Profiler import profiled
+from AppConfig import redis_client
 
 ACCOUNT_REQUEST_INTERVAL = 60
 TEST_COMMISSION_PERCENT = 0.00008 # 测试手续费设置
 SLIPPAGE = 0.002 # 滑点
+ORDER_DONE_STATES = {"Filled", "Cancelled", "ApiCancelled"} # 与 ib_insync OrderStatus.DoneStates 一致
+UNSET_DOUBLE = 1e300 # IB 未设置的 double（开仓成交的 realizedPNL）为 sys.float_info.max
+
+TRADE_LOG_CATEGORIES = ["symbol", "strategy", "open_or_close", "direction", "reason"]
+TRADE_LOG_NUMERICS = {"price": np.float64, "amount": np.float64, "commission": np.float64, "pnl": np.float64}
+TRADE_LOG_COLUMNS = ["date", "symbol", "strategy", "open_or_close", "direction", "price", "amount", "commission", "pnl", "reason"]
+
+class TradeLog:
+    """
+    列式交易记录
+    数值列为可增长的 numpy 数组，symbol/strategy/open_or_close/direction/reason 存为分类编码，date 存为 UTC 纳秒
+
+    兼容原来 list of dict 的用法：len()、迭代、下标访问都返回 dict；
+    需要 DataFrame 时用 to_frame()，按列整体拷贝，不逐行转换。
+    amount 存为浮点数，部分平仓（init_amount * substract_percent）和 IB 的零股成交不会被截断。
+    """
+    def __init__(self, capacity=256):
+        self.size = 0
+        self.date = np.zeros(capacity, dtype=np.int64)
+        self.numerics = {column: np.zeros(capacity, dtype=dtype) for column, dtype in TRADE_LOG_NUMERICS.items()}
+        self.codes = {column: np.zeros(capacity, dtype=np.int32) for column in TRADE_LOG_CATEGORIES}
+        self.categories = {column: [] for column in TRADE_LOG_CATEGORIES}
+        self.category_index = {column: {} for column in TRADE_LOG_CATEGORIES}
+
+    @classmethod
+    def from_records(cls, records):
+        trade_log = cls(max(256, len(records)))
+        for record in records:
+            trade_log.append(record)
+        return trade_log
+
+    def snapshot(self):
+        """
+        当前记录的只读快照，O(类别数)：
+        已写入的行之后不会再修改，快照直接引用底层数组的前 size 行；之后的 append 写在 size 之后或扩容后的新数组中
+        """
+        trade_log = TradeLog.__new__(TradeLog)
+        n = self.size
+        trade_log.size = n
+        trade_log.date = self.date[:n]
+        trade_log.numerics = {column: values[:n] for column, values in self.numerics.items()}
+        trade_log.codes = {column: values[:n] for column, values in self.codes.items()}
+        trade_log.categories = {column: list(values) for column, values in self.categories.items()}
+        trade_log.category_index = {column: dict(index) for column, index in self.category_index.items()}
+        return trade_log
+
+    def _grow(self):
+        capacity = max(len(self.date) * 2, 256)
+        self.date = np.resize(self.date, capacity)
+        self.numerics = {column: np.resize(values, capacity) for column, values in self.numerics.items()}
+        self.codes = {column: np.resize(values, capacity) for column, values in self.codes.items()}
+
+    def _encode(self, column, value):
+        # None 编码为 -1，to_frame 时对应 NaN
+        if value is None: return -1
+        index = self.category_index[column]
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(self.categories[column])
+            self.categories[column].append(value)
+        return code
+
+    def append(self, record):
+        if self.size == len(self.date):
+            self._grow()
+        i = self.size
+        date = pd.Timestamp(record["date"])
+        if date.tzinfo is None:
+            date = date.tz_localize('US/Eastern')
+        self.date[i] = date.value
+        for column in TRADE_LOG_NUMERICS:
+            value = record.get(column)
+            self.numerics[column][i] = np.nan if value is None else value
+        for column in TRADE_LOG_CATEGORIES:
+            self.codes[column][i] = self._encode(column, record.get(column))
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if i < 0: i += self.size
+        if not 0 <= i < self.size: raise IndexError(i)
+        record = {"date": pd.Timestamp(self.date[i], tz='UTC').tz_convert('US/Eastern')}
+        for column in TRADE_LOG_CATEGORIES:
+            code = self.codes[column][i]
+            record[column] = None if code < 0 else self.categories[column][code]
+        for column in TRADE_LOG_NUMERICS:
+            value = self.numerics[column][i].item()
+            record[column] = None if column == "pnl" and np.isnan(value) else value
+        return {column: record[column] for column in TRADE_LOG_COLUMNS}
+
+    def __iter__(self):
+        return (self[i] for i in range(self.size))
+
+    def to_frame(self):
+        n = self.size
+        data = {"date": pd.DatetimeIndex(self.date[:n].view('datetime64[ns]')).tz_localize('UTC').tz_convert('US/Eastern')}
+        for column in TRADE_LOG_CATEGORIES:
+            data[column] = pd.Categorical.from_codes(self.codes[column][:n], categories=pd.Index(self.categories[column], dtype=object))
+        for column in TRADE_LOG_NUMERICS:
+            # 拷贝一份，返回的 DataFrame 被修改时不影响交易记录本身
+            data[column] = self.numerics[column][:n].copy()
+        return pd.DataFrame(data, columns=TRADE_LOG_COLUMNS, copy=False)
 
 class PositionManager:
     """
@@ -21,11 +124,15 @@ class PositionManager:
         self.strategy = strategy # 用在存储策略
         self.debug = debug
         self.positions = []  # 存储多个合约的仓位信息
-        self.trade_log = []  # 交易记录列表
+        self.trade_log = TradeLog()  # 交易记录
         self.trades    = []  # 记录下单中的交易
+        self.orders    = {}  # orderId -> 下单中交易的成交累计，见 track_order
+        self.pending_orders = [] # tick 回放模式下的挂单
+        self.replay = False # tick 回放模式：限价单挂单，由后续第一笔满足条件的 tick 撮合
+        self.logEvent = [] # 每条交易记录写入后回调 callback(record)
         self.config_file = config_file
         if ib:
-            # self.ib.orderStatusEvent += self.on_order_status
+            self.ib.orderStatusEvent += self.on_order_status
             self.ib.accountSummaryEvent += self.on_account_summary
             self.ib.commissionReportEvent += self.on_commission_report
             self.ib.reqAccountSummaryAsync()
@@ -42,35 +149,49 @@ class PositionManager:
         
     def on_order_status(self, trade):
         """
-        处理订单状态更新的回调函数
+        处理订单状态更新的回调函数，未成交就撤单的订单没有佣金报告，由这里结束
         """
-        _trade = self.find_trade_by_order_id(trade.order.orderId)
-        if _trade: _trade["callback"](self, trade)
+        self.dispatch_if_done(trade)
 
     def on_commission_report(self, trade, fill, commissionReport):
         """
-        处理佣金报告
+        处理佣金报告：按 execId 累加佣金、已实现盈亏和成交数量，重复推送的报告只计一次
+        """
+        order = self.orders.get(trade.order.orderId)
+        if order is None: return
+        exec_id = fill.execution.execId
+        if exec_id not in order["reported"]:
+            order["reported"].add(exec_id)
+            order["commission"] += commissionReport.commission
+            if abs(commissionReport.realizedPNL) < UNSET_DOUBLE:
+                order["pnl"] += commissionReport.realizedPNL
+            order["filled"] += fill.execution.shares
+        self.dispatch_if_done(trade)
+
+    def dispatch_if_done(self, trade):
         """
-        # print(f"Commission Report Received")
-        # print('Trade 1', trade)
-        # print('Fill 1', fill)
-        # print('commissionReport 1', commissionReport)
-        # 在这里可以根据需要处理佣金和盈亏数据
-        # 例如，你可以将它们存储到数据库或进一步计算
-        _trade = self.find_trade_by_order_id(trade.order.orderId)
-        if _trade: _trade["callback"](self, trade)
+        订单进入终止状态，且每笔成交的佣金报告都已收到时，调用一次下单时登记的 callback；
+        orderStatus 可能先于成交明细到达，此时 trade.fills 还不完整，所以同时要求已报告的成交数量达到 orderStatus.filled。
+        之后订单不再跟踪，callback 没有处理的终止状态（如平仓单被撤销）不会一直占住 self.trades
+        """
+        order = self.orders.get(trade.order.orderId)
+        if order is None or order["dispatched"]: return
+        if trade.orderStatus.status not in ORDER_DONE_STATES: return
+        if len(order["reported"]) < len(trade.fills): return # 还有成交的佣金报告未到
+        if order["filled"] < trade.orderStatus.filled: return # 还有成交明细未到
+        order["dispatched"] = True
+        order["item"]["callback"](self, trade)
+        if self.orders.get(trade.order.orderId) is order:
+            self.remove_trade(order["item"])
         
     def get_redis(self):
         if not hasattr(self, '_redis'):
-            # 加载配置
-            with open(self.config_file, "r") as file:
-                config = yaml.safe_load(file)
-
-            redis_config = config.get("redis", {})
-            self._redis = redis.Redis(**redis_config)
+            self._redis = redis_client(self.config_file)
         return self._redis
     
+    @profiled("PositionManagerPlus.save")
     def save(self):
+        import dill
         redis_client = self.get_redis()
         data = {
             "positions": self.positions,
@@ -80,23 +201,59 @@ class PositionManager:
         redis_client.set(f"{self.strategy}_position_manager", dill.dumps(data))
         
     def restore(self):
+        import dill
         redis_client = self.get_redis()
         data = redis_client.get(f"{self.strategy}_position_manager")
         if data:
             data = dill.loads(data)
             self.positions  = data.get("positions", [])
-            self.trade_log  = data.get("trade_log", [])
+            self.trade_log  = data.get("trade_log", TradeLog())
+            if isinstance(self.trade_log, list): # 兼容旧版本保存的 list of dict
+                self.trade_log = TradeLog.from_records(self.trade_log)
             self.trades     = data.get("trades", [])
-            
-            complete_orders = self.ib.reqCompletedOrders(True)
-            for trade in complete_orders:
-                trade = self.find_trade_by_order_id(trade.order.orderId)
-                if trade: trade["callback"](self, trade)
+            self.track_orders()
+            self.reconcile_completed_orders()
+
+    def reconcile_completed_orders(self):
+        """
+        restore 后处理断线期间已经结束的订单
+
+        reqCompletedOrders 返回的订单没有成交明细（fills 为空、orderStatus.filled 为 0），直接分发会让 callback 当作没有成交，
+        开仓 / 平仓都不会记录。这里按 permId 从 reqExecutions 取回成交及佣金报告，补到跟踪中的订单上，
+        经 on_commission_report 累计，成交齐全后才分发；还查不到成交的订单继续跟踪，等待之后的推送
+        """
+        by_perm_id = {order["item"]["trade"].order.permId: order_id for order_id, order in self.orders.items()}
+        executions = {}
+        for fill in self.ib.reqExecutions():
+            executions.setdefault(fill.execution.permId, []).append(fill)
+
+        for completed in self.ib.reqCompletedOrders(True):
+            order_id = completed.order.orderId if completed.order.orderId in self.orders else by_perm_id.get(completed.order.permId)
+            if order_id is None: continue
+            trade = self.orders[order_id]["item"]["trade"]
+            fills = executions.get(completed.order.permId, [])
+            filled = completed.order.filledQuantity
+            if not 0 <= filled < UNSET_DOUBLE: # 未设置时以查到的成交为准
+                filled = sum(fill.execution.shares for fill in fills)
+            if filled > sum(fill.execution.shares for fill in fills): continue # 成交明细还不完整
+            if completed.orderStatus.status == "Filled" and not fills: continue
+
+            known = {fill.execution.execId for fill in trade.fills}
+            trade.fills.extend(fill for fill in fills if fill.execution.execId not in known)
+            trade.orderStatus.status = completed.orderStatus.status
+            trade.orderStatus.filled = filled
+            if fills:
+                trade.orderStatus.avgFillPrice = sum(fill.execution.shares * fill.execution.price for fill in fills) / sum(fill.execution.shares for fill in fills)
+            for fill in fills:
+                if fill.commissionReport.execId: # 佣金报告未到的成交由之后的 commissionReportEvent 补上
+                    self.on_commission_report(trade, fill, fill.commissionReport)
+            self.dispatch_if_done(trade)
             
     def clear_redis(self):
         redis_client = self.get_redis()
         redis_client.delete(f"{self.strategy}_position_manager")
         
+    @profiled("PositionManagerPlus.find_position")
     def find_position(self, is_match):
         """
             Fields in position:
@@ -129,6 +286,7 @@ class PositionManager:
     def remove_position(self, position):
         self.positions.remove(position)
 
+    @profiled("PositionManagerPlus.find_trade")
     def find_trade(self, is_match):
         """
             Fields in trade:包括但不限于
@@ -153,32 +311,62 @@ class PositionManager:
         """
         return next((item for item in self.trades if is_match(item)), None)
     
+    @profiled("PositionManagerPlus.find_trade_by_order_id")
     def find_trade_by_order_id(self, orderId):
-        is_match = lambda item: ( item["trade"].order.orderId == orderId )
-        return self.find_trade(is_match)
+        order = self.orders.get(orderId)
+        return order["item"] if order else None
         
     def add_trade(self, trade, strategy, open_or_close, date, callback):
-        self.trades.append({
+        item = {
             "trade": trade,
             "strategy": strategy, 
             "open_or_close": open_or_close, 
             "date": date, 
             "callback": callback
-        })
+        }
+        self.trades.append(item)
+        self.track_order(item)
+
+    def track_order(self, item):
+        """
+        Fields in order:
+            - item          self.trades 中对应的交易
+            - commission    已收到的佣金合计
+            - pnl           已实现盈亏合计
+            - filled        已成交数量
+            - reported      已收到佣金报告的 execId
+            - dispatched    callback 是否已调用
+        """
+        self.orders[item["trade"].order.orderId] = {
+            "item": item,
+            "commission": 0.0,
+            "pnl": 0.0,
+            "filled": 0.0,
+            "reported": set(),
+            "dispatched": False
+        }
+
+    def track_orders(self):
+        """
+        self.trades 整体替换后（restore 等）重建 orderId 索引
+        """
+        self.orders = {}
+        for item in self.trades:
+            self.track_order(item)
         
     def remove_trade(self, trade):
         self.trades.remove(trade)
+        self.orders.pop(trade["trade"].order.orderId, None)
     
     def remove_trade_by_order_id(self, orderId):
-        is_match = lambda item: ( item["trade"].order.orderId == orderId )
-        trade = self.find_trade(is_match)
+        trade = self.find_trade_by_order_id(orderId)
         self.remove_trade(trade)
         
     def log(self, contract, strategy, open_or_close, direction, price, amount, date, commission, pnl=None, reason=None):
         """
         记录交易信息
         """
-        self.trade_log.append({
+        record = {
             "date": date,
             "symbol": contract.symbol,
             "strategy": strategy,
@@ -189,12 +377,18 @@ class PositionManager:
             "commission": commission,
             "pnl": pnl,
             "reason": reason
-        })
+        }
+        self.trade_log.append(record)
+        for callback in self.logEvent:
+            callback(record)
         print(f'【{date}】【{strategy}】{open_or_close}: {contract.symbol}, 价格: {price}, 数量：{amount}，浮动盈亏：{pnl}, 原因：{reason}')
         if not self.debug: self.save()
 
     def open_position_LMT(self, contract, strategy, amount, price, bars, reason=None):
         if self.debug:
+            if self.replay:
+                self.add_pending_order(contract, strategy, "开仓", amount, price, reason=reason)
+                return False
             if amount != 0 and (bars.iloc[-1]["low"] <= price <= bars.iloc[-1]["high"]):
                 self.debug_open_position(contract, strategy, amount, price, bars.iloc[-1]['date'], reason=reason)
                 return True
@@ -202,8 +396,61 @@ class PositionManager:
         
     def close_position_LMT(self, position, price, bars, reason=None):
         if self.debug:
+            if self.replay:
+                self.add_pending_order(position["contract"], position["strategy"], "平仓", -1 * position["amount"], price, position=position, reason=reason)
+                return
             if (bars.iloc[-1]["low"] <= price <= bars.iloc[-1]["high"]):
                 self.debug_close_position(position, bars, reason=reason)
+    
+    def add_pending_order(self, contract, strategy, open_or_close, amount, price, position=None, reason=None):
+        """
+        tick 回放模式下挂限价单，同一合约、策略、开平类型只保留最新的一笔
+        """
+        if amount == 0: return
+        is_same = lambda order: (
+            order["contract"] == contract and
+            order["strategy"] == strategy and
+            order["open_or_close"] == open_or_close
+        )
+        self.pending_orders = [order for order in self.pending_orders if not is_same(order)]
+        self.pending_orders.append({
+            "contract": contract,
+            "strategy": strategy,
+            "open_or_close": open_or_close,
+            "amount": amount,
+            "price": price,
+            "position": position,
+            "reason": reason
+        })
+        
+    def match_pending_orders(self, contract, time_ns, price):
+        """
+        用新到达的一段 tick 撮合该合约的挂单，在第一笔满足条件的 tick 上成交
+        买单：tick 价格 <= 限价，按 min(限价, tick 价格) 成交；卖单：tick 价格 >= 限价，按 max(限价, tick 价格) 成交
+        与真实限价单一致，挂单时价格已经优于限价（如高于市价的买入限价）按 tick 价格成交
+        
+        Args:
+            time_ns: tick 时间（UTC 纳秒）数组
+            price: tick 价格数组
+        """
+        for order in [order for order in self.pending_orders if order["contract"] == contract]:
+            if order["amount"] > 0:
+                hits = np.flatnonzero(price <= order["price"])
+            else:
+                hits = np.flatnonzero(price >= order["price"])
+            if len(hits) == 0: continue
+            
+            self.pending_orders.remove(order)
+            date = pd.Timestamp(time_ns[hits[0]], tz='UTC').tz_convert('US/Eastern')
+            tick_price = float(price[hits[0]])
+            fill_price = min(order["price"], tick_price) if order["amount"] > 0 else max(order["price"], tick_price)
+            if order["open_or_close"] == "开仓":
+                self.debug_open_position(contract, order["strategy"], order["amount"], fill_price, date, reason=order["reason"])
+            elif order["position"] in self.positions:
+                self.debug_close_position(order["position"], None, reason=order["reason"], price=fill_price, date=date)
+    
+    def cancel_pending_orders(self):
+        self.pending_orders = []
                 
     def open_position(self, contract, strategy, amount, bars, reason=None, allow_repeat_order = False):
         if self.debug:
@@ -268,14 +515,19 @@ class PositionManager:
             if not self.find_trade(is_match):
                 self.ibkr_close_position(position, bars, reason=reason)
 
-    def debug_close_position(self, position, bars, reason=None):
+    def debug_close_position(self, position, bars, reason=None, price=None, date=None):
+        """
+        price/date 为空时按 bars 最后一根的收盘价和时间平仓
+        """
+        price = bars.iloc[-1]["close"] if price is None else price
+        date = bars.iloc[-1]["date"] if date is None else date
         close_amount = -1 * position["amount"]
         direction = "SELL" if close_amount < 0 else "BUY" # 因为要做反向操作
-        pnl = (bars.iloc[-1]["close"] - position["price"]) * position["amount"]
+        pnl = (price - position["price"]) * position["amount"]
         
         self.remove_position(position)
-        commission = abs(close_amount * bars.iloc[-1]["close"]) * TEST_COMMISSION_PERCENT
-        self.log(position["contract"], position["strategy"], "平仓", direction, bars.iloc[-1]["close"], close_amount, bars.iloc[-1]["date"], commission, pnl, reason=reason)  # 记录交易
+        commission = abs(close_amount * price) * TEST_COMMISSION_PERCENT
+        self.log(position["contract"], position["strategy"], "平仓", direction, price, close_amount, date, commission, pnl, reason=reason)  # 记录交易
         self.available_funds += abs(position["amount"] * position["price"]) + pnl - commission
             
     def ibkr_close_position(self, position, bars, reason=None):
@@ -338,6 +590,7 @@ class PositionManager:
        
     def ibkr_trade(self, contract, amount):
         assert amount != 0
+        from ib_insync import MarketOrder
         direction = 'BUY' if amount > 0 else 'SELL'
         order = MarketOrder(direction, abs(amount))
         order.outsideRth = True  # 允许在非常规交易时段执行
@@ -362,7 +615,8 @@ class PositionManager:
     
     def get_commission_and_pnl_from_fills(self, trade):
         """
-        df be like:
+        订单的佣金和已实现盈亏合计，由 on_commission_report 增量累计，不再每次由全部 fills 构造 DataFrame
+        trade.fills 中的佣金报告 be like:
             execId	                commission	currency	realizedPNL	yield_	yieldRedemptionDate
         0	00025b46.67b93a1f.01.01	1.0035	    USD	        -4.959198	0.0	    0
         1	00025b46.67b93a20.01.01	0.0035	    USD	        -3.959198	0.0	    0
@@ -371,9 +625,14 @@ class PositionManager:
         4	00025b46.67b93a2e.01.01	0.5035	    USD	        -4.459198	0.0	    0
         5	00025b46.67b93a2f.01.01	0.2014	    USD	        -1.783679	0.0	    0
         """
-        commissionReports = [fill.commissionReport for fill in trade.fills]
-        df = pd.DataFrame(commissionReports)
-        return df["commission"].sum(), df["realizedPNL"].sum()
+        order = self.orders.get(trade.order.orderId)
+        if order is not None and order["reported"]:
+            return order["commission"], order["pnl"]
+        # 没有经过 on_commission_report 累计的订单（如 restore 时的已完成订单），直接汇总 fills 中的佣金报告
+        reports = [fill.commissionReport for fill in trade.fills]
+        commission = sum(report.commission for report in reports)
+        pnl = sum(report.realizedPNL for report in reports if abs(report.realizedPNL) < UNSET_DOUBLE)
+        return commission, pnl
     
 
                         
\ No newline at end of file
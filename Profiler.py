@@ -0,0 +1,168 @@
+from functools import wraps
+from time import perf_counter_ns
+import pandas as pd
+
+SUB_BUCKET_BITS = 6 # 每个 2 的幂区间分 32 个桶，相对误差约 3%
+BUCKET_COUNT = 64 << (SUB_BUCKET_BITS - 1)
+
+_active = None # 当前正在分发 bar 的 Profiler，未启用时为 None
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数-线性延迟直方图（单位纳秒）
+    小于 2^SUB_BUCKET_BITS 的值逐一计数，之后每个 2 的幂区间均分为 2^(SUB_BUCKET_BITS-1) 个桶，
+    内存固定，记录为 O(1)，分位数的相对误差有上界。
+    """
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def bucket_index(value):
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0: return value
+        return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @staticmethod
+    def bucket_value(index):
+        """
+        桶的中间值
+        """
+        half = 1 << (SUB_BUCKET_BITS - 1)
+        if index < 2 * half: return index
+        shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+        mantissa = index - (shift << (SUB_BUCKET_BITS - 1))
+        return (mantissa << shift) + (1 << shift) // 2
+
+    def record(self, value):
+        self.counts[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min: self.min = value
+        if value > self.max: self.max = value
+
+    def percentile(self, pct):
+        if self.count == 0: return 0
+        target = max(1, round(self.count * pct / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+def profiled(name):
+    """
+    标记需要计时的策略环节，只有在 Profiler 分发 bar 期间才计时，
+    未启用时只多一次函数调用和一次全局变量判断。
+
+    e.g.
+    @profiled("Structure.prepare_data")
+    def prepare_data(self, bars): ...
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None: return func(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(name, perf_counter_ns() - start)
+        return wrapper
+    return decorator
+
+class Profiler:
+    """
+    bar 处理延迟统计
+
+    - 按 (环节, 合约) 记录延迟直方图：每个 onBarUpdateEvent 回调、整根 bar 的处理，以及 @profiled 标记的环节
+    - 单根 bar 处理时间超过 budget_ms 时记入 slow_bars
+    - report() 输出当日汇总并清空，BacktestApp 在 afterMarketCloseEvent 中调用
+
+    e.g.
+    app = MyBacktestApp(config_file="config_backtest.yml", debug=True, profile=True, latency_budget_ms=50)
+    """
+    def __init__(self, budget_ms=100):
+        self.budget_ns = int(budget_ms * 1_000_000)
+        self.reset()
+
+    def reset(self):
+        self.histograms = {}
+        self.slow_bars = []
+        self.symbol = None
+
+    def record(self, name, elapsed_ns, symbol=None):
+        key = (name, symbol or self.symbol)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record(elapsed_ns)
+
+    def dispatch(self, callbacks, contract, bars, has_new_bar):
+        """
+        依次调用 callbacks(contract, bars, has_new_bar)，分别计时
+        实盘订阅时可作为 updateEvent 的回调：partial(profiler.dispatch, [self.on_bar_update], contract)
+        """
+        global _active
+        previous, _active = _active, self
+        self.symbol = contract.symbol
+        try:
+            bar_start = perf_counter_ns()
+            for callback in callbacks:
+                start = perf_counter_ns()
+                callback(contract, bars, has_new_bar)
+                self.record(callback_name(callback), perf_counter_ns() - start)
+            elapsed = perf_counter_ns() - bar_start
+            self.record("bar", elapsed)
+            if elapsed > self.budget_ns:
+                self.slow_bars.append({"symbol": contract.symbol, "date": last_bar_date(bars), "elapsed_ms": elapsed / 1e6})
+        finally:
+            _active = previous
+            self.symbol = None
+
+    def summary(self):
+        """
+        每个 (环节, 合约) 一行，延迟单位为毫秒
+        """
+        rows = []
+        for (name, symbol), histogram in self.histograms.items():
+            rows.append({
+                "stage": name,
+                "symbol": symbol,
+                "count": histogram.count,
+                "mean_ms": histogram.mean / 1e6,
+                "p50_ms": histogram.percentile(50) / 1e6,
+                "p90_ms": histogram.percentile(90) / 1e6,
+                "p99_ms": histogram.percentile(99) / 1e6,
+                "max_ms": histogram.max / 1e6,
+                "total_ms": histogram.total / 1e6,
+            })
+        columns = ["stage", "symbol", "count", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms", "total_ms"]
+        return pd.DataFrame(rows, columns=columns).sort_values("total_ms", ascending=False, ignore_index=True)
+
+    def report(self, date=None):
+        summary = self.summary()
+        print(f'【{date}】bar 处理延迟统计，超出预算 {self.budget_ns / 1e6:g}ms 的 bar: {len(self.slow_bars)}')
+        if not summary.empty:
+            print(summary.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        slow_bars = self.slow_bars
+        self.reset()
+        return summary, slow_bars
+
+def callback_name(callback):
+    func = getattr(callback, "func", callback) # functools.partial
+    return getattr(func, "__qualname__", repr(func))
+
+def last_bar_date(bars):
+    if isinstance(bars, pd.DataFrame):
+        return bars.iloc[-1]["date"] if len(bars) else None
+    return bars[-1].date if len(bars) else None
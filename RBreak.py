@@ -1,34 +1,53 @@
 import pandas as pd
 from PositionManagerPlus import PositionManager
+from utils import get_market_open_time
 STOP_LOSS_PERCENT = 0.02
 
 class RBreak:
-    def __init__(self, ib, contract, pm: PositionManager):
+    """
+    每个合约常驻一个 RBreak 对象：
+    - 六个枢轴价位每个交易日只计算一次（前一日日线优先取自 daily，其次才请求 IB）
+    - 日内最高/最低价随 bar 增量更新，不再每根 bar 对整个 bars 求 max/min
+    - open_position_price 跨 bar 保留
+
+    Args:
+        daily: 可选，日线 DataFrame（date 列为日期），回测时传入避免请求 IB
+    """
+    def __init__(self, ib, contract, pm: PositionManager, daily=None):
         self.ib = ib
         self.contract = contract
         self.pm = pm
+        self.daily = daily
         
         self.open_position_price = None
         self.debug = True
         self.output_log = False
         
+        self.session_date = None
+        self.session_first = 0 # 当日第一根 bar 在 bars 中的位置
+        self.session_high = None
+        self.session_low = None
+        self.seen_bars = 0 # 已计入日内高低点的 bar 数量
+        
     def setParams(self, df=None, date=None):
         """
         Args:
-            df: 日线的OHLC
+            df: 前一交易日日线的OHLC
+            date: 当前交易日，df 为空时向 IB 请求 date 之前最近一个交易日的日线
         """
         if df is None:
+            # endDateTime 取当日开盘时间：直接传 date 时 ib_insync 按当日 23:59:59 请求，会拿到当日未走完的日线
             bars = self.ib.reqHistoricalData(
                 self.contract,
-                endDateTime=date,  # 指定日期（美东时间）
-                durationStr='1 D',  # 仅获取1天数据
+                endDateTime=get_market_open_time(date),  # 当日开盘（美东时间）之前
+                durationStr='5 D',  # 覆盖周末和节假日
                 barSizeSetting='1 day',  # 日线
                 whatToShow='TRADES',  # 成交价
                 useRTH=1,  # 仅常规交易时间
                 formatDate=1
             )
             df = pd.DataFrame(bars)
-            df = df.iloc[0]
+            df = df[pd.to_datetime(df['date']).dt.date < date].iloc[-1]
         high = df['high']  # 前一日的最高价
         low = df['low']  # 前一日的最低价
         close = df['close']  # 前一日的收盘价
@@ -41,6 +60,34 @@ class RBreak:
         self.bSetup = pivot - (high - low)  # 观察买入价
         self.sBreak = low - 2 * (high - pivot)  # 突破卖出价
     
+    def prior_daily_bar(self, date):
+        """
+        date 之前最近一个交易日的日线，daily 中没有时返回 None
+        """
+        if self.daily is None: return None
+        prior = self.daily[pd.to_datetime(self.daily['date']).dt.date < date]
+        return prior.iloc[-1] if len(prior) else None
+    
+    def update_session(self, bars):
+        """
+        新交易日开始时计算枢轴价位，之后只把新增（及进行中）的 bar 计入日内高低点
+        """
+        date = pd.Timestamp(bars.iloc[-1]["date"]).date()
+        if date != self.session_date or len(bars) < self.seen_bars:
+            self.setParams(self.prior_daily_bar(date), date=date)
+            self.session_date = date
+            self.session_high = self.session_low = None
+            # bars 中可能还带着前一交易日的 bar，只统计当日部分
+            self.session_first = int((pd.to_datetime(bars['date']).dt.date < date).sum())
+            self.seen_bars = self.session_first
+        
+        # 上一次的最后一根可能是进行中的 bar，重新计入
+        new_bars = bars.iloc[max(self.seen_bars - 1, self.session_first):]
+        high, low = new_bars['high'].max(), new_bars['low'].min()
+        self.session_high = high if self.session_high is None else max(self.session_high, high)
+        self.session_low = low if self.session_low is None else min(self.session_low, low)
+        self.seen_bars = len(bars)
+        
     def calculate_open_amount(self, bars):
         # net_liquidation, available_funds = self.get_available_funds()
         if self.pm.net_liquidation is None or self.pm.available_funds is None:
@@ -65,6 +112,7 @@ class RBreak:
         return self.pm.find_position(is_match)
                 
     def update(self, bars):
+        self.update_session(bars)
         # 获取现有持仓
         position_long   = self.find_position("BUY")
         position_short  = self.find_position("SELL")
@@ -85,6 +133,8 @@ class RBreak:
                 self.open_position_price = bars.iloc[-1]["close"]
         # 设置止损条件
         else:  # 有持仓时
+            if self.open_position_price is None: # 重启后从 PositionManager 恢复的持仓
+                self.open_position_price = (position_long or position_short)["price"]
             change_percent = (bars.iloc[-1]["close"] - self.open_position_price) / self.open_position_price
             # 开仓价与当前行情价之差大于止损点则止损
             if (position_long and change_percent <= -1 * STOP_LOSS_PERCENT) or \
@@ -98,7 +148,7 @@ class RBreak:
                     position_short = None
             # 反转策略:
             if position_long:  # 多仓条件下
-                if bars['high'].max() > self.sSetup and bars.iloc[-1]["close"] < self.sEnter:
+                if self.session_high > self.sSetup and bars.iloc[-1]["close"] < self.sEnter:
                     # 多头持仓,当日内最高价超过观察卖出价后，
                     # 盘中价格出现回落，且进一步跌破反转卖出价构成的支撑线时，
                     # 采取反转策略，即在该点位反手做空
@@ -109,7 +159,7 @@ class RBreak:
                     if self.output_log: print(f"{bars.iloc[-1]['date']}多头持仓,当日内最高价超过观察卖出价后跌破反转卖出价: 反手做空")
                     self.open_position_price = bars.iloc[-1]["close"]
             elif position_short:  # 空头持仓
-                if bars['low'].min() < self.bSetup and bars.iloc[-1]["close"] > self.bEnter:
+                if self.session_low < self.bSetup and bars.iloc[-1]["close"] > self.bEnter:
                     # 空头持仓，当日内最低价低于观察买入价后，
                     # 盘中价格出现反弹，且进一步超过反转买入价构成的阻力线时，
                     # 采取反转策略，即在该点位反手做多
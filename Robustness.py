@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+from BacktestMetrics import TRADING_DAYS
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+def closed_trade_pnls(trade_log):
+    """
+    每笔完整交易（开仓到平仓）扣除开平手续费后的盈亏，按平仓时间排序
+
+    trade_log 可以是 TradeLog、list of dict 或 DataFrame；同一 (symbol, strategy) 下，
+    从上一次平仓之后到本次平仓之间的开仓记录归入本次交易，尚未平仓的交易不计入
+    """
+    if hasattr(trade_log, "to_frame"):
+        df = trade_log.to_frame()
+    else:
+        df = trade_log if isinstance(trade_log, pd.DataFrame) else pd.DataFrame(list(trade_log))
+    if len(df) == 0:
+        return np.empty(0)
+    df = df.reset_index(drop=True)
+    keys = [df["symbol"].astype(object), df["strategy"].astype(object)]
+    is_close = (df["open_or_close"] == "平仓").to_numpy()
+    # 平仓记录及其之前的开仓记录属于同一笔交易
+    trade_no = pd.Series(is_close).groupby(keys).cumsum().to_numpy() - is_close
+    df = df.assign(is_close=is_close, pnl=df["pnl"].astype(float).fillna(0.0))
+    grouped = df.groupby(keys + [trade_no], sort=False)
+    trades = pd.DataFrame({
+        "closed": grouped["is_close"].any(),
+        "pnl": grouped["pnl"].sum(),
+        "commission": grouped["commission"].sum(),
+        "close_at": grouped["date"].max(),
+    })
+    trades = trades[trades["closed"]].sort_values("close_at", kind="stable")
+    return (trades["pnl"] - trades["commission"]).to_numpy(dtype=float)
+
+def daily_returns(daily_net_liquidation):
+    """
+    BacktestApp.daily_net_liquidation 的日收益率，与 MetricsAccumulator 的口径一致
+    """
+    net_liquidation = np.array([day["net_liquidation"] for day in daily_net_liquidation], dtype=float)
+    return net_liquidation[1:] / net_liquidation[:-1] - 1
+
+def max_drawdowns(equity):
+    """
+    每一行为一条净值曲线，返回每行的最大回撤 (peak - equity) / peak
+    """
+    peak = np.maximum.accumulate(equity, axis=1)
+    return ((peak - equity) / peak).max(axis=1)
+
+def sharpe_ratios(returns, risk_free_rate=0.035):
+    """
+    每一行为一组日收益率，年化方式与 MetricsAccumulator.sharpe_ratio 一致，波动率为 0 时为 NaN
+    """
+    volatility = returns.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = (returns.mean(axis=1) * TRADING_DAYS - risk_free_rate) / volatility
+    return np.where(volatility > 0, sharpe, np.nan)
+
+def chunks(n, chunk_size):
+    for start in range(0, n, chunk_size):
+        yield min(chunk_size, n - start)
+
+def permute_trades(pnls, initial_capital, n=10000, chunk_size=2000, seed=None):
+    """
+    交易顺序的蒙特卡洛置换：打乱每笔交易的先后顺序，重新累加净值曲线
+    总盈亏、胜率、盈亏比不随顺序变化，变化的是路径相关的指标，这里返回最大回撤的分布
+
+    每次生成 chunk_size 条路径（chunk_size x 交易笔数的矩阵），内存占用与 n 无关
+    """
+    pnls = np.asarray(pnls, dtype=float)
+    rng = np.random.default_rng(seed)
+    result = np.empty(n)
+    done = 0
+    for size in chunks(n, chunk_size):
+        shuffled = rng.permuted(np.broadcast_to(pnls, (size, len(pnls))), axis=1)
+        equity = np.empty((size, len(pnls) + 1))
+        equity[:, 0] = initial_capital
+        np.cumsum(shuffled, axis=1, out=equity[:, 1:])
+        equity[:, 1:] += initial_capital
+        result[done:done + size] = max_drawdowns(equity)
+        done += size
+    return {"max_drawdown": result}
+
+def block_bootstrap(returns, n=10000, block_size=5, chunk_size=2000, seed=None, risk_free_rate=0.035):
+    """
+    日收益率的循环块自助法（circular block bootstrap）：
+    随机抽取长度为 block_size 的连续区间首尾相接，拼成与原序列等长的新序列，保留短期的自相关和波动聚集
+
+    返回 {"sharpe_ratio", "max_drawdown", "cumulative_return"} 各 n 个样本
+    """
+    returns = np.asarray(returns, dtype=float)
+    length = len(returns)
+    block_size = max(1, min(block_size, length))
+    n_blocks = -(-length // block_size)
+    offsets = np.arange(block_size)
+    rng = np.random.default_rng(seed)
+    result = {key: np.empty(n) for key in ("sharpe_ratio", "max_drawdown", "cumulative_return")}
+    done = 0
+    for size in chunks(n, chunk_size):
+        starts = rng.integers(0, length, size=(size, n_blocks))
+        index = ((starts[:, :, None] + offsets) % length).reshape(size, -1)[:, :length]
+        sample = returns[index]
+        equity = np.ones((size, length + 1))
+        np.cumprod(1 + sample, axis=1, out=equity[:, 1:])
+        result["sharpe_ratio"][done:done + size] = sharpe_ratios(sample, risk_free_rate)
+        result["max_drawdown"][done:done + size] = max_drawdowns(equity)
+        result["cumulative_return"][done:done + size] = equity[:, -1] - 1
+        done += size
+    return result
+
+def summarize(samples, actual=None, quantiles=QUANTILES):
+    """
+    {指标: 样本} -> DataFrame，每行一个指标：均值、分位数，以及实际回测值和它在样本中的分位（样本中不大于实际值的比例）
+    """
+    rows = {}
+    for name, values in samples.items():
+        values = values[~np.isnan(values)]
+        row = {"mean": values.mean() if len(values) else np.nan}
+        row.update({f"q{int(q * 100):02d}": np.quantile(values, q) if len(values) else np.nan for q in quantiles})
+        if actual is not None and name in actual:
+            row["actual"] = actual[name]
+            row["percentile"] = (values <= actual[name]).mean() if len(values) else np.nan
+        rows[name] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+def analyze(trade_log, daily_net_liquidation, initial_capital=None, n=10000, block_size=5, chunk_size=2000, seed=None, risk_free_rate=0.035):
+    """
+    回测结果的稳健性分析，statistic() 只给出点估计，这里给出分布
+
+    - 交易置换：打乱交易顺序后的最大回撤分布（trades.max_drawdown）
+    - 块自助法：日收益率重抽样后的夏普比率、最大回撤、累计收益分布（daily.*）
+
+    e.g.
+    Robustness.analyze(ba.pm.trade_log, ba.daily_net_liquidation, ba.initial_capital)
+    """
+    returns = daily_returns(daily_net_liquidation)
+    if initial_capital is None:
+        initial_capital = daily_net_liquidation[0]["net_liquidation"]
+    frames = []
+
+    pnls = closed_trade_pnls(trade_log)
+    if len(pnls) > 1:
+        equity = (initial_capital + np.concatenate([[0.0], np.cumsum(pnls)]))[None, :]
+        samples = permute_trades(pnls, initial_capital, n, chunk_size, seed)
+        frames.append(summarize(samples, {"max_drawdown": max_drawdowns(equity)[0]}).rename(index=lambda name: f"trades.{name}"))
+
+    if len(returns) > 1:
+        equity = np.concatenate([[1.0], np.cumprod(1 + returns)])[None, :]
+        actual = {
+            "sharpe_ratio": sharpe_ratios(returns[None, :], risk_free_rate)[0],
+            "max_drawdown": max_drawdowns(equity)[0],
+            "cumulative_return": equity[0, -1] - 1,
+        }
+        samples = block_bootstrap(returns, n, block_size, chunk_size, seed, risk_free_rate)
+        frames.append(summarize(samples, actual).rename(index=lambda name: f"daily.{name}"))
+    return pd.concat(frames) if frames else pd.DataFrame()
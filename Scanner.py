@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+
+from Trend import MONOTONIC_THRESHOLD
+
+BLOCK_STATS = 6 # 每个 block 记录的统计量：close 最高/最低、DIF 最高/最低、DIF 之和、block_type 之和
+CLOSE_MAX, CLOSE_MIN, DIF_MAX, DIF_MIN, DIF_SUM, TYPE_SUM = range(BLOCK_STATS)
+BLOCK_HISTORY = 6 # 当前 block 及之前 5 个，StructureReserve.cal 最远比较 block_id - 4
+
+class Scanner:
+    """
+    横截面扫描：所有合约的分钟线按 (合约 × 分钟) 存放为二维数组，每分钟一次向量化计算全部合约的指标，
+    只有触发筛选条件的合约才交给逐合约的策略逻辑（例如 StructureReserve）
+
+    每分钟增量计算：
+    - MACD：DIF / DEA / MACD 按 EMA 递推（与 utils.macd 中 pandas ewm(adjust=False) 的补全方式一致，
+      talib 以 SMA 作为初值，预热若干根之后两者的差异可以忽略）；
+      MACD 红绿柱划分 block，单柱 block 并入前一个 block（同 Structure.process_blocks），
+      记录当前及之前 5 个 block 的 close / DIF 极值，用于背离的预筛选
+    - VWAP 面积：area = (close - vwap) / vwap 累加，同 Trend.cal
+    - ChandelierExit：ATR 与 period 根最高/最低价，递推方式同 ChandelierExit.update
+
+    e.g.
+    scanner = Scanner(symbols)
+    scanner.add_screen("divergence", Scanner.divergence_candidates, handler)  # handler(symbol, scanner, date)
+    scanner.step(date, close, high, low, volume, open_)  # 每分钟一次，数组按 symbols 的顺序，缺失为 NaN
+    """
+    def __init__(self, symbols, capacity=960, fastperiod=12, slowperiod=26, signalperiod=9,
+                 chandelier_period=22, chandelier_k=3.0, monotonic_threshold=MONOTONIC_THRESHOLD):
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.alpha_fast = 2 / (fastperiod + 1)
+        self.alpha_slow = 2 / (slowperiod + 1)
+        self.alpha_signal = 2 / (signalperiod + 1)
+        self.chandelier_period = chandelier_period
+        self.chandelier_k = chandelier_k
+        self.monotonic_threshold = monotonic_threshold
+        self.screens = [] # [(name, predicate, handler)]
+
+        n = len(self.symbols)
+        self.open = np.full((n, capacity), np.nan)
+        self.close = np.full((n, capacity), np.nan)
+        self.high = np.full((n, capacity), np.nan)
+        self.low = np.full((n, capacity), np.nan)
+        self.volume = np.full((n, capacity), np.nan)
+        self.dates = []
+        self.reset_day()
+
+    def reset_day(self):
+        """
+        新交易日开始前调用，清空分钟线和所有递推状态
+        """
+        n = len(self.symbols)
+        self.open[:] = np.nan
+        self.close[:] = np.nan
+        self.high[:] = np.nan
+        self.low[:] = np.nan
+        self.volume[:] = np.nan
+        self.dates = []
+        self.count = np.zeros(n, dtype=np.int64) # 每个合约已有的 bar 数
+
+        # MACD
+        self.ema_fast = np.full(n, np.nan)
+        self.ema_slow = np.full(n, np.nan)
+        self.dif = np.full(n, np.nan)
+        self.dea = np.full(n, np.nan)
+        self.macd = np.full(n, np.nan)
+        self.block_type = np.zeros(n, dtype=np.int8)
+        self.block_len = np.zeros(n, dtype=np.int64)
+        self.block_count = np.zeros(n, dtype=np.int64)
+        # blocks[:, 0] 当前 block，blocks[:, k] 往前第 k 个
+        self.blocks = np.full((n, BLOCK_HISTORY, BLOCK_STATS), np.nan)
+
+        # VWAP
+        self.turnover = np.zeros(n)
+        self.cum_volume = np.zeros(n)
+        self.vwap = np.full(n, np.nan)
+        self.area_sum = np.zeros(n)
+
+        # ChandelierExit
+        self.prev_close = np.full(n, np.nan)
+        self.atr = np.full(n, np.nan)
+        self.high_window = np.full((n, self.chandelier_period), np.nan)
+        self.low_window = np.full((n, self.chandelier_period), np.nan)
+        self.chandelier_long = np.full(n, np.nan)
+        self.chandelier_short = np.full(n, np.nan)
+
+    def add_screen(self, name, predicate, handler=None):
+        """
+        Args:
+            predicate: predicate(scanner) -> 长度为合约数的 bool 数组
+            handler: handler(symbol, scanner, date)，对触发的每个合约调用
+        """
+        self.screens.append((name, predicate, handler))
+
+    def grow(self):
+        for name in ['open', 'close', 'high', 'low', 'volume']:
+            array = getattr(self, name)
+            grown = np.full((array.shape[0], array.shape[1] * 2), np.nan)
+            grown[:, :array.shape[1]] = array
+            setattr(self, name, grown)
+
+    def step(self, date, close, high, low, volume, open_=None):
+        """
+        写入一分钟的 bar 并更新所有合约的指标，然后执行筛选
+
+        Args:
+            close / high / low / volume / open_: 按 symbols 顺序的数组，该分钟没有 bar 的合约为 NaN
+
+        Returns:
+            dict: 筛选名 -> 触发的合约列表
+        """
+        t = len(self.dates)
+        if t >= self.close.shape[1]:
+            self.grow()
+        self.dates.append(date)
+        close = np.asarray(close, dtype=np.float64)
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        volume = np.asarray(volume, dtype=np.float64)
+        self.open[:, t] = np.nan if open_ is None else open_
+        self.close[:, t] = close
+        self.high[:, t] = high
+        self.low[:, t] = low
+        self.volume[:, t] = volume
+
+        valid = ~np.isnan(close)
+        self.count += valid
+        self.update_macd(valid, close)
+        self.update_vwap(valid, close, volume)
+        self.update_chandelier(valid, close, high, low)
+
+        fired = {}
+        for name, predicate, handler in self.screens:
+            symbols = [self.symbols[i] for i in np.flatnonzero(predicate(self) & valid)]
+            fired[name] = symbols
+            if handler:
+                for symbol in symbols:
+                    handler(symbol, self, date)
+        return fired
+
+    def update_macd(self, valid, close):
+        first = valid & np.isnan(self.ema_fast)
+        self.ema_fast = np.where(first, close, np.where(valid, self.ema_fast + self.alpha_fast * (close - self.ema_fast), self.ema_fast))
+        self.ema_slow = np.where(first, close, np.where(valid, self.ema_slow + self.alpha_slow * (close - self.ema_slow), self.ema_slow))
+        dif = self.ema_fast - self.ema_slow
+        self.dea = np.where(first, dif, np.where(valid, self.dea + self.alpha_signal * (dif - self.dea), self.dea))
+        self.dif = dif
+        self.macd = np.where(valid, dif - self.dea, self.macd)
+
+        block_type = np.where(self.macd >= 0, 1, -1).astype(np.int8)
+        flip = valid & (self.block_len > 0) & (block_type != self.block_type)
+        # 单柱 block 并入前一个 block；否则当前 block 结束，历史后移
+        merge = flip & (self.block_len == 1) & (self.block_count > 1)
+        shift = flip & ~merge
+        if merge.any():
+            current, previous = self.blocks[merge, 0], self.blocks[merge, 1]
+            self.blocks[merge, 1] = self.combine(previous, current)
+        if shift.any():
+            self.blocks[shift, 1:] = self.blocks[shift, :-1]
+            self.block_count += shift
+        start = valid & ((self.block_len == 0) | flip)
+        self.block_count += valid & (self.block_len == 0)
+        self.blocks[start, 0] = np.nan
+        self.blocks[start, 0, DIF_SUM] = 0
+        self.blocks[start, 0, TYPE_SUM] = 0
+        self.block_len = np.where(start, 1, self.block_len + valid)
+        self.block_type = np.where(valid, block_type, self.block_type)
+
+        current = self.blocks[:, 0]
+        rows = np.flatnonzero(valid)
+        current[rows, CLOSE_MAX] = np.fmax(current[rows, CLOSE_MAX], close[rows])
+        current[rows, CLOSE_MIN] = np.fmin(current[rows, CLOSE_MIN], close[rows])
+        current[rows, DIF_MAX] = np.fmax(current[rows, DIF_MAX], dif[rows])
+        current[rows, DIF_MIN] = np.fmin(current[rows, DIF_MIN], dif[rows])
+        current[rows, DIF_SUM] += dif[rows]
+        current[rows, TYPE_SUM] += block_type[rows]
+
+    @staticmethod
+    def combine(a, b):
+        combined = a.copy()
+        combined[:, CLOSE_MAX] = np.fmax(a[:, CLOSE_MAX], b[:, CLOSE_MAX])
+        combined[:, CLOSE_MIN] = np.fmin(a[:, CLOSE_MIN], b[:, CLOSE_MIN])
+        combined[:, DIF_MAX] = np.fmax(a[:, DIF_MAX], b[:, DIF_MAX])
+        combined[:, DIF_MIN] = np.fmin(a[:, DIF_MIN], b[:, DIF_MIN])
+        combined[:, DIF_SUM] = a[:, DIF_SUM] + b[:, DIF_SUM]
+        combined[:, TYPE_SUM] = a[:, TYPE_SUM] + b[:, TYPE_SUM]
+        return combined
+
+    def update_vwap(self, valid, close, volume):
+        self.turnover += np.where(valid, close * volume, 0)
+        self.cum_volume += np.where(valid, volume, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.vwap = np.where(self.cum_volume > 0, self.turnover / self.cum_volume, self.vwap)
+            self.area_sum += np.where(valid, (close - self.vwap) / self.vwap, 0)
+
+    def update_chandelier(self, valid, close, high, low):
+        tr = np.where(np.isnan(self.prev_close), high - low,
+                      np.fmax(high - low, np.fmax(np.abs(high - self.prev_close), np.abs(low - self.prev_close))))
+        period = self.chandelier_period
+        self.atr = np.where(valid, np.where(np.isnan(self.atr), tr, (self.atr * (period - 1) + tr) / period), self.atr)
+        self.prev_close = np.where(valid, close, self.prev_close)
+
+        rows = np.flatnonzero(valid)
+        position = (self.count[rows] - 1) % period
+        self.high_window[rows, position] = high[rows]
+        self.low_window[rows, position] = low[rows]
+        full = self.count >= period
+        self.chandelier_long = np.where(full, self.high_window.max(axis=1) - self.chandelier_k * self.atr, np.nan)
+        self.chandelier_short = np.where(full, self.low_window.min(axis=1) + self.chandelier_k * self.atr, np.nan)
+
+    # ---------------------------------------------------------------- 常用筛选条件
+
+    def effective_blocks(self):
+        """
+        按 Structure.process_blocks 的方式看到的 block：当前 block 只有一根时并入前一个 block
+        返回 (blocks, block_id)，blocks[:, 0] 为当前 block，blocks[:, k] 为 block_id - k
+        """
+        single = (self.block_len == 1) & (self.block_count > 1)
+        blocks = self.blocks.copy()
+        if single.any():
+            blocks[single, 0] = self.combine(self.blocks[single, 1], self.blocks[single, 0])
+            blocks[single, 1:-1] = self.blocks[single, 2:]
+            blocks[single, -1] = np.nan
+        return blocks, self.block_count - single
+
+    @staticmethod
+    def divergence(current, earlier):
+        """
+        StructureReserve.compare_block 的向量化版本（不含 angle）
+        """
+        with np.errstate(invalid='ignore'):
+            top = (current[:, TYPE_SUM] >= 1) & (current[:, DIF_SUM] > 0) & \
+                  (current[:, CLOSE_MAX] > earlier[:, CLOSE_MAX]) & (current[:, DIF_MAX] < earlier[:, DIF_MAX])
+            bottom = (current[:, TYPE_SUM] <= -1) & (current[:, DIF_SUM] < 0) & \
+                     (current[:, CLOSE_MIN] < earlier[:, CLOSE_MIN]) & (current[:, DIF_MIN] > earlier[:, DIF_MIN])
+        return top | bottom
+
+    @staticmethod
+    def divergence_candidates(scanner):
+        """
+        背离预筛选（StructureReserve.cal 去掉 angle 条件）：
+        当前 block 与 block_id - 2 比较，block_id > 4 时再与 block_id - 4 比较；
+        红柱股价新高而 DIF 未新高且 DIF 在零轴上方，或绿柱股价新低而 DIF 未新低且 DIF 在零轴下方
+        """
+        blocks, block_id = scanner.effective_blocks()
+        current = blocks[:, 0]
+        return ((block_id >= 3) & Scanner.divergence(current, blocks[:, 2])) | \
+               ((block_id > 4) & Scanner.divergence(current, blocks[:, 4]))
+
+    @staticmethod
+    def monotonic(scanner):
+        """
+        Trend.cal 的单边判断：abs(area_sum) > MONOTONIC_THRESHOLD * bar 数
+        """
+        return np.abs(scanner.area_sum) > scanner.monotonic_threshold * np.maximum(scanner.count, 1)
+
+    @staticmethod
+    def chandelier_exit(scanner):
+        """
+        收盘价跌破多头止损线或升破空头止损线
+        """
+        t = len(scanner.dates) - 1
+        close = scanner.close[:, t]
+        with np.errstate(invalid='ignore'):
+            return (close < scanner.chandelier_long) | (close > scanner.chandelier_short)
+
+    # ---------------------------------------------------------------- 逐合约读取
+
+    def bars(self, symbol):
+        """
+        合约当日的分钟线，供触发后的逐合约策略使用
+        """
+        i = self.index[symbol]
+        t = len(self.dates)
+        df = pd.DataFrame({
+            'date': self.dates,
+            'open': self.open[i, :t],
+            'high': self.high[i, :t],
+            'low': self.low[i, :t],
+            'close': self.close[i, :t],
+            'volume': self.volume[i, :t],
+        })
+        return df[~np.isnan(self.close[i, :t])].reset_index(drop=True)
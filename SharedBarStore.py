@@ -0,0 +1,187 @@
+import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+def attach_shared_memory(name):
+    """
+    以只读使用方式挂载已有的共享内存
+    worker 不登记到 resource_tracker，避免 worker 退出时把主进程创建的共享内存 unlink 掉
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        # 3.13 之前没有 track 参数；worker 与主进程共用同一个 resource_tracker，
+        # 先登记再注销会把主进程的登记一并删除，这里挂载期间直接跳过登记
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+def encode_dates(column):
+    """
+    date 列编码为 int64，返回 (values, kind, tz, unit)，unit 为原始的时间精度，读取时还原
+    - kind == 'tz': 带时区的时间，values 为 UTC 纳秒
+    - kind == 'naive': 无时区的时间，values 为纳秒
+    - kind == 'date': datetime.date（日线），values 为当日 0 点的纳秒
+    """
+    if len(column) and not isinstance(column.dtype, pd.DatetimeTZDtype) and not pd.api.types.is_datetime64_dtype(column):
+        first = column.iloc[0]
+        if isinstance(first, datetime.date) and not isinstance(first, datetime.datetime):
+            return pd.to_datetime(column).dt.as_unit('ns').to_numpy().view(np.int64), 'date', None, 'ns'
+        column = pd.to_datetime(column)
+    column = pd.Series(column)
+    if len(column) == 0:
+        return np.empty(0, dtype=np.int64), 'naive', None, 'ns'
+    tz = column.dt.tz
+    unit = column.dt.unit
+    values = column.dt.as_unit('ns')
+    if tz is not None:
+        values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+    return values.to_numpy().view(np.int64), ('tz' if tz is not None else 'naive'), (str(tz) if tz is not None else None), unit
+
+def decode_dates(values, kind, tz, unit='ns'):
+    dates = pd.Series(values.astype('datetime64[ns]', copy=True)).dt.as_unit(unit)
+    if kind == 'tz':
+        return dates.dt.tz_localize('UTC').dt.tz_convert(tz)
+    if kind == 'date':
+        return dates.dt.date
+    return dates
+
+class SharedBarStore:
+    """
+    把整个回测区间的 bar 放进一块 multiprocessing.shared_memory，供进程池 worker 零拷贝挂载
+
+    - 所有 (合约, 交易日) 的 bar 按列首尾相接存放：date 为 int64，其余数值列各自保持 dtype
+    - index: key -> (起始行, 结束行, 列, date 类型, 时区, 时间精度)，key 与 BacktestApp.bar_cache / redis key 一致
+    - 提供与 bar_cache 相同的 dict 接口（in / [] / 赋值），可直接赋给 BacktestApp.bar_cache
+      读取时只把对应交易日的切片构造成 DataFrame，整个区间的数据在所有 worker 之间只有一份
+    - 对象 pickle 时只携带共享内存的名字和 index，子进程反序列化时自动挂载
+
+    e.g.
+    bar_cache = app.preload_bars("20250221", "200 D")
+    with SharedBarStore.from_cache(bar_cache) as store:
+        with ProcessPoolExecutor(initializer=init_worker, initargs=(store,)) as executor:
+            ...
+    """
+    def __init__(self, shm, layout, rows, index, owner=False):
+        self.shm = shm
+        self.layout = layout # column -> (字节偏移, dtype)
+        self.rows = rows
+        self.index = index
+        self.owner = owner
+        self.local = {} # 挂载之后新加入的 bar（未命中时由 get_historical_data 写入），只在本进程可见
+        self.arrays = {
+            column: np.ndarray((self.rows,), dtype=dtype, buffer=shm.buf, offset=offset)
+            for column, (offset, dtype) in layout.items()
+        }
+        if not owner:
+            for array in self.arrays.values():
+                array.flags.writeable = False
+
+    @classmethod
+    def from_cache(cls, bar_cache):
+        """
+        由 {key: DataFrame} 创建共享内存，通常是 BacktestApp.preload_bars 的返回值
+        """
+        frames = {key: df for key, df in bar_cache.items() if len(df) > 0}
+        dtypes = {}
+        for df in frames.values():
+            for column in df.columns:
+                if column == 'date': continue
+                if not pd.api.types.is_numeric_dtype(df[column]):
+                    raise ValueError(f"SharedBarStore 只支持数值列，{column} 的类型为 {df[column].dtype}")
+                dtype = np.dtype(df[column].dtype)
+                dtypes[column] = np.result_type(dtypes[column], dtype) if column in dtypes else dtype
+        dtypes = {'date': np.dtype(np.int64), **dtypes}
+
+        rows = sum(len(df) for df in frames.values())
+        layout, offset = {}, 0
+        for column, dtype in dtypes.items():
+            offset = -(-offset // dtype.alignment) * dtype.alignment
+            layout[column] = (offset, dtype)
+            offset += rows * dtype.itemsize
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        store = cls(shm, layout, rows, {}, owner=True)
+        start = 0
+        for key, df in frames.items():
+            stop = start + len(df)
+            dates, kind, tz, unit = encode_dates(df['date'])
+            store.arrays['date'][start:stop] = dates
+            for column in df.columns:
+                if column == 'date': continue
+                store.arrays[column][start:stop] = df[column].to_numpy()
+            store.index[key] = (start, stop, list(df.columns), kind, tz, unit)
+            start = stop
+        return store
+
+    @classmethod
+    def attach(cls, name, layout, rows, index):
+        return cls(attach_shared_memory(name), layout, rows, index)
+
+    def __reduce__(self):
+        return (SharedBarStore.attach, (self.shm.name, self.layout, self.rows, self.index))
+
+    # ---------------------------------------------------------------- dict 接口
+
+    def __contains__(self, key):
+        return key in self.index or key in self.local
+
+    def __getitem__(self, key):
+        if key in self.local:
+            return self.local[key]
+        start, stop, columns, kind, tz, unit = self.index[key]
+        data = {}
+        for column in columns:
+            if column == 'date':
+                data[column] = decode_dates(self.arrays['date'][start:stop], kind, tz, unit)
+            else:
+                data[column] = self.arrays[column][start:stop]
+        return pd.DataFrame(data, columns=columns)
+
+    def __setitem__(self, key, value):
+        self.local[key] = value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return list(self.index) + [key for key in self.local if key not in self.index]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return ((key, self[key]) for key in self)
+
+    # ---------------------------------------------------------------- 生命周期
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+
+    def unlink(self):
+        """
+        释放共享内存，只应由创建者在所有 worker 结束后调用
+        """
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.unlink()
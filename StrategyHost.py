@@ -0,0 +1,185 @@
+import traceback
+from time import perf_counter_ns
+import pandas as pd
+
+from TradeApp import TradeApp
+from TickAggregator import BAR_COLUMNS
+from BarResampler import BarResampler, source_rows
+
+class BarFrame:
+    """
+    把 keepUpToDate 的 BarDataList（回测中为逐根增长的 DataFrame）增量转换为 DataFrame
+    每次更新只重写最后一根（进行中的 bar）并追加新 bar，不再对整个列表做 pd.DataFrame(bars)
+    """
+    def __init__(self):
+        self.columns = {column: [] for column in BAR_COLUMNS}
+        self.cached_frame = None
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+    def update(self, bars):
+        n = len(self)
+        # 重新订阅等情况下列表变短，整体重建
+        start = max(n - 1, 0) if len(bars) >= n else 0
+        for values in self.columns.values():
+            del values[start:]
+        # source_rows 的列顺序与 BAR_COLUMNS 一致
+        for values, new_values in zip(self.columns.values(), zip(*source_rows(bars, start))):
+            values.extend(new_values)
+        self.cached_frame = None
+        return self.frame()
+
+    def frame(self):
+        """
+        DataFrame 在下一次 update 之前缓存复用，使用方不应修改
+        """
+        if self.cached_frame is None:
+            df = pd.DataFrame(self.columns, columns=BAR_COLUMNS)
+            df['date'] = pd.to_datetime(df['date'])
+            self.cached_frame = df
+        return self.cached_frame
+
+SOURCE_BAR_SIZE = '1 min' # subscribe_to_bars 订阅的周期
+
+class StrategyHost(TradeApp):
+    """
+    一个 IB 连接、一个 PositionManager 承载多个策略
+    每个合约只订阅一次行情，bar 更新转换为 DataFrame 后分发给所有注册在该合约上的策略。
+
+    - add_strategy: 注册无状态的处理函数 handler(contract, bars, has_new_bar, host)
+    - add_per_contract: 每个合约创建一个常驻策略对象 factory(contract, host)，每次更新调用其 update(bars)
+      （CommonTrade 子类、RBreak 等）
+    - bar_size: 策略可以运行在任意周期上（'5 mins'、'15 mins' 等），由同一条 1 分钟订阅经 BarResampler 增量合成
+    - shared: 同一次更新内共享的指标计算，多个策略（例如不同参数的 StructureReserve）只算一次
+    - 成交记录经 PositionManager.logEvent 按策略累计，strategy_accounts() 查看各策略的盈亏与手续费
+    - PositionManager 按持仓 / 订单上的策略名区分各策略，策略下单时必须使用注册时的名字（host.current_strategy），
+      否则同一个类的多个配置会互相看到、平掉对方的持仓，盈亏也会合并在一起；注册名不能重复
+
+    e.g.
+    host = StrategyHost(port=7497)
+    host.add_strategy("Structure", structure_reserve_handler(angle=0.02))
+    host.add_strategy("Structure5m", structure_reserve_handler(angle=0.02), bar_size='5 mins')
+    host.add_per_contract("MyCommonTrade", lambda contract, host: MyCommonTrade(contract, host.pm, {"chandelier_exit": True}, strategy=host.current_strategy))
+    host.subscribe_to_bars()
+    """
+    def __init__(self, config_file="config.yml", **kwargs):
+        super().__init__(config_file=config_file, **kwargs)
+        self.strategies = [] # {"name", "handler", "symbols", "new_bar_only"}
+        self.routes = None   # symbol -> [strategy]，首次分发时按 symbols 生成
+        self.instances = {}  # (策略名, symbol) -> 常驻策略对象
+        self.bar_frames = {} # symbol -> BarFrame
+        self.resampler = BarResampler() # 1 分钟以外的周期
+        self.views = {}      # symbol -> {bar_size: (BarFrame / ResampledBars, has_new_bar)}，本次更新各周期的 bar
+        self.current_bar_size = SOURCE_BAR_SIZE
+        self.current_strategy = None # 正在运行的策略的注册名
+        self.shared_cache = {}
+        self.accounts = {}   # 策略名 -> {"trades", "pnl", "commission"}
+        if hasattr(self, "pm"):
+            self.pm.logEvent.append(self.on_trade_log)
+
+    def add_strategy(self, name, handler, symbols=None, new_bar_only=True, bar_size=SOURCE_BAR_SIZE):
+        """
+        Args:
+            handler: handler(contract, bars, has_new_bar, host)
+            symbols: 只在这些合约上运行，None 表示所有订阅的合约
+            new_bar_only: 只在该周期出现新 bar 时调用
+            bar_size: 策略使用的 bar 周期
+        """
+        if any(strategy["name"] == name for strategy in self.strategies):
+            raise ValueError(f"策略名 {name} 已注册，各策略的持仓和盈亏按名字区分，不能重名")
+        if bar_size != SOURCE_BAR_SIZE:
+            self.resampler.add_bar_size(bar_size)
+        self.strategies.append({"name": name, "handler": handler, "symbols": symbols, "new_bar_only": new_bar_only, "bar_size": bar_size})
+        self.routes = None
+
+    def add_per_contract(self, name, factory, symbols=None, new_bar_only=True, bar_size=SOURCE_BAR_SIZE):
+        """
+        Args:
+            factory: factory(contract, host) -> 含 update(bars) 方法的策略对象，每个合约创建一次并常驻
+        """
+        def handler(contract, bars, has_new_bar, host):
+            key = (name, contract.symbol)
+            if key not in self.instances:
+                self.instances[key] = factory(contract, host)
+            self.instances[key].update(bars)
+        self.add_strategy(name, handler, symbols, new_bar_only, bar_size)
+
+    def build_routes(self):
+        self.routes = {
+            contract.symbol: [strategy for strategy in self.strategies if strategy["symbols"] is None or contract.symbol in strategy["symbols"]]
+            for contract in self.contracts
+        }
+
+    def shared(self, contract, key, func):
+        """
+        本次更新内按 (合约, 当前策略的周期, key) 缓存 func(bars) 的结果，供多个策略复用
+        返回值在策略之间共享，使用方不应修改
+        """
+        cache = self.shared_cache.setdefault(contract.symbol, {})
+        cache_key = (self.current_bar_size, key)
+        if cache_key not in cache:
+            cache[cache_key] = func(self.views[contract.symbol][self.current_bar_size][0].frame())
+        return cache[cache_key]
+
+    def on_bar_update(self, contract, bars, has_new_bar):
+        if self.routes is None: self.build_routes()
+        strategies = self.routes.get(contract.symbol)
+        if not strategies: return
+        if not has_new_bar and all(strategy["new_bar_only"] for strategy in strategies): return
+
+        frame = self.bar_frames.setdefault(contract.symbol, BarFrame())
+        frame.update(bars)
+        views = {SOURCE_BAR_SIZE: (frame, has_new_bar)}
+        if self.resampler.bar_sizes:
+            views.update(self.resampler.update(contract, bars, has_new_bar))
+        self.views[contract.symbol] = views
+        self.shared_cache[contract.symbol] = {}
+        for strategy in strategies:
+            series, has_new = views[strategy["bar_size"]]
+            if strategy["new_bar_only"] and not has_new: continue
+            self.current_bar_size = strategy["bar_size"]
+            self.current_strategy = strategy["name"]
+            start = perf_counter_ns()
+            try:
+                # 每个策略拿到独立的副本，避免一个策略添加/修改的列影响其他策略
+                strategy["handler"](contract, series.frame().copy(), has_new, self)
+            except Exception as e:
+                print(f'【{contract.symbol}】【{strategy["name"]}】策略出错: {e}')
+                traceback.print_exc()
+                # 回测 / debug 模式下直接抛出，出错的策略不能悄无声息地变成"没有交易"；实盘只跳过该策略，不影响其他策略
+                if not hasattr(self, "pm") or self.pm.debug: raise
+            finally:
+                if self.profiler:
+                    self.profiler.record(f'strategy:{strategy["name"]}', perf_counter_ns() - start)
+
+    def on_trade_log(self, record):
+        account = self.accounts.setdefault(record["strategy"], {"trades": 0, "pnl": 0.0, "commission": 0.0})
+        account["trades"] += 1
+        account["commission"] += record["commission"]
+        if record["pnl"] is not None:
+            account["pnl"] += record["pnl"]
+
+    def strategy_accounts(self):
+        """
+        各策略的成交次数、已实现盈亏、手续费和当前持仓数
+        """
+        df = pd.DataFrame.from_dict(self.accounts, orient="index", columns=["trades", "pnl", "commission"])
+        open_positions = pd.Series([position["strategy"] for position in self.pm.positions], dtype=object).value_counts()
+        df["open_positions"] = open_positions.reindex(df.index).fillna(0).astype(int)
+        df["net_pnl"] = df["pnl"] - df["commission"]
+        return df
+
+def structure_reserve_handler(**params):
+    """
+    StructureReserve 的处理函数，prepare_data 的结果在同一次更新内由所有 StructureReserve 策略共享
+    下单和查找持仓使用注册时的策略名，多个配置各自管理自己的持仓
+    """
+    from StructureReserve import StructureReserve
+
+    def handler(contract, bars, has_new_bar, host):
+        structure = StructureReserve(strategy=host.current_strategy, **params)
+        structure.data = host.shared(contract, "StructureReserve.prepare_data", lambda df: StructureReserve().prepare_data(df)).copy()
+        structure.has_prepare_data = True
+        structure.update(contract, structure.data, host.pm)
+    return handler
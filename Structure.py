@@ -1,20 +1,22 @@
 import pandas as pd
 
-from utils import macd, is_within_30_minutes_of_close
+from utils import macd, is_within_30_minutes_of_close, rank_scale, causal_rank_scale
+from Profiler import profiled
 
 from datetime import timedelta
-from sklearn.preprocessing import QuantileTransformer
 
 ANGLE = 0.015
 SCALED_BANDS = 0.07
 DISPEAR_ANGLE = 0.02
 
 class Structure:
-    def __init__(self):
+    def __init__(self, strategy="Structure"):
+        self.strategy = strategy # 下单、查找持仓时使用的策略名
         self.has_prepare_data = False
         self.data = None
         self.relative_blocks = {}
         
+    @profiled("Structure.prepare_data")
     def prepare_data(self, bars):
         if self.has_prepare_data: return self.data
         if not isinstance(bars, pd.DataFrame):
@@ -34,6 +36,7 @@ class Structure:
 
         return self.relative_blocks[id]
     
+    @profiled("Structure.cal")
     def cal(self, bars):
         if not self.has_prepare_data: self.prepare_data(bars)
         df = self.data
@@ -113,10 +116,11 @@ class Structure:
     def find_position(self, contract, pm):
         is_match = lambda item: (
             item["contract"] == contract and
-            item["strategy"] == "Structure"
+            item["strategy"] == self.strategy
         )
         return pm.find_position(is_match)
         
+    @profiled("Structure.update")
     def update(self, contract, bars, pm):
         signal = self.cal(bars)
         
@@ -124,14 +128,14 @@ class Structure:
             if signal and not is_within_30_minutes_of_close(bars):
                 direction = 1 if signal == "底背离" else -1
                 amount = direction * pm.calculate_open_amount(bars)
-                pm.open_position(contract, "Structure", amount, bars)
+                pm.open_position(contract, self.strategy, amount, bars)
         else:
             position = self.find_position(contract, pm)
             # 如果有仓位，检查是否发出平仓信号
             exit_signal = self.cal_exit_signal(bars, position["amount"], position["price"], position["date"])
             
             if exit_signal and not signal:
-                pm.close_position(contract, "Structure", bars)
+                pm.close_position(contract, self.strategy, bars)
                 
             if exit_signal and signal:
                 exit_amount = position["amount"] * -1 # 这是退出的数量及方向
@@ -142,8 +146,8 @@ class Structure:
                     raise(f"【{bars.iloc[-1]['date']}】【{contract.symbol}】同时收到开仓和平仓信号，且方向不一致")
                 else:
                     print(f"【{bars.iloc[-1]['date']}】【{contract.symbol}】平仓+开仓")
-                    pm.close_position(contract, "Structure", bars)
-                    pm.open_position(contract, "Structure", open_amount, bars)
+                    pm.close_position(contract, self.strategy, bars)
+                    pm.open_position(contract, self.strategy, open_amount, bars)
     
 def get_prev_blockID(df, block_id):
     """
@@ -160,12 +164,13 @@ def get_prev_blockID(df, block_id):
         if not prev_block.empty:
             return prev_block_id
 
-def process_blocks(df):
+def process_blocks(df, causal=False):
     """
     根据df['macd']生成连续的block并合并单柱block。
 
     Args:
         df (pd.DataFrame): 包含`macd`列的DataFrame。
+        causal (bool): DIF/DEA 归一化只使用每根 bar 之前的数据
 
     Returns:
         pd.DataFrame: 增加了`block_type`和`block_id`列的DataFrame。
@@ -190,14 +195,12 @@ def process_blocks(df):
     df['block_id'] = df.groupby('block_id').ngroup() + 1
     
     # 对DIF归一化处理，缩放到[-1,1]之间，便于计算angle
-    n_quantiles = min(len(df), 1000)  # 设置最大值为1000，避免过大的量
-    scaler = QuantileTransformer(output_distribution='uniform', n_quantiles=n_quantiles)
-    quantile_scaled = scaler.fit_transform(df[["DIF"]])
-    df["DIF_scaled"] = 2 * quantile_scaled - 1
+    # causal=True 时每根 bar 只按之前的数据排序，避免使用未来数据
+    scale = causal_rank_scale if causal else rank_scale
+    df["DIF_scaled"] = scale(df["DIF"])
     df["angle"] = df["DIF_scaled"].diff()
 
-    quantile_scaled = scaler.fit_transform(df[["DEA"]])
-    df["DEA_scaled"] = 2 * quantile_scaled - 1
+    df["DEA_scaled"] = scale(df["DEA"])
     
     return df
 
@@ -1,5 +1,6 @@
 from Structure import Structure
 from utils import is_within_30_minutes_of_close
+from Profiler import profiled
 from datetime import timedelta
 
 class StructureReserve(Structure):
@@ -18,6 +19,7 @@ class StructureReserve(Structure):
         self.max_loss       = max_loss
         self.max_profit     = max_profit
         
+    @profiled("StructureReserve.cal")
     def cal(self, bars):
         df = self.prepare_data(bars)
         
@@ -111,14 +113,14 @@ class StructureReserve(Structure):
             # 查找是否有开仓且日期为同一天的仓位
             is_match = lambda item: (
                 item["contract"] == contract and
-                item["strategy"] == "Structure" and
+                item["strategy"] == self.strategy and
                 item["date"].date() == current_date  # 确保是同一天
             )
             return pm.find_position(is_match)
         else:
             is_match = lambda item: (
                 item["contract"] == contract and
-                item["strategy"] == "Structure"
+                item["strategy"] == self.strategy
             )
             return pm.find_position(is_match)
         
@@ -127,11 +129,12 @@ class StructureReserve(Structure):
         else:
             is_match = lambda item: (
                 item["trade"].contract == contract and
-                item["strategy"] == "Structure" and
+                item["strategy"] == self.strategy and
                 item["open_or_close"] == open_or_close
             )
             return pm.find_trade(is_match)
         
+    @profiled("StructureReserve.update")
     def update(self, contract, bars, pm):
         signal = self.cal(bars)
         position = self.find_position(contract, pm, bars)
@@ -141,7 +144,7 @@ class StructureReserve(Structure):
                 direction = -1 if signal == "底背离" else 1 # 反转direction
                 amount = direction * pm.calculate_open_amount(bars)
                 if amount != 0:
-                    pm.open_position(contract, "Structure", amount, bars)
+                    pm.open_position(contract, self.strategy, amount, bars)
         else:
             # 平仓信号，因为持仓是反向的，所以此处对amount取反
             exit_signal = self.cal_exit_signal(bars, -1 * position["amount"], position["price"], position["date"])
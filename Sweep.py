@@ -0,0 +1,122 @@
+import math
+import itertools
+import numpy as np
+import pandas as pd
+
+def param_grid(param_names, param_values):
+    """
+    生成参数组合，与 notebooks/params-analyze.ipynb 中 run_backtest 的写法一致
+    e.g. param_grid(['angle', 'dispear_angle'], [[0.005, 0.01], [0.005, 0.01]])
+    """
+    return [dict(zip(param_names, values)) for values in itertools.product(*param_values)]
+
+def score_summary(summary, metric="sharpe_ratio"):
+    """
+    把 statistic 的指标转成分数，越大越好；无法计算的指标（样本不足、波动率为0）排在最后
+    """
+    value = summary[metric]
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return -math.inf
+    return -value if metric == "max_drawdown" else value
+
+class SuccessiveHalvingSweep:
+    """
+    参数扫描的分段淘汰（successive halving）
+
+    回测区间按交易日切成 n_chunks 段，每跑完一段，按 metric 给仍在运行的参数组合排名，
+    只保留前 keep_ratio 的组合进入下一段；最大回撤超过 max_drawdown_limit 的组合直接淘汰。
+    保留下来的组合继续使用同一个 app 对象，策略和 PositionManager 的状态延续上一段，不从头重跑。
+
+    e.g.
+    sweep = SuccessiveHalvingSweep(
+        lambda params: StructureReserveBacktestApp(config_file="../config_backtest.yml", debug=True, params=params),
+        param_grid(['angle', 'dispear_angle'], [np.arange(0.005, 0.035, 0.005), np.arange(0.005, 0.015, 0.005)]),
+        "20250221", "200 D", pre_process_bar_callback=pre_process_bar_callback)
+    df = sweep.run()
+    """
+    def __init__(self, app_factory, params_list, end_date, durationStr='100 D', n_chunks=4, keep_ratio=0.5,
+                 metric="sharpe_ratio", max_drawdown_limit=None, min_survivors=1, risk_free_rate=0.035,
+                 pre_process_bar_callback=None, barSizeSetting='1 min', from_ticks=False):
+        """
+        Args:
+            app_factory: params -> BacktestApp
+            metric: 排名依据，"sharpe_ratio"（越大越好）或 "max_drawdown"（越小越好）
+            max_drawdown_limit: 最大回撤上限，超过即淘汰，None 表示不限制
+        """
+        if metric not in ("sharpe_ratio", "max_drawdown"):
+            raise ValueError(f"不支持的 metric: {metric}")
+        self.app_factory = app_factory
+        self.params_list = list(params_list)
+        self.end_date = end_date
+        self.durationStr = durationStr
+        self.n_chunks = n_chunks
+        self.keep_ratio = keep_ratio
+        self.metric = metric
+        self.max_drawdown_limit = max_drawdown_limit
+        self.min_survivors = min_survivors
+        self.risk_free_rate = risk_free_rate
+        self.pre_process_bar_callback = pre_process_bar_callback
+        self.barSizeSetting = barSizeSetting
+        self.from_ticks = from_ticks
+
+        self.apps = []
+        self.rounds = []       # 每个组合跑完的段数
+        self.stopped_at = []   # 每个组合最后回测的交易日
+
+    def score(self, app):
+        return score_summary(app.metrics.summary(self.risk_free_rate), self.metric)
+
+    def prune(self, alive):
+        """
+        返回进入下一段的组合下标
+        """
+        if self.max_drawdown_limit is not None:
+            survivors = [i for i in alive if self.apps[i].metrics.max_drawdown <= self.max_drawdown_limit]
+        else:
+            survivors = list(alive)
+        keep = max(self.min_survivors, math.ceil(len(alive) * self.keep_ratio))
+        # 稳定排序，分数相同时保留原顺序
+        survivors.sort(key=lambda i: self.score(self.apps[i]), reverse=True)
+        return sorted(survivors[:keep])
+
+    def run(self):
+        self.apps = [self.app_factory(params) for params in self.params_list]
+        self.rounds = [0] * len(self.apps)
+        self.stopped_at = [None] * len(self.apps)
+        if not self.apps: return self.results()
+
+        # 所有组合读取同一批 bar，共用一份进程内缓存
+        bar_cache = self.apps[0].bar_cache if self.apps[0].bar_cache is not None else {}
+        for app in self.apps:
+            app.bar_cache = bar_cache
+        daily = self.apps[0].get_backtest_calendar(self.end_date, self.durationStr)
+        for app in self.apps[1:]:
+            app.minute_daily = daily.copy()
+        chunks = [chunk for chunk in np.array_split(np.arange(len(daily)), self.n_chunks) if len(chunk) > 0]
+
+        alive = list(range(len(self.apps)))
+        for n, chunk in enumerate(chunks):
+            for i in alive:
+                for row in chunk:
+                    date = daily.iloc[row]["date"]
+                    self.apps[i].backtest_day(date, self.pre_process_bar_callback, self.barSizeSetting, self.from_ticks)
+                    self.stopped_at[i] = date
+                self.rounds[i] += 1
+            if n < len(chunks) - 1:
+                alive = self.prune(alive)
+                if not alive: break
+        return self.results()
+
+    def results(self):
+        """
+        每个参数组合一行：参数、完成段数、最后回测日期以及 statistic 指标
+        """
+        rows = []
+        for i, params in enumerate(self.params_list):
+            row = dict(params)
+            row["rounds"] = self.rounds[i] if i < len(self.rounds) else 0
+            row["stopped_at"] = self.stopped_at[i] if i < len(self.stopped_at) else None
+            if i < len(self.apps):
+                row.update(self.apps[i].statistic(self.risk_free_rate))
+            rows.append(row)
+        return pd.DataFrame(rows)
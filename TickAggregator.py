@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytz
+
+from utils import get_market_open_time
+
+BAR_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount']
+
+BAR_SIZE_UNITS = {
+    'sec': 1_000_000_000,
+    'secs': 1_000_000_000,
+    'min': 60_000_000_000,
+    'mins': 60_000_000_000,
+    'hour': 3600_000_000_000,
+    'hours': 3600_000_000_000,
+}
+
+def parse_bar_size(bar_size):
+    """
+    将 IB 风格的 barSizeSetting 转为纳秒
+    e.g. '5 secs' / '1 min' / '3 mins' / '1 hour'
+    """
+    count, unit = bar_size.split()
+    if unit not in BAR_SIZE_UNITS:
+        raise ValueError(f"不支持的 bar_size: {bar_size}")
+    return int(count) * BAR_SIZE_UNITS[unit]
+
+def tick_arrays(ticks):
+    """
+    统一 tick 输入为 (time_ns, price, size) 三个 numpy 数组
+    支持 TickStore.read_arrays 的结果，以及 get_historical_ticks（size 列）或 read_offline_tick（volume 列）返回的 DataFrame
+    """
+    if isinstance(ticks, dict):
+        return ticks['time'], ticks['price'], ticks['size']
+    size_column = 'size' if 'size' in ticks.columns else 'volume'
+    time = pd.to_datetime(ticks['time'])
+    if time.dt.tz is None:
+        time = time.dt.tz_localize(pytz.timezone('US/Eastern'))
+    time_ns = time.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    return time_ns, ticks['price'].to_numpy(dtype=np.float64), ticks[size_column].to_numpy(dtype=np.float64)
+
+def aggregate_groups(time_ns, price, size, group_ids, bar_time_ns=None):
+    """
+    按已排序的 group_ids 一次性聚合为 OHLCV bar
+    group_ids 需单调不减，同一 bar 的 tick 连续
+
+    Args:
+        bar_time_ns: 与 tick 等长，每笔 tick 所属 bar 的时间（UTC 纳秒），为空时取 bar 内第一笔 tick 的时间
+    """
+    eastern = pytz.timezone('US/Eastern')
+    if len(time_ns) == 0:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(group_ids)) + 1))
+    ends = np.concatenate((starts[1:], [len(price)]))
+
+    volume = np.add.reduceat(size, starts)
+    turnover = np.add.reduceat(price * size, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(volume > 0, turnover / volume, price[starts])
+
+    if bar_time_ns is None:
+        bar_time_ns = time_ns
+
+    return pd.DataFrame({
+        'date': pd.to_datetime(bar_time_ns[starts], utc=True).tz_convert(eastern),
+        'open': price[starts],
+        'high': np.maximum.reduceat(price, starts),
+        'low': np.minimum.reduceat(price, starts),
+        'close': price[ends - 1],
+        'volume': volume,
+        'average': average,
+        'barCount': ends - starts,
+    })
+
+def time_bars(ticks, bar_size='1 min', anchor=None):
+    """
+    按固定时间周期聚合 tick
+
+    Args:
+        bar_size: IB 风格周期，例如 '5 secs' / '1 min' / '3 mins'
+        anchor: bar 对齐的起点，默认为当日开盘时间 09:30
+    """
+    time_ns, price, size = tick_arrays(ticks)
+    if len(time_ns) == 0:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+
+    interval = parse_bar_size(bar_size)
+    if anchor is None:
+        anchor = get_market_open_time(pd.Timestamp(time_ns[0], tz='UTC').tz_convert('US/Eastern').date())
+    anchor_ns = pd.Timestamp(anchor).value
+
+    group_ids = (time_ns - anchor_ns) // interval
+    bar_time_ns = anchor_ns + group_ids * interval
+    return aggregate_groups(time_ns, price, size, group_ids, bar_time_ns)
+
+def volume_bars(ticks, volume_per_bar):
+    """
+    每累计 volume_per_bar 股成交生成一个 bar，bar 时间为 bar 内第一笔 tick 的时间
+    """
+    time_ns, price, size = tick_arrays(ticks)
+    # 以 tick 之前的累计成交量分组，保证每个 bar 在达到阈值的那一笔 tick 处结束
+    group_ids = (np.cumsum(size) - size) // volume_per_bar
+    return aggregate_groups(time_ns, price, size, group_ids)
+
+def dollar_bars(ticks, dollar_per_bar):
+    """
+    每累计 dollar_per_bar 成交额生成一个 bar，bar 时间为 bar 内第一笔 tick 的时间
+    """
+    time_ns, price, size = tick_arrays(ticks)
+    turnover = price * size
+    group_ids = (np.cumsum(turnover) - turnover) // dollar_per_bar
+    return aggregate_groups(time_ns, price, size, group_ids)
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytz
+
+from utils import get_market_open_time
+from TickAggregator import BAR_COLUMNS, tick_arrays, parse_bar_size
+
+class TickReplay:
+    """
+    将单个合约一天的 tick 还原为 keepUpToDate 节奏的 bar 更新
+
+    tick 按 update_interval 切成更新段（IB 的 keepUpToDate 大约每 5 秒推送一次），
+    每个更新段结束时产生一次 bar 更新：已完成的 bar + 截至该段最后一笔 tick 的进行中 bar。
+    新 bar 的第一次更新 has_new_bar 为 True，其余为 False。
+
+    所有更新段的 OHLCV 都在构造时一次性向量化算好，回放时只做切片。
+
+    e.g.
+    replay = TickReplay(ticks, '1 min', '5 secs')
+    for k in range(len(replay)):
+        bars, has_new_bar = replay.bars(k)
+    """
+    def __init__(self, ticks, bar_size='1 min', update_interval='5 secs', anchor=None):
+        self.time_ns, self.price, self.size = tick_arrays(ticks)
+        bar_interval = parse_bar_size(bar_size)
+        update_ns = parse_bar_size(update_interval)
+        if bar_interval % update_ns != 0:
+            raise ValueError(f"update_interval({update_interval}) 需要能整除 bar_size({bar_size})")
+
+        if len(self.time_ns) == 0:
+            self.segment_starts = np.array([], dtype=np.int64)
+            self.segment_ends = np.array([], dtype=np.int64)
+            self.segment_time_ns = np.array([], dtype=np.int64)
+            self.live = {column: np.array([]) for column in BAR_COLUMNS}
+            return
+
+        if anchor is None:
+            anchor = get_market_open_time(pd.Timestamp(self.time_ns[0], tz='UTC').tz_convert('US/Eastern').date())
+        anchor_ns = pd.Timestamp(anchor).value
+
+        # 更新段：每段都落在同一个 bar 内
+        update_ids = (self.time_ns - anchor_ns) // update_ns
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(update_ids)) + 1))
+        ends = np.concatenate((starts[1:], [len(self.price)]))
+        self.segment_starts, self.segment_ends = starts, ends
+        self.segment_time_ns = self.time_ns[ends - 1]
+
+        # 每段所属的 bar，以及该段是否为 bar 的第一段
+        segment_bar_ids = (self.time_ns[starts] - anchor_ns) // bar_interval
+        self.segment_is_new_bar = np.concatenate(([True], np.diff(segment_bar_ids) != 0))
+        self.segment_bar_index = np.cumsum(self.segment_is_new_bar) - 1
+
+        # 段内聚合
+        price, size = self.price, self.size
+        self.segment_high = np.maximum.reduceat(price, starts)
+        self.segment_low = np.minimum.reduceat(price, starts)
+        segment_volume = np.add.reduceat(size, starts)
+        segment_turnover = np.add.reduceat(price * size, starts)
+        segment_count = ends - starts
+
+        # 段累计到所属 bar 内，得到每次更新时进行中 bar 的状态
+        by_bar = pd.Series(self.segment_bar_index)
+        self.bar_high = pd.Series(self.segment_high).groupby(by_bar).cummax().to_numpy()
+        self.bar_low = pd.Series(self.segment_low).groupby(by_bar).cummin().to_numpy()
+        self.bar_volume = pd.Series(segment_volume).groupby(by_bar).cumsum().to_numpy()
+        bar_turnover = pd.Series(segment_turnover).groupby(by_bar).cumsum().to_numpy()
+        self.bar_count = pd.Series(segment_count).groupby(by_bar).cumsum().to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.bar_average = np.where(self.bar_volume > 0, bar_turnover / self.bar_volume, price[ends - 1])
+        self.bar_close = price[ends - 1]
+
+        # 完整 bar 的 open 与时间
+        bar_first_segment = np.flatnonzero(self.segment_is_new_bar)
+        eastern = pytz.timezone('US/Eastern')
+        bar_dates = pd.to_datetime(anchor_ns + segment_bar_ids[bar_first_segment] * bar_interval, utc=True).tz_convert(eastern)
+        bar_last_segment = np.concatenate((bar_first_segment[1:], [len(starts)])) - 1
+
+        # 回放时复用的列数组，已完成 bar 取最终值，进行中 bar 在 bars() 中就地覆盖
+        self.live = {
+            'date': bar_dates,
+            'open': price[starts[bar_first_segment]],
+            'high': self.bar_high[bar_last_segment],
+            'low': self.bar_low[bar_last_segment],
+            'close': self.bar_close[bar_last_segment],
+            'volume': self.bar_volume[bar_last_segment],
+            'average': self.bar_average[bar_last_segment],
+            'barCount': self.bar_count[bar_last_segment],
+        }
+
+    def __len__(self):
+        return len(self.segment_starts)
+
+    def segment_ticks(self, k):
+        """
+        第 k 个更新段内的 tick：(time_ns, price)
+        """
+        start, end = self.segment_starts[k], self.segment_ends[k]
+        return self.time_ns[start:end], self.price[start:end]
+
+    def bars(self, k):
+        """
+        第 k 次更新时的 bars 和 has_new_bar
+        """
+        b = self.segment_bar_index[k]
+        data = {column: values[:b + 1] for column, values in self.live.items() if column != 'date'}
+        # 最后一行替换为进行中 bar 的状态
+        for column, values in (('high', self.bar_high), ('low', self.bar_low), ('close', self.bar_close),
+                               ('volume', self.bar_volume), ('average', self.bar_average), ('barCount', self.bar_count)):
+            data[column] = data[column].copy()
+            data[column][b] = values[k]
+        bars = pd.DataFrame({'date': self.live['date'][:b + 1], **data}, columns=BAR_COLUMNS)
+        return bars, bool(self.segment_is_new_bar[k])
@@ -0,0 +1,110 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+import pytz
+
+from utils import normalized_time
+
+TICK_COLUMNS = ['time', 'price', 'size']
+
+class TickStore:
+    """
+    列式 tick 存储
+    每个合约每个交易日一个 npz 文件，列为：
+        time:  int64，UTC 纳秒时间戳
+        price: float64
+        size:  float64
+
+    下载过程中以时间切片为单位落盘，断线后重新下载时已完成的切片不再请求：
+        {root}/{symbol}/{YYYYMMDD}.npz                      完整交易日
+        {root}/{symbol}/{YYYYMMDD}/{start_ns}_{end_ns}.npz  未合并的切片
+
+    e.g.
+    store = TickStore("tick_store")
+    if store.has_day("NVDA", "2025-02-03"):
+        ticks = store.read("NVDA", "2025-02-03")
+    """
+    def __init__(self, root="tick_store"):
+        self.root = root
+        self.eastern = pytz.timezone('US/Eastern')
+
+    @staticmethod
+    def date_key(date):
+        return normalized_time(date).strftime('%Y%m%d')
+
+    def day_path(self, symbol, date):
+        return os.path.join(self.root, symbol, f"{self.date_key(date)}.npz")
+
+    def slice_dir(self, symbol, date):
+        return os.path.join(self.root, symbol, self.date_key(date))
+
+    def has_day(self, symbol, date):
+        return os.path.exists(self.day_path(symbol, date))
+
+    def _save(self, path, time, price, size):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，断线或进程被杀时不会留下半个文件
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     time=np.asarray(time, dtype=np.int64),
+                     price=np.asarray(price, dtype=np.float64),
+                     size=np.asarray(size, dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    def write_slice(self, symbol, date, start_ns, end_ns, time, price, size):
+        """
+        写入一个已完整下载的时间切片 [start_ns, end_ns)
+        """
+        path = os.path.join(self.slice_dir(symbol, date), f"{int(start_ns)}_{int(end_ns)}.npz")
+        self._save(path, time, price, size)
+
+    def completed_slices(self, symbol, date):
+        """
+        返回已落盘的切片 {(start_ns, end_ns)}
+        """
+        completed = set()
+        for path in glob.glob(os.path.join(self.slice_dir(symbol, date), "*.npz")):
+            start_ns, end_ns = os.path.basename(path)[:-len(".npz")].split("_")
+            completed.add((int(start_ns), int(end_ns)))
+        return completed
+
+    def finalize(self, symbol, date):
+        """
+        合并所有切片为完整交易日文件，并删除切片目录
+        切片之间没有重叠，按切片起点排序后拼接即为时间升序
+        """
+        slice_dir = self.slice_dir(symbol, date)
+        paths = sorted(glob.glob(os.path.join(slice_dir, "*.npz")),
+                       key=lambda p: int(os.path.basename(p).split("_")[0]))
+        columns = {name: [] for name in TICK_COLUMNS}
+        for path in paths:
+            with np.load(path) as data:
+                for name in TICK_COLUMNS:
+                    columns[name].append(data[name])
+
+        if paths:
+            self._save(self.day_path(symbol, date), *(np.concatenate(columns[name]) for name in TICK_COLUMNS))
+        else:
+            self._save(self.day_path(symbol, date), [], [], [])
+
+        for path in paths:
+            os.remove(path)
+        if os.path.isdir(slice_dir) and not os.listdir(slice_dir):
+            os.rmdir(slice_dir)
+
+    def read_arrays(self, symbol, date):
+        """
+        以 numpy 数组形式读取整日 tick，time 为 UTC 纳秒
+        """
+        with np.load(self.day_path(symbol, date)) as data:
+            return {name: data[name] for name in TICK_COLUMNS}
+
+    def read(self, symbol, date):
+        """
+        读取整日 tick，返回与 get_historical_ticks 相同格式的 DataFrame：time(美东时间) / price / size
+        """
+        arrays = self.read_arrays(symbol, date)
+        time = pd.to_datetime(arrays['time'], utc=True).tz_convert(self.eastern)
+        return pd.DataFrame({'time': time, 'price': arrays['price'], 'size': arrays['size']})
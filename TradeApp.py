@@ -1,10 +1,9 @@
-from ib_insync import *
 import pandas as pd
-import yaml
 from functools import partial
 from PositionManagerPlus import PositionManager
+from Profiler import Profiler
+from AppConfig import load_config
 import time
-from tqdm import tqdm # 进度条工具
 
 class TradeApp:
     """
@@ -27,11 +26,17 @@ class TradeApp:
         ta.subscribe_to_bars()
     """
     def __init__(self, config_file="config.yml", debug=False, host="127.0.0.1", port=7497, clientId=1, autoConnect=True, **kwargs):
-        self.ib = IB()
+        # ib_insync 在创建 app 时才导入，只做计算（策略、回测统计）的进程不需要加载
+        from ib_insync import IB, Stock
+        # ib: 可传入 FakeIB 等替身，在没有 TWS/Gateway 时跑实盘路径
+        self.ib = kwargs.get("ib") or IB()
         self.host = host
         self.port = port
         self.clientId = clientId
         
+        # profile=True 时统计每根 bar 各回调/环节的处理延迟，latency_budget_ms 为单根 bar 的处理预算
+        self.profiler = Profiler(kwargs.get("latency_budget_ms", 100)) if kwargs.get("profile", False) else None
+        
         self.connected = False
         if autoConnect:
             self.connect_to_ibkr()  # 尝试连接IBKR
@@ -39,8 +44,7 @@ class TradeApp:
             self.pm = PositionManager(self.ib, self.__class__.__name__, debug=debug, config_file=config_file)
             
         # 加载配置文件
-        with open(config_file, "r", encoding="utf-8") as file:
-            symbols = yaml.safe_load(file)["symbols"]
+        symbols = load_config(config_file)["symbols"]
         
         # 创建合约列表
         self.contracts = [Stock(symbol, 'SMART', 'USD', primaryExchange=exchange) for symbol, exchange in symbols]
@@ -79,6 +83,7 @@ class TradeApp:
         raise NotImplementedError("on_bar_update方法尚未实现")
 
     def subscribe_to_bars(self):
+        from tqdm import tqdm # 进度条工具
         try:
             for contract in tqdm(self.contracts, desc="合约行情订阅", unit="contract"):
                 bars = self.ib.reqHistoricalData(
@@ -91,7 +96,10 @@ class TradeApp:
                     keepUpToDate=True  # 保持订阅最新数据
                 )
                 
-                bars.updateEvent += partial(self.on_bar_update, contract)
+                if self.profiler:
+                    bars.updateEvent += partial(self.profiler.dispatch, [self.on_bar_update], contract)
+                else:
+                    bars.updateEvent += partial(self.on_bar_update, contract)
             print('Start Subcribe!')
             # 保持脚本运行，等待数据更新
             self.ib.run()
@@ -105,6 +113,7 @@ class TradeApp:
                 self.reconnect()
                 self.subscribe_to_bars()  # 重新订阅行情
         finally:
+            if self.profiler: self.profiler.report()
             self.pm.save()
             self.ib.disconnect()
 
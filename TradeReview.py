@@ -0,0 +1,72 @@
+import os
+import html
+from concurrent.futures import ProcessPoolExecutor
+
+def init_worker():
+    # 子进程只负责出图，不需要交互式后端
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+def render_trade_chart(task):
+    """
+    渲染单个 (交易日, 合约) 的交易图并保存
+
+    Args:
+        task (dict):
+            - bars: 当日分钟线 DataFrame
+            - trades: 当日该合约的交易记录（DataFrame）
+            - path: 输出文件路径
+            - title: 图表标题
+    """
+    import matplotlib.pyplot as plt
+    from PlotPlus import PlotPlus
+
+    pp = PlotPlus(task["bars"], ema_window=20)
+    pp.plot_basic(style_type="line")
+    pp.mark_bs_point(task["trades"])
+    fig = pp.axes[0].figure
+    fig.suptitle(task["title"])
+    fig.savefig(task["path"])
+    plt.close(fig)
+    return task["path"]
+
+def render_trade_charts(tasks, max_workers=None):
+    """
+    在进程池中并发渲染，返回输出路径列表（与 tasks 顺序一致）
+    """
+    if not tasks: return []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+        return list(executor.map(render_trade_chart, tasks))
+
+def write_index(output_dir, rows):
+    """
+    生成 index.html，每个交易日一行：日期、合约、盈亏、手续费和图表
+
+    Args:
+        rows (list of dict): date / symbol / pnl / commission / file
+    """
+    lines = [
+        "<!DOCTYPE html>",
+        "<html><head><meta charset='utf-8'><title>Trade Review</title>",
+        "<style>body{font-family:sans-serif} table{border-collapse:collapse} td,th{border:1px solid #ccc;padding:4px 8px} img{max-width:1000px}</style>",
+        "</head><body>",
+        "<h1>Trade Review</h1>",
+        "<table><tr><th>日期</th><th>合约</th><th>盈亏</th><th>手续费</th></tr>",
+    ]
+    for row in rows:
+        anchor = html.escape(f"{row['date']}_{row['symbol']}")
+        lines.append(
+            f"<tr><td><a href='#{anchor}'>{html.escape(str(row['date']))}</a></td><td>{html.escape(row['symbol'])}</td>"
+            f"<td>{row['pnl']:.2f}</td><td>{row['commission']:.2f}</td></tr>"
+        )
+    lines.append("</table>")
+    for row in rows:
+        anchor = html.escape(f"{row['date']}_{row['symbol']}")
+        lines.append(f"<h2 id='{anchor}'>{html.escape(str(row['date']))} {html.escape(row['symbol'])}</h2>")
+        lines.append(f"<img src='{html.escape(row['file'])}'>")
+    lines.append("</body></html>")
+
+    path = os.path.join(output_dir, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    return path
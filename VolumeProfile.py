@@ -0,0 +1,147 @@
+import numpy as np
+
+class VolumeProfile:
+    """
+    固定分箱大小的价格-成交量分布（Volume Profile）
+    直方图以 numpy 数组保存，可由 tick 或 bar 增量更新，价格超出当前范围时自动扩容。
+
+    查询：
+    - poc: 成交量最大的价格（Point of Control）
+    - value_area: 包含 value_area_pct 成交量、以 POC 为中心连续扩展的价格区间
+    - hvn / lvn: 高/低成交量节点（平滑后直方图的局部极大/极小）
+
+    e.g.
+    vp = VolumeProfile(bin_size=0.05)
+    vp.update_ticks(df_tick['price'], df_tick['volume'])
+    vp.update_bars(bars.iloc[-1:])
+    vp.poc, vp.value_area()
+    """
+    def __init__(self, bin_size=0.05, value_area_pct=0.7):
+        self.bin_size = bin_size
+        self.value_area_pct = value_area_pct
+        self.origin = None  # volume[0] 对应的分箱编号（price // bin_size）
+        self.volume = np.zeros(0)
+
+    def reset(self):
+        self.origin = None
+        self.volume = np.zeros(0)
+
+    def bin_index(self, price):
+        # 加上极小量，避免 100.05 / 0.05 这类浮点误差落到前一个分箱
+        return np.floor(np.asarray(price, dtype=np.float64) / self.bin_size + 1e-9).astype(np.int64)
+
+    def _ensure_range(self, low_bin, high_bin):
+        """
+        保证分箱 [low_bin, high_bin] 都在数组范围内，扩容时两侧各预留一倍空间以摊薄复制开销
+        """
+        if self.origin is None:
+            self.origin = low_bin
+            self.volume = np.zeros(high_bin - low_bin + 1)
+            return
+        end = self.origin + len(self.volume)
+        if low_bin >= self.origin and high_bin < end: return
+
+        slack = len(self.volume)
+        new_origin = min(self.origin, low_bin - slack) if low_bin < self.origin else self.origin
+        new_end = max(end, high_bin + 1 + slack) if high_bin >= end else end
+        volume = np.zeros(new_end - new_origin)
+        volume[self.origin - new_origin:self.origin - new_origin + len(self.volume)] = self.volume
+        self.origin, self.volume = new_origin, volume
+
+    def update_ticks(self, price, size):
+        """
+        按成交价把每笔 tick 的成交量计入对应分箱
+        """
+        price = np.asarray(price, dtype=np.float64)
+        if len(price) == 0: return
+        bins = self.bin_index(price)
+        self._ensure_range(bins.min(), bins.max())
+        self.volume += np.bincount(bins - self.origin, weights=np.asarray(size, dtype=np.float64), minlength=len(self.volume))
+
+    def update_bars(self, bars):
+        """
+        把每根 bar 的成交量平均分摊到 [low, high] 覆盖的分箱
+        通过差分数组一次性累加，不逐根循环
+        """
+        if len(bars) == 0: return
+        low_bins = self.bin_index(bars['low'])
+        high_bins = self.bin_index(bars['high'])
+        self._ensure_range(low_bins.min(), high_bins.max())
+
+        per_bin = np.asarray(bars['volume'], dtype=np.float64) / (high_bins - low_bins + 1)
+        diff = np.zeros(len(self.volume) + 1)
+        np.add.at(diff, low_bins - self.origin, per_bin)
+        np.add.at(diff, high_bins - self.origin + 1, -per_bin)
+        self.volume += np.cumsum(diff[:-1])
+
+    @property
+    def prices(self):
+        """
+        各分箱的中间价
+        """
+        if self.origin is None: return np.zeros(0)
+        return (np.arange(len(self.volume)) + self.origin + 0.5) * self.bin_size
+
+    @property
+    def total_volume(self):
+        return self.volume.sum()
+
+    @property
+    def poc(self):
+        if self.origin is None or self.total_volume == 0: return None
+        return self.prices[np.argmax(self.volume)]
+
+    def value_area(self, pct=None):
+        """
+        从 POC 开始，每次向成交量更大的一侧扩展一个分箱，直到覆盖 pct 的成交量
+        返回 (value_area_low, value_area_high)，为分箱边界价格
+        """
+        pct = self.value_area_pct if pct is None else pct
+        if self.origin is None or self.total_volume == 0: return None
+        target = self.total_volume * pct
+        low = high = int(np.argmax(self.volume))
+        covered = self.volume[low]
+        last = len(self.volume) - 1
+        while covered < target and (low > 0 or high < last):
+            below = self.volume[low - 1] if low > 0 else -1
+            above = self.volume[high + 1] if high < last else -1
+            if above >= below:
+                high += 1
+                covered += above
+            else:
+                low -= 1
+                covered += below
+        return (low + self.origin) * self.bin_size, (high + self.origin + 1) * self.bin_size
+
+    def _smoothed(self, window):
+        if window <= 1: return self.volume
+        kernel = np.ones(window) / window
+        return np.convolve(self.volume, kernel, mode='same')
+
+    def _traded(self, window):
+        """
+        平滑后的直方图及对应价格，只保留第一个到最后一个有成交的分箱，
+        _ensure_range 预留的空分箱不参与极值判断，否则成交区间外的第一个空箱会被当成 LVN
+        """
+        traded = np.flatnonzero(self.volume)
+        if len(traded) == 0: return np.zeros(0), np.zeros(0)
+        first, last = traded[0], traded[-1] + 1
+        return self._smoothed(window)[first:last], self.prices[first:last]
+
+    def hvn(self, window=3):
+        """
+        高成交量节点：平滑后直方图的局部极大值价格
+        """
+        smoothed, prices = self._traded(window)
+        if len(smoothed) < 3: return np.zeros(0)
+        is_peak = (smoothed[1:-1] > smoothed[:-2]) & (smoothed[1:-1] >= smoothed[2:])
+        return prices[1:-1][is_peak]
+
+    def lvn(self, window=3):
+        """
+        低成交量节点：平滑后直方图的局部极小值价格
+        """
+        smoothed, prices = self._traded(window)
+        if len(smoothed) < 3: return np.zeros(0)
+        is_trough = (smoothed[1:-1] < smoothed[:-2]) & (smoothed[1:-1] <= smoothed[2:])
+        return prices[1:-1][is_trough]
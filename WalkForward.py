@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from Sweep import score_summary
+from SharedBarStore import SharedBarStore
+
+_BAR_CACHE = None
+
+def init_worker(bar_cache):
+    # 子进程共用主进程预加载的 bar，不重复读取 redis
+    # bar_cache 为 SharedBarStore（默认）时只传递共享内存的名字和索引，worker 零拷贝挂载；
+    # 为普通 dict 时，spawn 启动方式（Windows / macOS 默认）下每个 worker 各 pickle 一份完整拷贝，
+    # 只有 fork 启动的 worker 才能直接继承主进程内存
+    global _BAR_CACHE
+    _BAR_CACHE = bar_cache
+
+def run_window(task):
+    """
+    用一组参数回测一段交易日，返回 (statistic, daily_net_liquidation)
+
+    Args:
+        task (dict):
+            - app_factory: params -> BacktestApp，需要可以 pickle（模块级函数或 functools.partial）
+            - params: 参数
+            - dates: 交易日列表
+            - risk_free_rate / pre_process_bar_callback / barSizeSetting
+    """
+    app = task["app_factory"](task["params"])
+    if _BAR_CACHE is not None:
+        app.bar_cache = _BAR_CACHE
+    for date in task["dates"]:
+        app.backtest_day(date, task["pre_process_bar_callback"], task["barSizeSetting"])
+    return app.statistic(task["risk_free_rate"]), app.daily_net_liquidation
+
+class WalkForward:
+    """
+    滚动样本内/样本外回测（walk-forward）
+
+    在交易日历上按 train_days / test_days 滑动窗口：
+    每个训练窗口在进程池中并行回测所有参数组合，按 metric 选出最优参数，
+    再用最优参数回测紧随其后的测试窗口；所有测试窗口的净资产曲线按收益率首尾拼接。
+
+    区间内的分钟线由 BacktestApp.preload_bars 一次性读入，传给所有子进程共用。
+    默认（shared_memory=True）放入 SharedBarStore，所有 worker 挂载同一块共享内存，内存占用不随 worker 数增长；
+    shared_memory=False 时直接传 dict，spawn 启动的每个 worker 都会收到一份 pickle 拷贝。
+
+    e.g.
+    wf = WalkForward(make_app, param_grid(['angle', 'dispear_angle'], [...]), "20250221", "200 D",
+                     train_days=60, test_days=20, pre_process_bar_callback=pre_process_bar_callback)
+    windows = wf.run()
+    wf.equity  # 拼接后的样本外净资产
+    """
+    def __init__(self, app_factory, params_list, end_date, durationStr='200 D', train_days=60, test_days=20,
+                 step_days=None, metric="sharpe_ratio", max_workers=None, risk_free_rate=0.035,
+                 pre_process_bar_callback=None, barSizeSetting='1 min', shared_memory=True):
+        if metric not in ("sharpe_ratio", "max_drawdown"):
+            raise ValueError(f"不支持的 metric: {metric}")
+        self.app_factory = app_factory
+        self.params_list = list(params_list)
+        self.end_date = end_date
+        self.durationStr = durationStr
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days or test_days
+        self.metric = metric
+        self.max_workers = max_workers
+        self.risk_free_rate = risk_free_rate
+        self.pre_process_bar_callback = pre_process_bar_callback
+        self.barSizeSetting = barSizeSetting
+        self.shared_memory = shared_memory
+
+        self.windows = []  # 每个窗口的训练/测试区间、最优参数和指标
+        self.equity = pd.DataFrame(columns=["date", "net_liquidation"])
+
+    def split_windows(self, dates):
+        """
+        返回 [(train_dates, test_dates), ...]
+        """
+        windows = []
+        start = 0
+        while start + self.train_days < len(dates):
+            train = dates[start:start + self.train_days]
+            test = dates[start + self.train_days:start + self.train_days + self.test_days]
+            windows.append((train, test))
+            start += self.step_days
+        return windows
+
+    def make_task(self, params, dates):
+        return {
+            "app_factory": self.app_factory,
+            "params": params,
+            "dates": dates,
+            "risk_free_rate": self.risk_free_rate,
+            "pre_process_bar_callback": self.pre_process_bar_callback,
+            "barSizeSetting": self.barSizeSetting,
+        }
+
+    def run(self):
+        loader = self.app_factory(self.params_list[0])
+        bar_cache = loader.preload_bars(self.end_date, self.durationStr, self.barSizeSetting)
+        dates = list(loader.minute_daily["date"])
+        initial_capital = loader.initial_capital
+
+        self.windows = []
+        segments = []
+        store = SharedBarStore.from_cache(bar_cache) if self.shared_memory else None
+        try:
+            self.run_windows(dates, store if store is not None else bar_cache, segments)
+        finally:
+            if store is not None: store.unlink()
+
+        self.equity = self.stitch(segments, initial_capital)
+        return pd.DataFrame(self.windows)
+
+    def run_windows(self, dates, bar_cache, segments):
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker, initargs=(bar_cache,)) as executor:
+            for train, test in self.split_windows(dates):
+                results = list(executor.map(run_window, [self.make_task(params, train) for params in self.params_list]))
+                scores = [score_summary(summary, self.metric) for summary, _ in results]
+                best = int(np.argmax(scores))
+                test_summary, test_net_liquidation = executor.submit(run_window, self.make_task(self.params_list[best], test)).result()
+
+                self.windows.append({
+                    "train_start": train[0],
+                    "train_end": train[-1],
+                    "test_start": test[0],
+                    "test_end": test[-1],
+                    "params": self.params_list[best],
+                    "train": results[best][0],
+                    "test": test_summary,
+                })
+                segments.append(test_net_liquidation)
+
+    @staticmethod
+    def stitch(segments, initial_capital):
+        """
+        各测试窗口都从 initial_capital 开始，按日收益率依次复利拼接成一条净资产曲线
+        """
+        dates, returns = [], []
+        for segment in segments:
+            if not segment: continue
+            net_liquidation = np.array([row["net_liquidation"] for row in segment], dtype=np.float64)
+            returns.append(net_liquidation / np.concatenate(([initial_capital], net_liquidation[:-1])))
+            dates.extend(row["date"] for row in segment)
+        if not returns:
+            return pd.DataFrame(columns=["date", "net_liquidation"])
+        return pd.DataFrame({
+            "date": dates,
+            "net_liquidation": initial_capital * np.cumprod(np.concatenate(returns)),
+        })
@@ -3,6 +3,7 @@ import pandas as pd
 from TradeApp import TradeApp
 from StructureReserve import StructureReserve
 from RBreak import RBreak
+from StrategyHost import BarFrame
 
 class StructureTradeApp(TradeApp):
     def on_bar_update(self, contract, bars, has_new_bar):
@@ -12,11 +13,17 @@ class StructureTradeApp(TradeApp):
             structure.update(contract, bars, self.pm)
             
 class RBreakTradeApp(TradeApp):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rbreaks = {}    # 每个合约常驻一个 RBreak，枢轴价位每日只算一次
+        self.bar_frames = {} # 每个合约的 bars 增量转换为 DataFrame
+        
     def on_bar_update(self, contract, bars, has_new_bar):
         if has_new_bar:
-            bars = pd.DataFrame(bars)
-            rbreak = RBreak(self.ib, contract, self.pm)
-            rbreak.update(bars)
+            bars = self.bar_frames.setdefault(contract.symbol, BarFrame()).update(bars)
+            if contract.symbol not in self.rbreaks:
+                self.rbreaks[contract.symbol] = RBreak(self.ib, contract, self.pm)
+            self.rbreaks[contract.symbol].update(bars)
             
 if __name__ == "__main__":            
     structure_ta = StructureTradeApp(port=7497)
@@ -0,0 +1,370 @@
+"""
+离线性能基准，数据来自 quotes/ 下的分钟线，不需要 IB 和 Redis
+
+e.g.
+python benchmark.py                               # 全部用例，结果写入 benchmark_results/
+python benchmark.py --only macd chandelier        # 只跑名字包含 macd / chandelier 的用例
+python benchmark.py --symbols 20 --days 252       # 合成 20 个合约、一年的数据放大规模
+python benchmark.py --compare benchmark_results/xxx.json  # 与之前的结果对比
+python benchmark.py --importtime BacktestApp      # 导入耗时最多的模块
+"""
+import os
+import io
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+QUOTES_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quotes", "*.csv")
+
+def load_fixtures(pattern=QUOTES_GLOB):
+    """
+    {文件名: 分钟线 DataFrame}，date 为 US/Eastern 时间
+    """
+    fixtures = {}
+    for path in sorted(glob.glob(pattern)):
+        df = pd.read_csv(path)
+        df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_convert('US/Eastern')
+        fixtures[os.path.splitext(os.path.basename(path))[0]] = df
+    return fixtures
+
+def synthetic_day(template, day, rng):
+    """
+    以 template 的分钟线为模板生成 day 当天的合成行情：
+    价格整体缩放，bar 内的 OHLC 相对收盘价保持不变，收盘价序列叠加随机扰动
+    """
+    df = template.copy()
+    noise = np.exp(np.cumsum(rng.normal(0, 0.0005, len(df))))
+    factor = rng.uniform(0.5, 2.0) * noise
+    for column in ['open', 'high', 'low', 'close', 'average']:
+        df[column] = df[column].to_numpy() * factor
+    df['high'] = df[['open', 'high', 'close']].max(axis=1)
+    df['low'] = df[['open', 'low', 'close']].min(axis=1)
+    df['volume'] = (df['volume'].to_numpy() * rng.uniform(0.5, 1.5, len(df))).round()
+    offset = pd.Timestamp(day).date() - df['date'].iloc[0].date()
+    df['date'] = (df['date'].dt.tz_localize(None) + offset).dt.tz_localize('US/Eastern')
+    return df
+
+def synthetic_market(fixtures, symbols=1, days=1, seed=0):
+    """
+    返回 (合约列表, 交易日列表, {(symbol, day): bars})
+    symbols/days 为 1 时直接使用第一个 fixture
+    """
+    rng = np.random.default_rng(seed)
+    templates = list(fixtures.values())
+    start = templates[0]['date'].iloc[0].date()
+    trading_days = list(pd.bdate_range(start, periods=days).date)
+    names = [f"SYM{i:04d}" for i in range(symbols)]
+    market = {}
+    for i, name in enumerate(names):
+        for j, day in enumerate(trading_days):
+            template = templates[(i + j) % len(templates)]
+            market[(name, day)] = template.copy() if symbols == 1 and days == 1 else synthetic_day(template, day, rng)
+    return names, trading_days, market
+
+def measure(run, repeat=5, warmup=1):
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        run()
+        samples.append(time.perf_counter_ns() - start)
+    samples = np.array(samples) / 1e6
+    return {
+        "repeat": repeat,
+        "mean_ms": float(samples.mean()),
+        "median_ms": float(np.median(samples)),
+        "min_ms": float(samples.min()),
+        "max_ms": float(samples.max()),
+    }
+
+class Contract:
+    """
+    只需要 symbol 的合约替身，避免基准依赖 ib_insync 的连接
+    """
+    def __init__(self, symbol):
+        self.symbol = symbol
+    def __eq__(self, other):
+        return getattr(other, "symbol", None) == self.symbol
+    def __hash__(self):
+        return hash(self.symbol)
+
+# ---------------------------------------------------------------- 用例
+# 每个用例接收 (names, days, market)，返回一个无参函数作为一次测量
+
+def case_macd(names, days, market):
+    from utils import macd
+    closes = [bars['close'] for bars in market.values()]
+    return lambda: [macd(close) for close in closes]
+
+def case_structure_cal(names, days, market):
+    from Structure import Structure
+    frames = list(market.values())
+    def run():
+        for bars in frames:
+            Structure().cal(bars.copy())
+    return run
+
+def case_structure_reserve_update(names, days, market):
+    """
+    与回测一致：每日先 prepare_data，再逐根 bar 新建 StructureReserve 并 update
+    """
+    from StructureReserve import StructureReserve
+    from PositionManagerPlus import PositionManager
+    prepared = {key: StructureReserve().prepare_data(bars.copy()) for key, bars in market.items()}
+    def run():
+        pm = PositionManager(None, "benchmark", debug=True)
+        for (symbol, day), bars in prepared.items():
+            contract = Contract(symbol)
+            for idx in range(30, len(bars) + 1):
+                structure = StructureReserve()
+                structure.data = bars[:idx]
+                structure.has_prepare_data = True
+                structure.update(contract, bars[:idx], pm)
+    return run
+
+def case_region_mark_region(names, days, market):
+    """
+    mark_region 的计算部分：上涨、下跌两个方向的 find_pulse_regions
+    （mark_region 末尾按 (start, end) 解包候选区间，与 score_candidates 返回的 dict 不匹配，这里不计入）
+    """
+    from Region import find_pulse_regions
+    frames = list(market.values())
+    def run():
+        for bars in frames:
+            find_pulse_regions(bars, direction=1, window=90, min_window=3)
+            find_pulse_regions(bars, direction=-1, window=90, min_window=3)
+    return run
+
+def case_trend_cal(names, days, market):
+    from Trend import Trend
+    frames = list(market.values())
+    return lambda: [Trend(1).cal(bars.copy()) for bars in frames]
+
+def case_chandelier_update(names, days, market):
+    from ChandelierExit import ChandelierExit
+    frames = list(market.values())
+    def run():
+        for bars in frames:
+            cdlr = ChandelierExit()
+            for _, row in bars.iterrows():
+                cdlr.update(row)
+    return run
+
+def case_scanner_step(names, days, market):
+    """
+    所有合约同一分钟的 bar 拼成一列，逐分钟 Scanner.step，每日开盘 reset_day
+    """
+    from Scanner import Scanner
+    sessions = []
+    for day in days:
+        frames = [market[(name, day)] for name in names if (name, day) in market]
+        if not frames: continue
+        length = min(len(bars) for bars in frames)
+        stack = {column: np.stack([bars[column].to_numpy()[:length] for bars in frames]) for column in ("close", "high", "low", "volume")}
+        sessions.append((frames[0]["date"].iloc[:length].tolist(), stack, len(frames)))
+    def run():
+        scanner = Scanner(names[:max(n for _, _, n in sessions)])
+        for dates, stack, n in sessions:
+            scanner.reset_day()
+            for i, date in enumerate(dates):
+                scanner.step(date, stack["close"][:, i], stack["high"][:, i], stack["low"][:, i], stack["volume"][:, i])
+    return run
+
+def case_robustness_analyze(names, days, market, resamples=10000, years=5):
+    """
+    5 年日收益率、1000 笔交易，交易置换和块自助法各 resamples 次
+    """
+    import Robustness
+    rng = np.random.default_rng(0)
+    net_liquidation = 1e6 * np.cumprod(1 + rng.normal(0.0005, 0.01, years * 252))
+    daily_net_liquidation = [{"date": i, "net_liquidation": value} for i, value in enumerate(net_liquidation)]
+    pnls = rng.normal(10, 100, 1000)
+    def run():
+        Robustness.permute_trades(pnls, 1e6, resamples, seed=0)
+        Robustness.block_bootstrap(Robustness.daily_returns(daily_net_liquidation), resamples, seed=0)
+    return run
+
+def case_position_manager_fills(names, days, market, rounds=500):
+    """
+    debug 模式下开仓/平仓各 rounds 次，所有合约轮流
+    """
+    from PositionManagerPlus import PositionManager
+    contracts = [Contract(name) for name in names]
+    bars = next(iter(market.values()))
+    last = bars.iloc[-1:]
+    def run():
+        pm = PositionManager(None, "benchmark", debug=True)
+        for i in range(rounds):
+            contract = contracts[i % len(contracts)]
+            pm.open_position(contract, "benchmark", 100, last)
+            position = pm.find_position(lambda item: item["contract"] == contract)
+            pm.close_position(position, last)
+    return run
+
+def case_minutes_backtest_day(names, days, market):
+    """
+    BacktestApp 完整回测所有交易日，bar 预先放入 bar_cache，不访问 Redis/IB
+    """
+    from BacktestApp import BacktestApp
+    from StructureReserve import StructureReserve
+    from utils import get_market_close_time
+
+    class StructureReserveBacktestApp(BacktestApp):
+        def on_bar_update(self, contract, bars, has_new_bar):
+            if has_new_bar:
+                structure = StructureReserve()
+                structure.data = bars
+                structure.has_prepare_data = True
+                structure.update(contract, bars, self.pm)
+
+    def pre_process_bar_callback(bars):
+        return StructureReserve().prepare_data(bars)
+
+    config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config_backtest.yml")
+    bar_cache = {
+        f"{symbol}_{get_market_close_time(day)}_1 D_1 min": bars
+        for (symbol, day), bars in market.items()
+    }
+    def run():
+        app = StructureReserveBacktestApp(config_file=config_file, debug=True)
+        app.contracts = [Contract(name) for name in names]
+        app.bar_cache = bar_cache
+        for day in days:
+            app.backtest_day(day, pre_process_bar_callback)
+    return run
+
+# 只做计算的模块：策略、回测统计。导入时不应加载 ib_insync / redis / matplotlib / talib 等
+COMPUTE_MODULES = ["Structure", "StructureReserve", "Region", "Trend", "PositionManagerPlus", "BacktestMetrics"]
+HEAVY_MODULES = ["ib_insync", "eventkit", "redis", "dill", "matplotlib", "mplfinance", "talib", "sklearn", "tqdm"]
+
+def import_command(modules, forbid_heavy=False):
+    statement = f"import {', '.join(modules)}"
+    if forbid_heavy:
+        statement += f"; import sys; heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]; assert not heavy, heavy"
+    return [sys.executable, "-c", statement]
+
+def import_profile(modules, top=15):
+    """
+    python -X importtime 的结果，按累计耗时返回前 top 个模块 [(模块, 累计毫秒)]
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((name.strip(), int(cumulative) / 1000))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+def case_import(modules, forbid_heavy=False):
+    """
+    新进程中导入 modules 的耗时（含解释器启动），相当于进程池 spawn 一个 worker 的导入成本；
+    forbid_heavy 为 True 时若加载了 HEAVY_MODULES 则报错
+    """
+    def case(names, days, market):
+        command = import_command(modules, forbid_heavy)
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        return lambda: subprocess.run(command, cwd=cwd, check=True, capture_output=True)
+    return case
+
+CASES = {
+    "import.python": case_import(["sys"]),
+    "import.compute": case_import(COMPUTE_MODULES, forbid_heavy=True),
+    "import.BacktestApp": case_import(["BacktestApp"]),
+    "utils.macd": case_macd,
+    "Structure.cal": case_structure_cal,
+    "StructureReserve.update": case_structure_reserve_update,
+    "Region.mark_region": case_region_mark_region,
+    "Trend.cal": case_trend_cal,
+    "ChandelierExit.update": case_chandelier_update,
+    "Scanner.step": case_scanner_step,
+    "Robustness.analyze": case_robustness_analyze,
+    "PositionManager.fills": case_position_manager_fills,
+    "BacktestApp.minutes_backtest_day": case_minutes_backtest_day,
+}
+
+# ---------------------------------------------------------------- 运行与输出
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def run_benchmarks(only=None, symbols=1, days=1, repeat=5, seed=0):
+    fixtures = load_fixtures()
+    names, trading_days, market = synthetic_market(fixtures, symbols, days, seed)
+    results = {}
+    for name, case in CASES.items():
+        if only and not any(keyword.lower() in name.lower() for keyword in only): continue
+        try:
+            # 策略和 PositionManager 会打印交易信息，测量时屏蔽输出
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = measure(case(names, trading_days, market), repeat=repeat)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(format_result(name, results[name]))
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "config": {"symbols": symbols, "days": days, "repeat": repeat, "seed": seed},
+        "results": results,
+    }
+
+def format_result(name, result, baseline=None):
+    if "error" in result:
+        return f"{name:<36} ERROR {result['error']}"
+    line = f"{name:<36} mean {result['mean_ms']:>10.2f}ms  min {result['min_ms']:>10.2f}ms"
+    if baseline and "mean_ms" in baseline:
+        line += f"  x{result['mean_ms'] / baseline['mean_ms']:.2f} vs baseline"
+    return line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="quotes/ 离线性能基准")
+    parser.add_argument("--only", nargs="*", help="只运行名字包含这些关键字的用例")
+    parser.add_argument("--symbols", type=int, default=1, help="合成合约数量")
+    parser.add_argument("--days", type=int, default=1, help="合成交易日数量")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results", help="结果 JSON 的输出目录")
+    parser.add_argument("--compare", help="对比的历史结果 JSON")
+    parser.add_argument("--importtime", nargs="+", metavar="MODULE", help="只输出导入这些模块时累计耗时最多的模块")
+    args = parser.parse_args(argv)
+
+    if args.importtime:
+        for name, ms in import_profile(args.importtime):
+            print(f"{name:<48} {ms:>8.1f}ms")
+        return
+
+    report = run_benchmarks(args.only, args.symbols, args.days, args.repeat, args.seed)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{report['timestamp'].replace(':', '')}_{report['commit'] or 'nogit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print(f"对比 {args.compare}:")
+        for name, result in report["results"].items():
+            print(format_result(name, result, baseline.get(name)))
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,4 +1,3 @@
-import talib
 import numpy as np
 import pandas as pd
 
@@ -20,7 +19,8 @@ def macd(close, fastperiod=12, slowperiod=26, signalperiod=9):
     - DEA: 信号线
     - MACD: 柱状图数据（一般是 DIF - DEA）
     """
-    # 使用 talib 计算 MACD
+    # 使用 talib 计算 MACD（首次调用时才导入，只用到日期工具的进程不加载 talib）
+    import talib
     dif, dea, macd = talib.MACD(close, fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod)
     
     # 如果 talib 计算的结果有空值，手动补全
@@ -38,6 +38,76 @@ def macd(close, fastperiod=12, slowperiod=26, signalperiod=9):
     # 返回计算结果
     return dif, dea, macd
 
+def rank_scale(values, n_quantiles=1000):
+    """
+    把序列按分位数映射到 [-1, 1]，等价于
+    2 * QuantileTransformer(output_distribution='uniform', n_quantiles=min(len, n_quantiles)).fit_transform(values) - 1
+
+    - 分位点取 np.nanpercentile(values, linspace(0, 100, n_quantiles))
+    - 正反两个方向插值后取平均，重复值得到的是中间的秩
+    - 样本数不超过 n_quantiles 时即为 (平均秩) / (n - 1)
+    NaN 保持为 NaN
+
+    参数：
+    - values: Series / ndarray
+    - n_quantiles: 分位点数量上限
+
+    返回：
+    - ndarray，取值范围 [-1, 1]
+    """
+    x = np.asarray(values, dtype=np.float64)
+    scaled = np.full(x.shape, np.nan)
+    finite = ~np.isnan(x)
+    if not finite.any(): return scaled
+
+    references = np.linspace(0, 1, max(min(len(x), n_quantiles), 1))
+    quantiles = np.maximum.accumulate(np.nanpercentile(x, references * 100))
+    x_finite = x[finite]
+    uniform = 0.5 * (np.interp(x_finite, quantiles, references)
+                     - np.interp(-x_finite, -quantiles[::-1], -references[::-1]))
+    uniform[x_finite == quantiles[-1]] = 1
+    uniform[x_finite == quantiles[0]] = 0
+    scaled[finite] = 2 * uniform - 1
+    return scaled
+
+def causal_rank_scale(values):
+    """
+    rank_scale 的因果版本：每根 bar 只和它之前（含自身）的数据比较，不使用未来数据
+    第 i 根 bar 的值为 2 * (平均秩) / i - 1，等于最小值时为 -1、等于最大值时为 1
+    没有重复值时与只用前 i + 1 根 bar 调用 rank_scale 的最后一个值一致（i + 1 <= 1000 时）；
+    有重复值时这里取重复值的中间秩，rank_scale（即 sklearn）的结果取决于插值时落在重复区间的哪一端，两者可能相差几个百分点
+    NaN 不计入排序，结果为 NaN
+
+    已出现的数据按值的序号记在树状数组（Fenwick tree）里，每根 bar O(log n)
+
+    返回：
+    - ndarray，取值范围 [-1, 1]
+    """
+    x = np.asarray(values, dtype=np.float64)
+    scaled = np.full(x.shape, np.nan)
+    finite = ~np.isnan(x)
+    uniques, codes = np.unique(x[finite], return_inverse=True)
+    tree = [0] * (len(uniques) + 1) # 树状数组，下标从 1 开始
+    counts = [0] * len(uniques)     # 每个值已出现的次数
+    n = 0
+    for i, code in zip(np.flatnonzero(finite), codes.tolist()):
+        # 小于该值的已出现数量
+        left, j = 0, code
+        while j > 0:
+            left += tree[j]
+            j -= j & -j
+        right = left + counts[code] # 插入前与该值相等的区间为 [left, right)
+        j = code + 1
+        while j <= len(uniques):
+            tree[j] += 1
+            j += j & -j
+        counts[code] += 1
+        n += 1
+        if left == 0: scaled[i] = -1.0
+        elif right == n - 1: scaled[i] = 1.0
+        else: scaled[i] = 2 * ((left + right) / 2) / (n - 1) - 1
+    return scaled
+
 def vwap(close, volume):
     price_volume = close * volume
 
@@ -94,6 +164,12 @@ def normalized_time(date=None):
         
     return date
 
+def to_ns(date):
+    """
+    将带时区的时间转换为 UTC 纳秒时间戳
+    """
+    return pd.Timestamp(date).value
+
 def get_market_close_time(date=None):
     """
     获取指定日期的美股市场收盘时间（东部时间 16:00）。